@@ -1,17 +1,20 @@
-import cv2
+import os
+import time
+
 import streamlit as st
-import numpy as np
-import hashlib
-from PIL import Image
 from dotenv import load_dotenv
 from datetime import datetime
 
-from core.detector import FaceDetector
-from core.embedder import FaceEmbedder
-from core.matcher import FaceMatcher
-from core.langgraph_agent import LangGraphAttendanceAgent
+from core.jobs import JobQueue
+from core.model_loader import STEPS, get_loader
+from core.decision_ledger import DecisionLedger
+from core.recognition_cache import RecognitionCache
 from database.supabase_db import SupabaseDB
 
+# cv2, insightface, faiss and the agent's langgraph/groq are imported where
+# they are used (or by the background model loader), so the login page
+# renders without waiting for them.
+
 load_dotenv()
 
 st.set_page_config(
@@ -217,6 +220,9 @@ _DEFAULTS = {
     "embedder": None,
     "matcher": None,
     "agent": None,
+    "recognition_cache": None,
+    "decision_ledger": None,
+    "job_queue": None,
     "student_lookup": {},
     "agent_results": [],
     "agent_session_id": None,
@@ -225,6 +231,9 @@ _DEFAULTS = {
     "last_lecture_summary": None,
     "result_image": None,
     "current_page": "Dashboard",
+    "bulk_enroll_summary": None,
+    "bulk_enroll_job": None,
+    "duplicate_audit": None,
 }
 
 for _k, _v in _DEFAULTS.items():
@@ -295,6 +304,8 @@ def login_page():
                             else:
                                 st.session_state.admin_user = user
                                 st.session_state.organization = org
+                                # Models load while the dashboard renders.
+                                get_loader().start()
                                 st.rerun()
 
         with tab_reg:
@@ -351,55 +362,74 @@ def login_page():
 
 # ── Initialize AI models ───────────────────────────────────────────────────────
 def initialize_models():
+    """Attach the background-loaded models to this session once they are ready."""
+    loader = get_loader().start()
+
+    if st.session_state.recognition_cache is None:
+        st.session_state.recognition_cache = RecognitionCache()
+
+    if st.session_state.decision_ledger is None:
+        st.session_state.decision_ledger = DecisionLedger()
+
+    if st.session_state.job_queue is None:
+        st.session_state.job_queue = JobQueue(
+            max_workers=int(os.getenv("RECOGNITION_WORKERS", "2"))
+        )
+
+    if not loader.ready:
+        return False
+
     if st.session_state.detector is None:
-        with st.spinner("Loading face detection models…"):
-            st.session_state.detector = FaceDetector()
-            st.session_state.embedder = FaceEmbedder()
+        st.session_state.detector = loader.detector
+        st.session_state.embedder = loader.embedder
 
     if st.session_state.agent is None:
+        from core.langgraph_agent import LangGraphAttendanceAgent
+
         st.session_state.agent = LangGraphAttendanceAgent()
 
     if st.session_state.matcher is None:
-        st.session_state.matcher = FaceMatcher()
+        from core.matcher import FaceMatcher
+
+        st.session_state.matcher = FaceMatcher(dim=st.session_state.embedder.embedding_dim)
 
     if not st.session_state.student_lookup:
-        embeddings = st.session_state.db.get_student_embeddings(
-            st.session_state.organization["id"]
+        from core.templates import load_gallery
+
+        gallery = load_gallery(
+            st.session_state.db,
+            st.session_state.organization["id"],
+            dim=st.session_state.embedder.embedding_dim,
+            model=st.session_state.embedder.model_id,
         )
-        for student_id, name, emb in embeddings:
+        known = set(st.session_state.matcher.student_ids)
+        new_rows = [row for row in gallery if row[0] not in known]
+        for student_id, name, _ in gallery:
             st.session_state.student_lookup[student_id] = name
-            if student_id not in st.session_state.matcher.student_ids:
-                st.session_state.matcher.add_embedding(emb, student_id)
+        if new_rows:
+            st.session_state.matcher.add_embeddings(
+                [emb for _, _, emb in new_rows], [sid for sid, _, _ in new_rows]
+            )
+    return True
 
 
-# ── Utility functions ──────────────────────────────────────────────────────────
-def compute_face_quality(image_bgr, box):
-    x1, y1, x2, y2 = map(int, box)
-    h, w = image_bgr.shape[:2]
-    x1 = max(0, min(w - 1, x1))
-    y1 = max(0, min(h - 1, y1))
-    x2 = max(0, min(w, x2))
-    y2 = max(0, min(h, y2))
-    if x2 <= x1 or y2 <= y1:
-        return 0.3
-    crop = image_bgr[y1:y2, x1:x2]
-    if crop.size == 0:
-        return 0.3
-    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
-    brightness = np.clip(np.mean(gray) / 255.0, 0.0, 1.0)
-    sharpness = np.clip(cv2.Laplacian(gray, cv2.CV_64F).var() / 180.0, 0.0, 1.0)
-    size_ratio = ((x2 - x1) * (y2 - y1)) / float(h * w)
-    size_score = np.clip(size_ratio / 0.07, 0.0, 1.0)
-    return float(np.clip(0.45 * sharpness + 0.35 * brightness + 0.20 * size_score, 0.0, 1.0))
-
-
-def make_face_signature(embedding):
-    if embedding is None:
-        return None
-    sig = np.round(embedding[:16], 2).astype(np.float32).tobytes()
-    return hashlib.md5(sig).hexdigest()
+def models_ready():
+    return st.session_state.detector is not None and st.session_state.matcher is not None
+
 
+def render_model_status():
+    """Readiness notice for pages that need the face models."""
+    status = get_loader().status()
+    if status["state"] == "failed":
+        st.error(f"Face models failed to load: {status['error']}")
+    elif status["state"] != "ready" or not models_ready():
+        done = [step for step in STEPS if step in status["seconds"]]
+        step = status["step"] or "starting"
+        st.info(f"⏳ Loading face models — {step} ({len(done)}/{len(STEPS)} steps done). "
+                "You can fill in the form meanwhile.")
 
+
+# ── Utility functions ──────────────────────────────────────────────────────────
 def build_review_queue(agent_results, session_id):
     queue = []
     flagged_actions = {
@@ -438,13 +468,14 @@ def apply_review_action(queue_item, action, override_value=None):
             result["override_value"] = override_value
 
 
-def start_lecture_session(title, subject=None, location=None):
+def start_lecture_session(title, subject=None, location=None, course_code=None):
     now = datetime.now()
     lecture = st.session_state.db.create_lecture(
         organization_id=st.session_state.organization["id"],
         created_by=st.session_state.admin_user["id"],
         title=title,
         subject=subject,
+        course_code=course_code,
         lecture_date=now.date(),
         start_time=now.time(),
         location=location,
@@ -460,6 +491,13 @@ def start_lecture_session(title, subject=None, location=None):
         "title": lecture.get("title", title),
         "subject": lecture.get("subject", subject),
         "location": lecture.get("location", location),
+        "course_code": course_code,
+        # Student uuids on the course roster; empty means search the whole organization.
+        "roster": (
+            st.session_state.db.get_course_roster(st.session_state.organization["id"], course_code)
+            if course_code
+            else set()
+        ),
         "started_at": now,
         "processed_images": 0,
         "faces_processed": 0,
@@ -486,6 +524,11 @@ def end_lecture_session():
         db_stats = st.session_state.db.get_attendance_stats(lecture["id"]) or {}
     except Exception:
         pass
+    agent_summary = {}
+    if st.session_state.agent and st.session_state.agent_session_id:
+        agent_summary = st.session_state.agent.end_session(
+            st.session_state.agent_session_id
+        )
     summary = {
         "lecture_id": lecture["id"],
         "title": lecture.get("title"),
@@ -497,16 +540,172 @@ def end_lecture_session():
         "flagged_faces": lecture.get("flagged_faces", 0),
         "unknown_faces": lecture.get("unknown_faces", 0),
         "db_attendance_stats": db_stats,
+        "agent_summary": agent_summary.get("summary", {}),
         "resolved_reviews": len(
             [x for x in st.session_state.review_queue if x.get("status") == "resolved"]
         ),
     }
     st.session_state.last_lecture_summary = summary
+    if st.session_state.job_queue is not None:
+        st.session_state.job_queue.cancel_lecture(lecture["id"])
+    if st.session_state.recognition_cache is not None:
+        # Cached analyses are keyed by the agent session, which the recognize
+        # page can set apart from the lecture id.
+        cache = st.session_state.recognition_cache
+        for session_id in {lecture["id"], st.session_state.agent_session_id} - {None}:
+            cache.drop_session(session_id)
+    if st.session_state.decision_ledger is not None:
+        st.session_state.decision_ledger.drop_lecture(lecture["id"])
     st.session_state.current_lecture = None
     st.session_state.agent_session_id = None
     return summary
 
 
+# ── Background recognition jobs ───────────────────────────────────────────────
+JOB_POLL_SECONDS = 1.0
+
+
+def lecture_matcher(threshold):
+    """The matcher for the current lecture: its course roster when it has one."""
+    lecture = st.session_state.current_lecture
+    if not lecture or not lecture.get("roster"):
+        return st.session_state.matcher
+    fallback = threshold if st.session_state.get("roster_fallback", True) else None
+    return st.session_state.matcher.for_roster(lecture["roster"], fallback_below=fallback)
+
+
+def submit_recognition_job(photos, label, threshold, class_start_offset,
+                           enable_agent, fusion="max"):
+    from core.pipeline import run_recognition
+
+    lecture = st.session_state.current_lecture
+    return st.session_state.job_queue.submit(
+        run_recognition,
+        photos,
+        kind="recognize",
+        lecture_id=lecture["id"],
+        label=label,
+        detector=st.session_state.detector,
+        embedder=st.session_state.embedder,
+        matcher=lecture_matcher(threshold),
+        agent=st.session_state.agent,
+        db=st.session_state.db,
+        cache=st.session_state.recognition_cache,
+        ledger=st.session_state.decision_ledger,
+        session_id=st.session_state.agent_session_id,
+        marked_by=st.session_state.admin_user["id"],
+        organization_id=st.session_state.organization["id"],
+        student_lookup=dict(st.session_state.student_lookup),
+        threshold=threshold,
+        class_start_time=lecture["started_at"],
+        class_start_offset=class_start_offset,
+        enable_agent=enable_agent,
+        fusion=fusion,
+    )
+
+
+def submit_stream_job(source, threshold, enable_agent, every_n, max_seconds):
+    from core.video import run_stream
+
+    lecture = st.session_state.current_lecture
+    return st.session_state.job_queue.submit(
+        run_stream,
+        source,
+        kind="stream",
+        lecture_id=lecture["id"],
+        label=f"Stream: {source}",
+        detector=st.session_state.detector,
+        embedder=st.session_state.embedder,
+        matcher=lecture_matcher(threshold),
+        agent=st.session_state.agent,
+        db=st.session_state.db,
+        ledger=st.session_state.decision_ledger,
+        session_id=st.session_state.agent_session_id,
+        marked_by=st.session_state.admin_user["id"],
+        organization_id=st.session_state.organization["id"],
+        student_lookup=dict(st.session_state.student_lookup),
+        threshold=threshold,
+        class_start_time=lecture["started_at"],
+        enable_agent=enable_agent,
+        every_n=every_n,
+        max_seconds=max_seconds,
+    )
+
+
+def collect_finished_jobs():
+    queue = st.session_state.job_queue
+    lecture = st.session_state.current_lecture
+    if queue is None or lecture is None:
+        return
+    for job in queue.jobs(lecture["id"]):
+        if not job.done or job.attached:
+            continue
+        job.attached = True
+        result = job.result or {}
+        if job.status != "done" or not result.get("faces"):
+            continue
+        face_decisions = result["face_decisions"]
+        if result.get("annotated"):
+            st.session_state.result_image = result["annotated"]
+        st.session_state.agent_results = face_decisions
+        st.session_state.review_queue.extend(
+            build_review_queue(face_decisions, f"{st.session_state.agent_session_id}_{job.id}")
+        )
+        # Count students, not sightings, so repeated photos don't inflate the tally.
+        recognized_ids = lecture.setdefault("recognized_ids", set())
+        recognized_ids.update(result["present_ids"])
+        lecture["processed_images"] += result["photos"]
+        lecture["faces_processed"] += result["faces_detected"]
+        lecture["recognized_faces"] = len(recognized_ids)
+        lecture["flagged_faces"] += result["flagged"]
+        lecture["unknown_faces"] += result["unknown"]
+
+
+def render_job_panel():
+    queue = st.session_state.job_queue
+    lecture = st.session_state.current_lecture
+    if queue is None or lecture is None:
+        return
+    jobs = queue.jobs(lecture["id"])[-8:]
+    if not jobs:
+        return
+    st.markdown("### Jobs")
+    for job in reversed(jobs):
+        info = job.to_dict()
+        with st.container(border=True):
+            j1, j2 = st.columns([3, 1])
+            with j1:
+                st.markdown(f"**{info['label'] or info['id']}** &nbsp; `{info['status']}`")
+                if not job.done:
+                    st.progress(info["progress"], f"{info['stage'] or 'queued'} · {info['message']}")
+                elif info["status"] == "failed":
+                    st.caption(f"Failed: {info['error']}")
+                elif info["status"] == "done":
+                    result = job.result or {}
+                    st.caption(
+                        result.get("message")
+                        or f"{result.get('faces', 0)} faces · {result.get('recognized', 0)} marked · "
+                        f"{result.get('flagged', 0)} flagged"
+                        + (
+                            f" · {result['gated']} below quality floors"
+                            if result.get("gated")
+                            else ""
+                        )
+                    )
+                    if result.get("stage_stats"):
+                        st.caption(
+                            "Stage utilization: "
+                            + " · ".join(
+                                f"{name} {s['utilization']:.0%} ×{s['workers']}"
+                                for name, s in result["stage_stats"].items()
+                            )
+                        )
+            with j2:
+                if not job.done and st.button("Cancel", key=f"job_cancel_{job.id}", width="stretch"):
+                    queue.cancel(job.id)
+                    st.rerun()
+
+
 # ── Dashboard page ─────────────────────────────────────────────────────────────
 def dashboard_page():
     st.markdown("## Dashboard")
@@ -628,10 +827,16 @@ def dashboard_page():
 
 
 # ── Enroll page ────────────────────────────────────────────────────────────────
+# Enrollment photos hold one face; a 12 MP original adds nothing but decode time.
+ENROLL_MAX_SIDE = 1600
+ENROLL_CLIP_TYPES = (".mp4", ".mov", ".avi", ".webm")
+
+
 def enroll_page():
     st.markdown("## Enroll Student")
     st.markdown("Add a new student and register their face with the AI system.")
     st.divider()
+    render_model_status()
 
     col_form, col_preview = st.columns([1, 1], gap="large")
 
@@ -642,74 +847,308 @@ def enroll_page():
             "Student ID (Optional)", placeholder="Auto-generated if blank"
         )
 
-        st.markdown("### Upload Photo")
-        uploaded_file = st.file_uploader(
-            "Clear photo — one face only",
-            type=["jpg", "jpeg", "png"],
+        st.markdown("### Upload Photos")
+        uploaded_files = st.file_uploader(
+            "Clear photos — one face only. Several photos or a short clip "
+            "(turning the head slightly) give more reliable recognition.",
+            type=["jpg", "jpeg", "png"] + [ext.lstrip(".") for ext in ENROLL_CLIP_TYPES],
+            accept_multiple_files=True,
+        ) or []
+        uploaded_file = next(
+            (f for f in uploaded_files if not f.name.lower().endswith(ENROLL_CLIP_TYPES)), None
+        )
+
+        allow_duplicate = st.checkbox(
+            "Enroll even if the face matches an enrolled student",
+            help="Only for genuinely different people, e.g. twins.",
         )
 
         st.markdown("<div style='height:0.5rem'></div>", unsafe_allow_html=True)
-        if st.button("Enroll Student", type="primary", width="stretch"):
-            if not uploaded_file:
+        if st.button("Enroll Student", type="primary", width="stretch", disabled=not models_ready()):
+            from core.dedupe import enrollment_conflicts
+            from core.image_io import decode_image
+            from core.templates import centroid, clip_frames, extract_templates, template_mode
+
+            if not uploaded_files:
                 st.error("Please upload a photo.")
             elif not name:
                 st.error("Please enter the student's name.")
             else:
-                image = Image.open(uploaded_file)
-                image_np = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-
-                bar = st.progress(0, "Detecting face…")
-                boxes, probs, landmarks = st.session_state.detector.detect_faces(image_np)
+                images, single_face = [], []
+                for f in uploaded_files:
+                    if f.name.lower().endswith(ENROLL_CLIP_TYPES):
+                        # Clip frames may catch someone behind the student; use the largest face.
+                        frames = clip_frames(f.getvalue(), suffix="." + f.name.rsplit(".", 1)[-1])
+                        images.extend(frames)
+                        single_face.extend([False] * len(frames))
+                    else:
+                        images.append(decode_image(f.getvalue(), max_side=ENROLL_MAX_SIDE))
+                        single_face.append(True)
+
+                bar = st.progress(0, "Detecting faces…")
+                templates, rejected = extract_templates(
+                    images,
+                    st.session_state.detector,
+                    st.session_state.embedder,
+                    single_face=single_face,
+                )
 
-                if len(boxes) == 0:
-                    st.error("No face detected. Use a clear, well-lit photo.")
-                    bar.empty()
-                elif len(boxes) > 1:
-                    st.error(f"{len(boxes)} faces detected — upload a solo photo.")
+                if not templates:
                     bar.empty()
+                    reasons = sorted({reason for _, reason in rejected})
+                    st.error(
+                        "No usable face found. Use clear, well-lit solo photos"
+                        + (f" ({'; '.join(reasons)})." if reasons else ".")
+                    )
                 else:
-                    bar.progress(50, "Extracting face embedding…")
-                    emb = st.session_state.embedder.get_embedding(
-                        image_np, bbox=boxes[0], landmark=landmarks[0]
+                    bar.progress(80, "Saving to database…")
+                    emb = centroid(
+                        [t["embedding"] for t in templates], [t["quality"] for t in templates]
+                    )
+                    student_id = (
+                        student_id_input.upper()
+                        if student_id_input
+                        else name.replace(" ", "_").upper()
                     )
-                    if emb is None:
-                        st.error("Could not process face. Try another photo.")
+                    existing_student = st.session_state.db.get_student_by_org_and_student_id(
+                        st.session_state.organization["id"],
+                        student_id,
+                    )
+                    if existing_student:
                         bar.empty()
-                    else:
-                        bar.progress(80, "Saving to database…")
-                        student_id = (
-                            student_id_input.upper()
-                            if student_id_input
-                            else name.replace(" ", "_").upper()
+                        st.error(
+                            f"Student ID '{student_id}' already exists in this organization. "
+                            "Use a different Student ID."
                         )
-                        existing_student = st.session_state.db.get_student_by_org_and_student_id(
-                            st.session_state.organization["id"],
-                            student_id,
+                        st.stop()
+
+                    conflicts = enrollment_conflicts(
+                        st.session_state.matcher, [t["embedding"] for t in templates]
+                    )
+                    if conflicts and not allow_duplicate:
+                        bar.empty()
+                        st.error(
+                            "This face matches an enrolled student: "
+                            + ", ".join(
+                                f"{st.session_state.student_lookup.get(c['student_id'], c['student_id'])}"
+                                f" ({c['score']:.2f})"
+                                for c in conflicts
+                            )
+                            + ". Check they are not already enrolled, or tick the box to enroll anyway."
                         )
-                        if existing_student:
-                            bar.empty()
-                            st.error(
-                                f"Student ID '{student_id}' already exists in this organization. "
-                                "Use a different Student ID."
+                        st.stop()
+
+                    import cv2
+
+                    from core.photo_store import get_photo_store
+
+                    student = st.session_state.db.enroll_student(
+                        organization_id=st.session_state.organization["id"],
+                        student_id=student_id,
+                        name=name,
+                        embedding=emb,
+                        embedding_model=st.session_state.embedder.model_id,
+                    )
+                    bar.progress(100, "Done!")
+                    bar.empty()
+
+                    if student:
+                        # Keep the source photo so the gallery can be re-embedded when
+                        # the recognition model changes (core.reembed). Saved only once
+                        # the ID is ours: the store overwrites by student ID. A clip-only
+                        # enrollment keeps the frame its template came from.
+                        if uploaded_file is not None:
+                            photo, ext = uploaded_file.getvalue(), uploaded_file.name.rsplit(".", 1)[-1].lower()
+                        else:
+                            ok, jpeg = cv2.imencode(".jpg", images[templates[0]["source"]])
+                            photo, ext = (jpeg.tobytes() if ok else None), "jpg"
+                        if photo is not None:
+                            photo_url = get_photo_store(st.session_state.db).save(
+                                st.session_state.organization["id"], student_id, photo, ext=ext
                             )
-                            st.stop()
+                            st.session_state.db.update_student(student["id"], photo_url=photo_url)
+                        if len(templates) > 1:
+                            # Every template keeps its source frame, so core.reembed can
+                            # re-embed them and re-derive the centroid on a model change.
+                            for i, t in enumerate(templates):
+                                ok, jpeg = cv2.imencode(".jpg", images[t["source"]])
+                                if ok:
+                                    t["photo_url"] = get_photo_store(st.session_state.db).save(
+                                        st.session_state.organization["id"],
+                                        f"{student_id}_t{i}",
+                                        jpeg.tobytes(),
+                                    )
+                            st.session_state.db.add_student_templates(
+                                st.session_state.organization["id"],
+                                student["id"],
+                                templates,
+                                embedding_model=st.session_state.embedder.model_id,
+                            )
+                        # The gallery and lookup are keyed by the row's uuid, like
+                        # everything loaded through get_student_embeddings.
+                        if template_mode() == "all" and len(templates) > 1:
+                            st.session_state.matcher.add_embeddings(
+                                [t["embedding"] for t in templates], [student["id"]] * len(templates)
+                            )
+                        else:
+                            st.session_state.matcher.add_embedding(emb, student["id"])
+                        st.session_state.student_lookup[student["id"]] = student["name"]
+                        st.success(
+                            f"✅ {name} enrolled (ID: {student_id}) from "
+                            f"{len(templates)} template(s)"
+                            + (f"; {len(rejected)} image(s) skipped" if rejected else "")
+                        )
+                        st.balloons()
+                    else:
+                        st.error("Enrollment failed — ID may already exist.")
 
-                        student = st.session_state.db.enroll_student(
-                            organization_id=st.session_state.organization["id"],
-                            student_id=student_id,
-                            name=name,
-                            embedding=emb,
+        st.markdown("<div style='height:1rem'></div>", unsafe_allow_html=True)
+        with st.expander("Bulk enrollment from a roster"):
+            st.caption(
+                "A CSV with a `name` column (`student_id`, `photo`, `email`, `phone`, "
+                "`department`, `enrollment_year` optional) and a zip of photos named "
+                "after each student ID or listed in the `photo` column."
+            )
+            roster_file = st.file_uploader("Roster CSV", type=["csv"], key="bulk_roster")
+            photos_zip = st.file_uploader("Photos (zip)", type=["zip"], key="bulk_photos")
+            bulk_allow_duplicates = st.checkbox(
+                "Enroll faces that match an enrolled student or another roster row",
+                key="bulk_allow_duplicates",
+            )
+            queue = st.session_state.job_queue
+            bulk_job = queue.get(st.session_state.bulk_enroll_job) if st.session_state.bulk_enroll_job else None
+            if st.button(
+                "Enroll roster",
+                width="stretch",
+                disabled=not (roster_file and photos_zip and models_ready())
+                or (bulk_job is not None and not bulk_job.done),
+                key="bulk_btn",
+            ):
+                from core.bulk_enroll import run_enroll_roster
+                from core.photo_store import get_photo_store
+
+                # Runs on the job queue like recognition; this page polls it.
+                st.session_state.bulk_enroll_summary = None
+                st.session_state.bulk_enroll_job = queue.submit(
+                    run_enroll_roster,
+                    roster_file.getvalue().decode("utf-8-sig"),
+                    photos_zip.getvalue(),
+                    kind="enroll",
+                    label=f"Roster: {roster_file.name}",
+                    db=st.session_state.db,
+                    detector=st.session_state.detector,
+                    embedder=st.session_state.embedder,
+                    matcher=st.session_state.matcher,
+                    organization_id=st.session_state.organization["id"],
+                    photo_store=get_photo_store(st.session_state.db),
+                    workers=os.cpu_count() or 1,
+                    allow_duplicates=bulk_allow_duplicates,
+                )
+                st.rerun()
+
+            if bulk_job is not None and not bulk_job.attached:
+                info = bulk_job.to_dict()
+                if not bulk_job.done:
+                    b1, b2 = st.columns([3, 1])
+                    b1.progress(info["progress"], info["message"] or "Queued…")
+                    if b2.button("Cancel", key="bulk_cancel", width="stretch"):
+                        queue.cancel(bulk_job.id)
+                        st.rerun()
+                else:
+                    bulk_job.attached = True
+                    if info["status"] == "done":
+                        st.session_state.bulk_enroll_summary = bulk_job.result
+                        for row in bulk_job.result["report"]:
+                            if row["status"] == "enrolled":
+                                st.session_state.student_lookup[row["uuid"]] = row["name"]
+                    elif info["status"] == "failed":
+                        st.error(f"Bulk enrollment failed: {info['error']}")
+                    else:
+                        st.warning(
+                            "Bulk enrollment cancelled; students from chunks already written "
+                            "are enrolled and appear after the next sign-in."
                         )
-                        bar.progress(100, "Done!")
-                        bar.empty()
 
-                        if student:
-                            st.session_state.matcher.add_embedding(emb, student_id)
-                            st.session_state.student_lookup[student["student_id"]] = student["name"]
-                            st.success(f"✅ {name} enrolled (ID: {student_id})")
-                            st.balloons()
-                        else:
-                            st.error("Enrollment failed — ID may already exist.")
+            summary = st.session_state.bulk_enroll_summary
+            if summary:
+                from core.bulk_enroll import report_csv
+
+                st.success(f"{summary['enrolled']} of {summary['rows']} student(s) enrolled.")
+                failed = [r for r in summary["report"] if r["status"] == "failed"]
+                if failed:
+                    st.warning(f"{len(failed)} row(s) failed.")
+                    st.dataframe(failed, hide_index=True)
+                st.download_button(
+                    "Download report",
+                    report_csv(summary["report"]),
+                    file_name="enrollment_report.csv",
+                    mime="text/csv",
+                    key="bulk_report",
+                )
+
+        with st.expander("Course rosters"):
+            st.caption(
+                "List the student IDs attending a course. Lectures started with that "
+                "course code match faces against its roster first."
+            )
+            roster_course = st.text_input("Course code", key="roster_course").strip().upper()
+            org_id = st.session_state.organization["id"]
+            current = (
+                st.session_state.db.get_course_roster(org_id, roster_course) if roster_course else set()
+            )
+            if roster_course:
+                st.caption(f"{len(current)} student(s) on the {roster_course} roster.")
+            roster_ids = st.text_area(
+                "Student IDs (one per line or comma-separated)", key="roster_ids", height=120
+            )
+            if st.button("Save roster", width="stretch", disabled=not roster_course, key="roster_btn"):
+                codes = {c.strip().upper() for c in roster_ids.replace(",", "\n").splitlines() if c.strip()}
+                by_code = {
+                    s["student_id"]: s["id"]
+                    for s in st.session_state.db.get_students_by_organization(org_id, active_only=True)
+                }
+                missing = sorted(codes - set(by_code))
+                saved = st.session_state.db.set_course_roster(
+                    org_id, roster_course, [by_code[c] for c in codes if c in by_code]
+                )
+                st.success(f"{saved} student(s) on the {roster_course} roster.")
+                if missing:
+                    st.warning(f"Not enrolled: {', '.join(missing)}")
+
+        with st.expander("Duplicate identity audit"):
+            st.caption(
+                "Compares every enrolled face with every other one and lists students "
+                "who are probably the same person enrolled twice."
+            )
+            from core.dedupe import duplicate_threshold
+
+            audit_threshold = st.slider(
+                "Similarity threshold", 0.3, 0.95, duplicate_threshold(), 0.05, key="audit_threshold"
+            )
+            if st.button("Run audit", width="stretch", disabled=not models_ready(), key="audit_btn"):
+                from core.dedupe import describe, duplicate_pairs
+
+                with st.spinner("Comparing faces…"):
+                    ids, vectors = st.session_state.matcher.vectors()
+                    students = {
+                        s["id"]: s
+                        for s in st.session_state.db.get_students_by_organization(
+                            st.session_state.organization["id"], active_only=True
+                        )
+                    }
+                    st.session_state.duplicate_audit = describe(
+                        duplicate_pairs(ids, vectors, threshold=audit_threshold), students
+                    )
+            audit = st.session_state.duplicate_audit
+            if audit is not None:
+                if audit:
+                    st.warning(f"{len(audit)} likely duplicate pair(s).")
+                    st.dataframe(
+                        [{k: v for k, v in row.items() if not k.startswith("uuid")} for row in audit],
+                        hide_index=True,
+                    )
+                else:
+                    st.success("No likely duplicates found.")
 
     with col_preview:
         if uploaded_file:
@@ -736,6 +1175,14 @@ def enroll_page():
             c1, c2 = st.columns(2)
             c1.metric("Total Students", len(embeddings))
             c2.metric("Org Code", st.session_state.organization["code"])
+            if st.session_state.matcher is not None:
+                gallery = st.session_state.matcher.stats()
+                st.caption(
+                    f"Gallery: {gallery['vectors']} template(s) · "
+                    f"{gallery['templates_per_student']} per student · "
+                    f"{gallery['bytes_per_student'] / 1024:.1f} KB per student · "
+                    f"{gallery['dot_products_per_query']} comparisons per face searched"
+                )
             st.markdown(
                 """<div class="cam-card" style="margin-top:1rem;text-align:center;padding:2rem">
                     <div style="font-size:2rem">📷</div>
@@ -746,12 +1193,24 @@ def enroll_page():
                 unsafe_allow_html=True,
             )
 
+    # Keep polling while a bulk enrollment job is queued or running.
+    bulk_job = (
+        st.session_state.job_queue.get(st.session_state.bulk_enroll_job)
+        if st.session_state.bulk_enroll_job
+        else None
+    )
+    if bulk_job is not None and not bulk_job.attached:
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
 
 # ── Recognize page ─────────────────────────────────────────────────────────────
 def recognize_page():
     st.markdown("## Face Recognition")
     st.markdown("Upload a class photo — the agent will identify students and decide attendance.")
     st.divider()
+    render_model_status()
+    from core.pipeline import count_matches, hash_image_bytes
 
     # ── Lecture session bar (full width) ──
     lec_col, status_col = st.columns([2, 1], gap="large")
@@ -759,7 +1218,7 @@ def recognize_page():
     with lec_col:
         if st.session_state.current_lecture is None:
             st.markdown("### Start a Lecture")
-            t1, t2, t3 = st.columns([2, 1, 1])
+            t1, t2, t3, t4 = st.columns([2, 1, 1, 1])
             with t1:
                 lecture_title = st.text_input(
                     "Title", value="Attendance Session", key="lec_title"
@@ -767,12 +1226,18 @@ def recognize_page():
             with t2:
                 lecture_subject = st.text_input("Subject", key="lec_subj")
             with t3:
+                lecture_course = st.text_input(
+                    "Course code", key="lec_course",
+                    help="Faces are matched against this course's roster first.",
+                )
+            with t4:
                 lecture_location = st.text_input("Location", key="lec_loc")
             if st.button("▶ Start Lecture", type="primary", width="stretch"):
                 started = start_lecture_session(
                     title=lecture_title.strip() or "Attendance Session",
                     subject=lecture_subject.strip() or None,
                     location=lecture_location.strip() or None,
+                    course_code=lecture_course.strip().upper() or None,
                 )
                 if started:
                     st.success(f"Lecture started: **{started['title']}**")
@@ -782,6 +1247,11 @@ def recognize_page():
         else:
             cur = st.session_state.current_lecture
             elapsed = int((datetime.now() - cur["started_at"]).total_seconds() / 60)
+            roster_note = (
+                f"&nbsp;·&nbsp; 🎓 {cur['course_code']}: {len(cur['roster'])} on roster"
+                if cur.get("roster")
+                else ""
+            )
             st.markdown(
                 f"""<div class="cam-card-accent">
                     <div style="color:#f5f5f7;font-weight:600">{cur['title']}</div>
@@ -789,6 +1259,7 @@ def recognize_page():
                         ⏱ {elapsed} min &nbsp;·&nbsp;
                         🖼 {cur['processed_images']} images &nbsp;·&nbsp;
                         👤 {cur['faces_processed']} faces
+                        {roster_note}
                     </div>
                 </div>""",
                 unsafe_allow_html=True,
@@ -826,295 +1297,114 @@ def recognize_page():
             help="Agent uses this to classify on-time / late / absent",
         )
         enable_agent = st.checkbox("Enable agent reasoning", value=True)
+        if st.session_state.current_lecture and st.session_state.current_lecture.get("roster"):
+            st.checkbox(
+                "Search the whole organization for faces not on the course roster",
+                value=True,
+                key="roster_fallback",
+            )
 
-        st.markdown("### Upload Photo")
-        uploaded_file = st.file_uploader(
-            "Group class photo", type=["jpg", "jpeg", "png"], key="rec_upload"
-        )
+        st.markdown("### Upload Photos")
+        uploaded_files = st.file_uploader(
+            "Group class photos — several angles of the same room are fused per student",
+            type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True,
+            key="rec_upload",
+        ) or []
+        photos = [
+            {"bytes": f.getvalue(), "hash": hash_image_bytes(f.getvalue()), "name": f.name}
+            for f in uploaded_files
+        ]
+        fusion = "max"
+        if len(photos) > 1:
+            fusion = st.radio(
+                "Per-student fusion",
+                ["max", "consensus"],
+                horizontal=True,
+                help="max: best score across photos · consensus: quality-weighted mean",
+            )
+
+        cached = [
+            c
+            for c in (
+                st.session_state.recognition_cache.peek(
+                    st.session_state.agent_session_id, p["hash"]
+                )
+                for p in photos
+            )
+            if c is not None
+        ]
+        if cached:
+            st.caption(
+                f"Cached analysis: {sum(count_matches(c, threshold) for c in cached)} of "
+                f"{sum(len(c['boxes']) for c in cached)} faces match at threshold {threshold:.2f}."
+            )
 
         st.markdown("<div style='height:0.5rem'></div>", unsafe_allow_html=True)
         run_btn = st.button(
             "Recognize Faces",
             type="primary",
             width="stretch",
-            disabled=(uploaded_file is None or st.session_state.current_lecture is None),
+            disabled=(not photos or st.session_state.current_lecture is None or not models_ready()),
         )
 
-        if uploaded_file and st.session_state.current_lecture is None:
+        if photos and st.session_state.current_lecture is None:
             st.warning("Start a lecture first to enable recognition.")
 
         # ── Recognition logic ──
-        if run_btn and uploaded_file and st.session_state.current_lecture:
-            image = Image.open(uploaded_file)
-            image_np = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            class_start_time = st.session_state.current_lecture["started_at"]
-
+        if run_btn and photos and st.session_state.current_lecture:
             if not st.session_state.agent_session_id:
                 st.session_state.agent_session_id = (
                     f"{st.session_state.organization['id']}_"
                     f"{datetime.now().strftime('%Y%m%d_%H%M%S')}"
                 )
+            label = photos[0]["name"] if len(photos) == 1 else f"{len(photos)} photos"
+            job_id = submit_recognition_job(
+                photos,
+                label=label,
+                threshold=threshold,
+                class_start_offset=class_start_offset,
+                enable_agent=enable_agent,
+                fusion=fusion,
+            )
+            st.toast(f"Queued {label} (job {job_id})")
 
-            bar = st.progress(0, "Detecting faces…")
-            boxes, probs, landmarks = st.session_state.detector.detect_faces(image_np)
-
-            if len(boxes) == 0:
-                st.error("No faces detected in the image.")
-                bar.empty()
-            else:
-                bar.progress(35, f"Embedding {len(boxes)} face(s)…")
-
-                candidates = []
-                for box, landmark in zip(boxes, landmarks):
-                    emb = st.session_state.embedder.get_embedding(
-                        image_np, bbox=box, landmark=landmark
-                    )
-                    if emb is None:
-                        continue
-                    student_id, score = st.session_state.matcher.match(emb)
-                    quality = compute_face_quality(image_np, box)
-                    sig = make_face_signature(emb)
-                    candidates.append(
-                        {
-                            "box": box,
-                            "student_id": student_id,
-                            "score": float(score) if score is not None else None,
-                            "quality": quality,
-                            "signature": sig,
-                        }
-                    )
-
-                if not candidates:
-                    st.error("Could not extract embeddings from detected faces.")
-                    bar.empty()
-                else:
-                    low_conf_count = sum(
-                        1
-                        for c in candidates
-                        if c["student_id"] is None
-                        or c["score"] is None
-                        or c["score"] <= threshold
-                    )
-                    low_conf_ratio = low_conf_count / max(1, len(candidates))
-
-                    img_annotated = image_np.copy()
-                    face_decisions = []
-                    present_students: set = set()
-                    unknown_count = 0
-                    flagged_count = 0
-                    retake_required = False
-
-                    for i, cand in enumerate(candidates):
-                        bar.progress(35 + int((i + 1) / len(candidates) * 55))
-                        box = cand["box"]
-                        student_id = cand["student_id"]
-                        score = cand["score"]
-                        quality = cand["quality"]
-                        sig = cand["signature"]
-                        x1, y1, x2, y2 = map(int, box)
-                        now = datetime.now()
-                        known = student_id is not None and score is not None and score > threshold
-
-                        if known:
-                            student_name = st.session_state.student_lookup.get(student_id, student_id)
-                            try:
-                                student_history = st.session_state.db.get_student_attendance_stats(
-                                    student_id, st.session_state.organization["id"]
-                                )
-                            except Exception:
-                                student_history = None
-                            try:
-                                attendance_records = st.session_state.db.get_student_attendance_history(student_id)
-                            except Exception:
-                                attendance_records = []
-                            prev_errors = int(student_history.get("previous_recognition_errors", 0)) if student_history else 0
-
-                            if enable_agent and st.session_state.agent:
-                                ar = st.session_state.agent.make_decision(
-                                    student_name=student_name,
-                                    confidence_score=float(score),
-                                    current_time=now,
-                                    class_start_time=class_start_time,
-                                    student_history=student_history,
-                                    attendance_records=attendance_records,
-                                    lecture_context={
-                                        "mode": "image_upload",
-                                        "class_start_offset_minutes": class_start_offset,
-                                        "threshold": threshold,
-                                        "image_quality": quality,
-                                        "previous_recognition_errors": prev_errors,
-                                        "low_conf_ratio": low_conf_ratio,
-                                        "total_faces": len(candidates),
-                                        "is_unknown": False,
-                                        "face_signature": sig,
-                                    },
-                                    session_id=st.session_state.agent_session_id,
-                                )
-                            else:
-                                ar = {
-                                    "decision": "PRESENT",
-                                    "confidence": float(score),
-                                    "uncertainty_score": 0.1,
-                                    "action": "MARK_PRESENT",
-                                    "reasoning": "Agent disabled — using threshold match only.",
-                                    "requires_review": False,
-                                    "agent_type": "disabled",
-                                    "time_offset_minutes": (now - class_start_time).total_seconds() / 60,
-                                    "trace": [],
-                                }
-                        else:
-                            student_name = "Unknown"
-                            if enable_agent and st.session_state.agent:
-                                ar = st.session_state.agent.make_decision(
-                                    student_name=student_name,
-                                    confidence_score=float(score) if score else 0.0,
-                                    current_time=now,
-                                    class_start_time=class_start_time,
-                                    student_history=None,
-                                    attendance_records=[],
-                                    lecture_context={
-                                        "mode": "image_upload",
-                                        "class_start_offset_minutes": class_start_offset,
-                                        "threshold": threshold,
-                                        "image_quality": quality,
-                                        "previous_recognition_errors": 0,
-                                        "low_conf_ratio": low_conf_ratio,
-                                        "total_faces": len(candidates),
-                                        "is_unknown": True,
-                                        "face_signature": sig,
-                                    },
-                                    session_id=st.session_state.agent_session_id,
-                                )
-                            else:
-                                ar = {
-                                    "decision": "FLAGGED",
-                                    "confidence": float(score) if score else 0.0,
-                                    "uncertainty_score": 0.8,
-                                    "action": "ESCALATE_TO_INSTRUCTOR",
-                                    "reasoning": "Below recognition threshold.",
-                                    "requires_review": True,
-                                    "agent_type": "threshold_filter",
-                                    "time_offset_minutes": (now - class_start_time).total_seconds() / 60,
-                                    "trace": [],
-                                }
-                            unknown_count += 1
-
-                        action = ar.get("action", "ESCALATE_TO_INSTRUCTOR")
-
-                        # Save audit trail + attendance
-                        try:
-                            st.session_state.db.save_agent_decision(
-                                lecture_id=st.session_state.current_lecture["id"],
-                                student_id=student_id if known else None,
-                                student_name=student_name,
-                                face_confidence=float(score) if score else 0.0,
-                                agent_decision=ar.get("decision", "FLAGGED"),
-                                agent_reasoning=ar.get("reasoning", ""),
-                                agent_type=ar.get("agent_type", "rule_based"),
-                                time_offset_minutes=ar.get("time_offset_minutes"),
-                                requires_review=ar.get("requires_review", False),
-                            )
-                        except Exception:
-                            pass
-
-                        if known and ar.get("decision") in {"PRESENT", "LATE", "ABSENT"}:
-                            try:
-                                st.session_state.db.mark_attendance(
-                                    lecture_id=st.session_state.current_lecture["id"],
-                                    student_id=student_id,
-                                    marked_by=st.session_state.admin_user["id"],
-                                    confidence_score=float(score),
-                                    status=ar.get("decision", "PRESENT").lower(),
-                                    notes=ar.get("reasoning", ""),
-                                )
-                            except Exception:
-                                pass
-
-                        face_decisions.append(
-                            {
-                                "student_id": student_id,
-                                "student_name": student_name,
-                                "face_score": round(float(score), 3) if score else None,
-                                "image_quality": round(float(quality), 3),
-                                "uncertainty": round(float(ar.get("uncertainty_score", 0)), 3),
-                                "agent_decision": ar.get("decision"),
-                                "action": action,
-                                "requires_review": ar.get("requires_review", False),
-                                "agent_type": ar.get("agent_type"),
-                                "reasoning": ar.get("reasoning"),
-                                "trace": ar.get("trace", []),
-                            }
-                        )
-
-                        # Annotate image
-                        color_map = {
-                            "MARK_PRESENT": (0, 220, 90),
-                            "SOFT_FLAG": (0, 210, 255),
-                            "ESCALATE_TO_INSTRUCTOR": (0, 140, 255),
-                            "RETAKE_PHOTO": (0, 60, 255),
-                            "SUGGEST_ENROLL_NEW_STUDENT": (200, 0, 255),
-                        }
-                        color = color_map.get(action, (120, 120, 120))
-                        decision_label = ar.get("decision", "FLAGGED")
-                        cv2.rectangle(img_annotated, (x1, y1), (x2, y2), color, 2)
-                        cv2.putText(
-                            img_annotated,
-                            f"{student_name} | {decision_label}",
-                            (x1, max(y1 - 8, 10)),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.6,
-                            color,
-                            2,
-                        )
-
-                        if action == "MARK_PRESENT" and ar.get("decision") in {"PRESENT", "LATE"}:
-                            present_students.add(student_name)
-                        elif action in {
-                            "SOFT_FLAG",
-                            "RETAKE_PHOTO",
-                            "ESCALATE_TO_INSTRUCTOR",
-                            "SUGGEST_ENROLL_NEW_STUDENT",
-                        }:
-                            flagged_count += 1
-                            if action == "RETAKE_PHOTO":
-                                retake_required = True
-
-                    bar.progress(100, "Done!")
-                    bar.empty()
-
-                    # Sort: auto-present first (most confident), then soft-flagged present/late,
-                    # then other flagged, then absent — within each tier sort by confidence desc.
-                    def _result_sort_key(r):
-                        d = r.get("agent_decision", "FLAGGED")
-                        conf = r.get("face_score") or 0.0
-                        flagged = r.get("requires_review", False)
-                        if d in {"PRESENT", "LATE"} and not flagged:
-                            return (0, -conf)
-                        if d in {"PRESENT", "LATE"} and flagged:
-                            return (1, -conf)
-                        if d == "FLAGGED":
-                            return (2, -conf)
-                        return (3, -conf)  # ABSENT
-
-                    face_decisions.sort(key=_result_sort_key)
-
-                    st.session_state.result_image = cv2.cvtColor(img_annotated, cv2.COLOR_BGR2RGB)
-                    st.session_state.agent_results = face_decisions
-                    st.session_state.review_queue = build_review_queue(
-                        face_decisions, st.session_state.agent_session_id
-                    )
+        with st.expander("Live video / camera"):
+            stream_source = st.text_input(
+                "Source",
+                placeholder="0 for webcam, rtsp://… or a path to a video file",
+                key="stream_source",
+            )
+            s1, s2 = st.columns(2)
+            with s1:
+                every_n = st.number_input("Process every Nth frame", 1, 60, 5, key="stream_every")
+            with s2:
+                max_minutes = st.number_input("Stop after (minutes)", 1, 240, 10, key="stream_minutes")
+            if st.button(
+                "▶ Start stream",
+                width="stretch",
+                disabled=(
+                    not stream_source
+                    or st.session_state.current_lecture is None
+                    or not models_ready()
+                ),
+            ):
+                job_id = submit_stream_job(
+                    stream_source.strip(),
+                    threshold=threshold,
+                    enable_agent=enable_agent,
+                    every_n=int(every_n),
+                    max_seconds=float(max_minutes) * 60,
+                )
+                st.toast(f"Started stream (job {job_id})")
 
-                    cur = st.session_state.current_lecture
-                    cur["processed_images"] += 1
-                    cur["faces_processed"] += len(candidates)
-                    cur["recognized_faces"] += len(present_students)
-                    cur["flagged_faces"] += flagged_count
-                    cur["unknown_faces"] += unknown_count
+        render_job_panel()
 
     with right_col:
         if st.session_state.result_image is not None:
             st.markdown("### Annotated Result")
-            st.image(st.session_state.result_image, width="stretch")
+            for annotated in st.session_state.result_image:
+                st.image(annotated, width="stretch")
             st.markdown(
                 """<div class="cam-card" style="font-size:0.8125rem;line-height:2">
                     <b style="color:#f5f5f7">Legend</b><br>
@@ -1126,10 +1416,11 @@ def recognize_page():
                 </div>""",
                 unsafe_allow_html=True,
             )
-        elif uploaded_file:
+        elif uploaded_files:
             st.markdown("### Preview")
-            st.image(uploaded_file, width="stretch")
-            st.info("Click **Recognize Faces** to process this image.")
+            for f in uploaded_files:
+                st.image(f, width="stretch")
+            st.info("Click **Recognize Faces** to process these photos.")
         else:
             st.markdown(
                 """<div class="cam-card" style="text-align:center;padding:3rem 1rem">
@@ -1159,9 +1450,7 @@ def recognize_page():
         m3.metric("Needs Review", flagged_n)
         m4.metric("Unknown", unknown_n)
 
-        if retake_required if "retake_required" in dir() else any(  # noqa: F821
-            r.get("action") == "RETAKE_PHOTO" for r in results
-        ):
+        if any(r.get("action") == "RETAKE_PHOTO" for r in results):
             st.error("Agent recommends a retake — photo quality is too low for reliable identification.")
 
         st.markdown("#### Per-Student Agent Decisions")
@@ -1177,7 +1466,13 @@ def recognize_page():
                 expanded=(idx == 0),
             ):
                 c1, c2, c3 = st.columns(3)
-                c1.metric("Face Score", f"{r.get('face_score') or 0:.3f}")
+                margin = r.get("score_margin")
+                c1.metric(
+                    "Face Score",
+                    f"{r.get('face_score') or 0:.3f}",
+                    delta=f"+{margin:.3f} over runner-up" if margin is not None else None,
+                    delta_color="off",
+                )
                 c2.metric("Image Quality", f"{r.get('image_quality', 0):.2f}")
                 c3.metric("Uncertainty", f"{r.get('uncertainty', 0):.3f}")
 
@@ -1253,6 +1548,15 @@ def recognize_page():
             if resolved:
                 st.success(f"{resolved} review(s) resolved this session.")
 
+    # Keep polling while this lecture still has queued or running jobs.
+    if (
+        st.session_state.job_queue is not None
+        and st.session_state.current_lecture is not None
+        and st.session_state.job_queue.active(st.session_state.current_lecture["id"])
+    ):
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
 
 # ── Main app shell ─────────────────────────────────────────────────────────────
 def main_app():
@@ -1289,7 +1593,9 @@ def main_app():
 
         st.markdown("<div style='height:1rem'></div>", unsafe_allow_html=True)
 
-        # Agent status indicator
+        # Model and agent status indicator
+        load_state = get_loader().status()
+        models_icon = {"ready": "🟢", "failed": "🔴"}.get(load_state["state"], "⏳")
         agent_ok = st.session_state.agent is not None
         groq_ok = (
             agent_ok
@@ -1298,6 +1604,7 @@ def main_app():
         st.markdown(
             f"""<div class="cam-card" style="font-size:0.8rem;line-height:1.9">
                 <div style="color:#aeaeb2;font-weight:600;margin-bottom:0.25rem">Agent Status</div>
+                <div>{models_icon} Face models</div>
                 <div>{"🟢" if agent_ok else "🔴"} AI Agent</div>
                 <div>{"🟢" if groq_ok else "⚪"} Groq LLM (reasoning)</div>
             </div>""",
@@ -1307,6 +1614,8 @@ def main_app():
         st.markdown("<div style='height:0.5rem'></div>", unsafe_allow_html=True)
 
         if st.button("🚪 Logout", width="stretch"):
+            if st.session_state.job_queue is not None:
+                st.session_state.job_queue.shutdown()
             for k, v in _DEFAULTS.items():
                 st.session_state[k] = v
             st.session_state.db = None
@@ -1318,6 +1627,7 @@ def main_app():
         )
 
     initialize_models()
+    collect_finished_jobs()
 
     # Persistent top navigation for easy page switching from anywhere.
     nav_col1, nav_col2, nav_col3, nav_col4 = st.columns([1, 1, 1, 2])
@@ -1347,6 +1657,11 @@ def main_app():
     else:
         recognize_page()
 
+    # Keep polling until the models are attached, so the pages unlock by themselves.
+    if page != "Dashboard" and not models_ready() and get_loader().status()["state"] != "failed":
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
 
 # ── Entry point ────────────────────────────────────────────────────────────────
 if st.session_state.admin_user is None:
@@ -0,0 +1,42 @@
+"""Batched ArcFace alignment transforms, without the insightface import."""
+import numpy as np
+
+
+# insightface.utils.face_align.arcface_dst: where ArcFace expects the eyes,
+# nose tip and mouth corners in a 112×112 crop.
+ARCFACE_DST = np.array(
+    [
+        [38.2946, 51.6963],
+        [73.5318, 51.5014],
+        [56.0252, 71.7366],
+        [41.5493, 92.3655],
+        [70.7299, 92.2041],
+    ],
+    dtype=np.float32,
+)
+
+
+def estimate_norm_batch(landmarks, image_size=112):
+    """Similarity transforms mapping every face's 5 landmarks onto ArcFace's template.
+
+    Closed-form least squares for all faces at once; for a proper
+    (non-reflecting) similarity this is the same solution ``norm_crop``
+    gets from ``SimilarityTransform.estimate`` one face at a time.
+    """
+    src = np.asarray(landmarks, dtype=np.float64).reshape(-1, 5, 2)
+    dst = ARCFACE_DST.astype(np.float64) * (image_size / 112.0)
+    src_mean = src.mean(axis=1, keepdims=True)
+    dst_mean = dst.mean(axis=0)
+    sc = src - src_mean
+    dc = dst - dst_mean
+    norm = np.maximum((sc ** 2).sum(axis=(1, 2)), 1e-12)
+    a = (sc[..., 0] * dc[:, 0] + sc[..., 1] * dc[:, 1]).sum(axis=1) / norm
+    b = (sc[..., 0] * dc[:, 1] - sc[..., 1] * dc[:, 0]).sum(axis=1) / norm
+
+    M = np.empty((len(src), 2, 3), dtype=np.float64)
+    M[:, 0, 0], M[:, 0, 1] = a, -b
+    M[:, 1, 0], M[:, 1, 1] = b, a
+    mx, my = src_mean[:, 0, 0], src_mean[:, 0, 1]
+    M[:, 0, 2] = dst_mean[0] - (a * mx - b * my)
+    M[:, 1, 2] = dst_mean[1] - (b * mx + a * my)
+    return M
@@ -0,0 +1,318 @@
+"""Back-fill attendance for one lecture from a folder of archived photos.
+
+Run with::
+
+    python -m core.batch_cli --org ORG_CODE --lecture <lecture uuid> \\
+        --marked-by <user uuid> archive/2024-03-04/ "archive/extra/*.jpg"
+
+Photos are analysed on a process pool; each worker loads the detector,
+embedder and the organization's gallery once. Faces are fused across all
+photos, decided in the parent process, written with a single
+``mark_bulk_attendance`` call and summarised as JSON and CSV.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from core.fusion import FUSION_MODES, fuse_candidates
+from core.image_io import ImageDecoder, default_max_side
+from core.model_packs import get_pack, model_id
+from core.pipeline import (
+    analysis_candidates,
+    analyze_image,
+    decide_candidates,
+    lecture_start_time,
+    persist_decisions,
+)
+from core.templates import load_gallery
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Models live for the lifetime of a worker process.
+_WORKER: Dict = {}
+
+
+def collect_images(inputs: List[str]) -> List[str]:
+    """Expand directories and glob patterns into a sorted, de-duplicated list."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, f) for f in files)
+        else:
+            paths.extend(glob.glob(item, recursive=True))
+    return sorted(
+        {os.path.abspath(p) for p in paths if p.lower().endswith(IMAGE_EXTENSIONS)}
+    )
+
+
+# ── worker side ──────────────────────────────────────────────────────────────
+
+def _init_worker(
+    gallery: List[Tuple[str, object]],
+    max_side: Optional[int] = None,
+    roster: Optional[set] = None,
+    fallback_below: Optional[float] = None,
+) -> None:
+    from core.detector import FaceDetector
+    from core.embedder import FaceEmbedder
+    from core.matcher import FaceMatcher
+
+    matcher = FaceMatcher()
+    matcher.add_embeddings([emb for _, emb in gallery], [student_id for student_id, _ in gallery])
+    if roster:
+        matcher = matcher.for_roster(roster, fallback_below=fallback_below)
+    _WORKER.update(
+        detector=FaceDetector(),
+        embedder=FaceEmbedder(),
+        matcher=matcher,
+        # Each image is dropped once analysed, so its buffers can be recycled.
+        decoder=ImageDecoder(max_side=max_side, reuse=True),
+    )
+
+
+def _analyze_path(task: Tuple[int, str]) -> Dict:
+    index, path = task
+    try:
+        with open(path, "rb") as f:
+            image = _WORKER["decoder"].decode(f.read())
+        analysis = analyze_image(
+            image, _WORKER["detector"], _WORKER["embedder"], _WORKER["matcher"]
+        )
+    except Exception as exc:
+        return {"index": index, "path": path, "error": f"{type(exc).__name__}: {exc}"}
+    return {
+        "index": index,
+        "path": path,
+        "total_detected": analysis["total_detected"],
+        # The decoded image stays in the worker; only candidates cross back.
+        "candidates": analysis_candidates(analysis, photo_index=index),
+    }
+
+
+def analyze_paths(
+    paths: List[str],
+    gallery: List[Tuple[str, object]],
+    workers: int,
+    chunksize: int = 4,
+    max_side: Optional[int] = None,
+    roster: Optional[set] = None,
+    fallback_below: Optional[float] = None,
+    log=None,
+) -> List[Dict]:
+    results: List[Optional[Dict]] = [None] * len(paths)
+    started = time.monotonic()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(gallery, max_side, roster, fallback_below),
+    ) as pool:
+        tasks = list(enumerate(paths))
+        for done, result in enumerate(pool.map(_analyze_path, tasks, chunksize=chunksize), start=1):
+            results[result["index"]] = result
+            if log and (done % 50 == 0 or done == len(paths)):
+                rate = done / max(time.monotonic() - started, 1e-6)
+                log(f"analysed {done}/{len(paths)} photo(s) · {rate:.1f} img/s")
+    return results
+
+
+# ── summary output ───────────────────────────────────────────────────────────
+
+CSV_FIELDS = [
+    "student_id",
+    "student_name",
+    "decision",
+    "action",
+    "face_score",
+    "score_margin",
+    "image_quality",
+    "uncertainty",
+    "requires_review",
+    "photos",
+]
+
+
+def _decision_row(fd: Dict, paths: List[str]) -> Dict:
+    photos = sorted({paths[s["photo_index"]] for s in fd.get("sightings", [])})
+    return {
+        "student_id": fd["student_id"] if fd.get("known") else None,
+        "student_name": fd["student_name"],
+        "decision": fd["agent_decision"],
+        "action": fd["action"],
+        "face_score": fd["face_score"],
+        "score_margin": fd.get("score_margin"),
+        "image_quality": fd["image_quality"],
+        "uncertainty": fd["uncertainty"],
+        "requires_review": fd["requires_review"],
+        "photos": photos,
+    }
+
+
+def write_summary(summary: Dict, json_path: Optional[str], csv_path: Optional[str]) -> None:
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(summary, f, indent=2, default=str)
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for row in summary["decisions"]:
+                writer.writerow({**row, "photos": ";".join(row["photos"])})
+
+
+# ── command-line entry point ─────────────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Back-fill lecture attendance from archived photos")
+    parser.add_argument("inputs", nargs="+", help="Image files, directories or glob patterns")
+    parser.add_argument("--org", required=True, help="Organization code")
+    parser.add_argument("--lecture", required=True, help="Lecture UUID")
+    parser.add_argument("--marked-by", required=True, help="User UUID recorded as marking attendance")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--fusion", choices=FUSION_MODES, default="max")
+    parser.add_argument(
+        "--minutes-after-start", type=float, default=0.0,
+        help="Minutes after class start the photos were taken (used for PRESENT/LATE)",
+    )
+    parser.add_argument("--no-agent", action="store_true", help="Threshold matching only")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--max-side", type=int, default=None,
+        help="Decode photos at most this many pixels on the long side (JPEG DCT scaling)",
+    )
+    parser.add_argument(
+        "--roster", choices=("fallback", "strict", "off"), default="fallback",
+        help="Match against the lecture's course roster first (fallback: then the whole "
+             "organization for misses; strict: roster only; off: whole organization)",
+    )
+    parser.add_argument("--json", dest="json_path", help="Write the summary as JSON")
+    parser.add_argument("--csv", dest="csv_path", help="Write per-face decisions as CSV")
+    parser.add_argument("--dry-run", action="store_true", help="Decide but do not write attendance")
+    parser.add_argument(
+        "--redecide", action="store_true",
+        help="Also decide students already marked present or late in this lecture",
+    )
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    from core.decision_ledger import DecisionLedger
+    from database.supabase_db import SupabaseDB
+
+    def log(message: str) -> None:
+        print(message, file=sys.stderr, flush=True)
+
+    load_dotenv()
+    paths = collect_images(args.inputs)
+    if not paths:
+        parser.error("No images matched the given inputs")
+
+    db = SupabaseDB()
+    org = db.get_organization_by_code(args.org)
+    if not org:
+        parser.error(f"Organization '{args.org}' not found")
+    lecture = db.get_lecture(args.lecture)
+    if not lecture or lecture.get("organization_id") != org["id"]:
+        parser.error(f"Lecture '{args.lecture}' not found in organization '{args.org}'")
+
+    pack = get_pack()
+    gallery, student_lookup = [], {}
+    gallery_rows = load_gallery(db, org["id"], dim=pack["embedding_dim"], model=model_id(pack))
+    for student_id, name, emb in gallery_rows:
+        gallery.append((student_id, emb))
+        student_lookup[student_id] = name
+    roster = set()
+    if args.roster != "off" and lecture.get("course_code"):
+        roster = db.get_course_roster(org["id"], lecture["course_code"])
+    log(
+        f"{len(paths)} photo(s), {len(gallery)} enrolled student(s), "
+        f"{args.workers} worker(s), model pack {pack['name']}"
+        + (f", {len(roster)} on the {lecture['course_code']} roster" if roster else "")
+    )
+
+    started = time.monotonic()
+    results = analyze_paths(
+        paths,
+        gallery,
+        workers=max(1, args.workers),
+        max_side=args.max_side or default_max_side(),
+        roster=roster,
+        fallback_below=args.threshold if args.roster == "fallback" else None,
+        log=log,
+    )
+    failed = [{"path": r["path"], "error": r["error"]} for r in results if "error" in r]
+    analysed = [r for r in results if "error" not in r]
+    for item in failed:
+        log(f"failed: {item['path']}: {item['error']}")
+
+    per_photo = [r["candidates"] for r in analysed]
+    candidates = fuse_candidates(per_photo, args.threshold, mode=args.fusion)
+    log(f"deciding {len(candidates)} fused face(s)…")
+
+    agent = None
+    if not args.no_agent:
+        from core.langgraph_agent import LangGraphAttendanceAgent
+
+        agent = LangGraphAttendanceAgent()
+    # The agent measures lateness against "now"; shift the start so that
+    # archived photos are judged by when they were taken.
+    class_start = datetime.now() - timedelta(minutes=args.minutes_after_start)
+    ledger = None if args.redecide else DecisionLedger().lecture(lecture["id"], db)
+    outcome = decide_candidates(
+        candidates,
+        threshold=args.threshold,
+        class_start_time=class_start,
+        agent=agent,
+        db=db,
+        organization_id=org["id"],
+        student_lookup=student_lookup,
+        session_id=lecture["id"],
+        enable_agent=agent is not None,
+        class_start_offset=args.minutes_after_start,
+        mode="batch_backfill",
+        ledger=ledger,
+    )
+
+    written = 0
+    if not args.dry_run:
+        written = persist_decisions(
+            db, outcome["face_decisions"], lecture_id=lecture["id"], marked_by=args.marked_by,
+            ledger=ledger,
+        )
+    if agent is not None:
+        agent.end_session(lecture["id"])
+
+    summary = {
+        "organization": args.org,
+        "lecture_id": lecture["id"],
+        "lecture_title": lecture.get("title"),
+        "lecture_start": lecture_start_time(lecture).isoformat(),
+        "photos": len(paths),
+        "photos_failed": len(failed),
+        "faces_detected": sum(r["total_detected"] for r in analysed),
+        "faces": outcome["faces"],
+        "recognized": outcome["recognized"],
+        "flagged": outcome["flagged"],
+        "unknown": outcome["unknown"],
+        "written": written,
+        "already_decided": sum(1 for fd in outcome["face_decisions"] if fd.get("already_decided")),
+        "dry_run": args.dry_run,
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+        "failed": failed,
+        "decisions": [_decision_row(fd, paths) for fd in outcome["face_decisions"]],
+    }
+    write_summary(summary, args.json_path, args.csv_path)
+    print(json.dumps({k: v for k, v in summary.items() if k != "decisions"}, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
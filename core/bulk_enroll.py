@@ -0,0 +1,448 @@
+"""Enroll a whole roster from a CSV file and a zip or folder of photos.
+
+Run with::
+
+    python -m core.bulk_enroll --org ORG_CODE --roster roster.csv --photos photos.zip \\
+        --report enroll_report.csv
+
+The roster needs a ``name`` column; ``student_id``, ``photo``, ``email``,
+``phone``, ``department`` and ``enrollment_year`` are optional. Without a
+``photo`` column the photo whose file name is the student ID is used.
+Rows move through a ``StageEngine`` in chunks: photos are decoded, detected
+and aligned on a thread pool, each chunk is embedded in one batch, written
+with one insert (then one photo-URL update) and added to the matcher in one
+call. A face that matches an enrolled student, or another row of the same
+roster, above ``DUPLICATE_THRESHOLD`` fails unless ``--allow-duplicates`` is
+given. Every roster row gets a line in the report.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from core.dedupe import duplicate_pairs, duplicate_threshold
+from core.image_io import decode_image
+from core.quality import gate_reasons, score_faces
+from core.stage_engine import Stage, StageEngine
+
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png")
+PHOTO_MAX_SIDE = 1600
+BATCH_SIZE = 32
+ROSTER_FIELDS = ("email", "phone", "department", "enrollment_year")
+REPORT_FIELDS = ["row", "student_id", "name", "photo", "status", "error", "uuid"]
+
+
+# ── inputs ───────────────────────────────────────────────────────────────────
+
+def read_roster(text: str) -> List[Dict]:
+    """Parse roster CSV text; header names are case- and space-insensitive."""
+    reader = csv.DictReader(io.StringIO(text.lstrip("\ufeff")))
+    rows = []
+    for line, raw in enumerate(reader, start=2):
+        # DictReader puts fields beyond the header under the key None, as a list.
+        extra = raw.pop(None, None) or []
+        row = {(k or "").strip().lower().replace(" ", "_"): (v or "").strip() for k, v in raw.items()}
+        name = row.get("name", "")
+        student_id = (row.get("student_id") or name.replace(" ", "_")).upper()
+        year = row.get("enrollment_year", "")
+        row["enrollment_year"] = int(year) if year.isdigit() else None
+        rows.append({
+            "row": line,
+            "student_id": student_id,
+            "name": name,
+            "photo": row.get("photo", ""),
+            **{field: row.get(field) or None for field in ROSTER_FIELDS},
+            "parse_error": f"{len(extra)} more field(s) than the header" if extra else None,
+        })
+    return rows
+
+
+class PhotoArchive:
+    """Photos from a zip file or a directory, looked up by file name or stem."""
+
+    def __init__(self, source):
+        self._zip = None
+        self._files: Dict[str, str] = {}
+        if isinstance(source, (bytes, bytearray)):
+            self._zip = zipfile.ZipFile(io.BytesIO(source))
+            names = self._zip.namelist()
+        elif os.path.isfile(source):
+            self._zip = zipfile.ZipFile(source)
+            names = self._zip.namelist()
+        else:
+            names = [
+                os.path.join(root, f) for root, _, files in os.walk(source) for f in files
+            ]
+        for name in names:
+            base = os.path.basename(name)
+            if base.startswith(".") or not base.lower().endswith(PHOTO_EXTENSIONS):
+                continue
+            self._files.setdefault(base.lower(), name)
+            self._files.setdefault(os.path.splitext(base)[0].lower(), name)
+
+    def find(self, photo: str, student_id: str) -> Optional[str]:
+        key = os.path.basename(photo).lower() if photo else student_id.lower()
+        return self._files.get(key)
+
+    def read(self, name: str) -> bytes:
+        if self._zip is not None:
+            return self._zip.read(name)
+        with open(name, "rb") as f:
+            return f.read()
+
+
+def validate_rows(rows: List[Dict], archive: PhotoArchive, existing_ids) -> List[Dict]:
+    """Mark rows that cannot be enrolled before any model work is done."""
+    seen = set()
+    for row in rows:
+        row["status"], row["error"] = "pending", None
+        if row.get("parse_error"):
+            row["error"] = row["parse_error"]
+        elif not row["name"]:
+            row["error"] = "missing name"
+        elif row["student_id"] in seen:
+            row["error"] = "duplicate student_id in roster"
+        elif row["student_id"] in existing_ids:
+            row["error"] = "student_id already enrolled"
+        else:
+            row["archive_name"] = archive.find(row["photo"], row["student_id"])
+            if row["archive_name"] is None:
+                row["error"] = f"photo not found: {row['photo'] or row['student_id']}"
+        seen.add(row["student_id"])
+        if row["error"]:
+            row["status"] = "failed"
+    return rows
+
+
+# ── enrollment ───────────────────────────────────────────────────────────────
+
+def bulk_enroll(
+    rows: List[Dict],
+    archive: PhotoArchive,
+    *,
+    db,
+    detector,
+    embedder,
+    matcher,
+    organization_id: str,
+    photo_store=None,
+    workers: int = 4,
+    batch_size: int = BATCH_SIZE,
+    dry_run: bool = False,
+    allow_duplicates: bool = False,
+    progress: Optional[Callable[[float, str], None]] = None,
+    check: Optional[Callable[[], None]] = None,
+) -> Dict:
+    """Enroll every pending row; each row ends ``enrolled`` or ``failed`` with an error.
+
+    ``check`` runs before each chunk is fed (see ``StageEngine.run``); if it
+    raises, chunks already in flight are still written, then it propagates.
+    """
+    threshold = duplicate_threshold()
+    pending = [r for r in rows if r["status"] == "pending"]
+    chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="camattend-enroll")
+    done = [0]
+    # Rows accepted from earlier chunks, as ``(row, normalized embedding)``.
+    # A dry run never adds them to the matcher, so roster-internal duplicates
+    # across chunks are found here.
+    accepted: List = []
+
+    def _prepare(row: Dict) -> Optional[np.ndarray]:
+        try:
+            data = archive.read(row["archive_name"])
+            image = decode_image(data, max_side=PHOTO_MAX_SIDE)
+            boxes, _, landmarks = detector.detect_faces(image)
+            if len(boxes) != 1:
+                raise ValueError("no face detected" if len(boxes) == 0 else f"{len(boxes)} faces detected")
+            boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+            landmarks = np.asarray(landmarks, dtype=np.float32).reshape(-1, 5, 2)
+            reasons = gate_reasons(score_faces(image, boxes, landmarks))[0]
+            if reasons:
+                raise ValueError(f"photo quality: {', '.join(reasons)}")
+            row["photo_bytes"] = data
+            # Keep only the aligned crop; the decoded photo is dropped here.
+            return np.array(embedder.aligner.align(image, landmarks)[0])
+        except ValueError as exc:
+            row["status"], row["error"] = "failed", str(exc)
+        except Exception as exc:
+            row["status"], row["error"] = "failed", f"{type(exc).__name__}: {exc}"
+        return None
+
+    def detect(chunk: List[Dict]):
+        return chunk, list(pool.map(_prepare, chunk))
+
+    def embed(item):
+        chunk, crops = item
+        kept = [(row, crop) for row, crop in zip(chunk, crops) if crop is not None]
+        if not kept:
+            return chunk, [], np.zeros((0, embedder.embedding_dim), dtype=np.float32)
+        embeddings = embedder.embed_aligned(np.stack([crop for _, crop in kept]))
+        return chunk, [row for row, _ in kept], np.asarray(embeddings, dtype=np.float32)
+
+    def reject_duplicates(kept: List[Dict], embeddings: np.ndarray):
+        duplicate = {}
+        if matcher is not None and matcher.index.ntotal:
+            ids, scores = matcher.search(embeddings, k=1)
+            for i, (sid, score) in enumerate(zip(ids, scores)):
+                if sid[0] is not None and score[0] >= threshold:
+                    duplicate[i] = f"face matches enrolled student {sid[0]} ({score[0]:.2f})"
+        if accepted:
+            normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+            sims = normed @ np.stack([emb for _, emb in accepted]).T
+            best = sims.argmax(axis=1)
+            for i, j in enumerate(best):
+                if sims[i, j] >= threshold:
+                    duplicate.setdefault(
+                        i, f"face matches roster row {accepted[j][0]['row']} ({sims[i, j]:.2f})"
+                    )
+        for pair in duplicate_pairs(list(range(len(kept))), embeddings, threshold=threshold):
+            later = max(pair["a"], pair["b"])
+            first = kept[min(pair["a"], pair["b"])]
+            duplicate.setdefault(later, f"face matches roster row {first['row']} ({pair['score']:.2f})")
+        for i, reason in duplicate.items():
+            kept[i]["status"], kept[i]["error"] = "failed", reason
+        keep = [i for i in range(len(kept)) if i not in duplicate]
+        return [kept[i] for i in keep], embeddings[keep]
+
+    def save_photo(row: Dict) -> Optional[str]:
+        ext = os.path.splitext(row["archive_name"])[1].lstrip(".").lower() or "jpg"
+        try:
+            return photo_store.save(organization_id, row["student_id"], row["photo_bytes"], ext=ext)
+        except Exception as exc:
+            row["error"] = f"enrolled, but the photo was not stored: {type(exc).__name__}: {exc}"
+            return None
+
+    def write(item):
+        chunk, kept, embeddings = item
+        if kept and not allow_duplicates:
+            kept, embeddings = reject_duplicates(kept, embeddings)
+        if kept and not dry_run:
+            records = [
+                {
+                    "student_id": row["student_id"],
+                    "name": row["name"],
+                    "embedding": emb,
+                    "embedding_model": embedder.model_id,
+                    **{field: row[field] for field in ROSTER_FIELDS},
+                }
+                for row, emb in zip(kept, embeddings)
+            ]
+            inserted = {s["student_id"]: s for s in db.enroll_students(organization_id, records)}
+            added_embeddings, added_ids = [], []
+            for row, emb in zip(kept, embeddings):
+                student = inserted.get(row["student_id"])
+                if student is None:
+                    row["status"], row["error"] = "failed", "insert failed (student_id may already exist)"
+                    continue
+                row["status"], row["uuid"] = "enrolled", student["id"]
+                added_embeddings.append(emb)
+                added_ids.append(student["id"])
+            # Photos are saved only once their rows are ours: the store
+            # overwrites by student ID, so saving first could replace the
+            # photo of a student who took the ID meanwhile, or orphan one.
+            # Uploads run on the pool and the URLs go out in one update.
+            enrolled = [row for row in kept if row["status"] == "enrolled"]
+            if enrolled and photo_store is not None:
+                urls = {
+                    row["uuid"]: url
+                    for row, url in zip(enrolled, pool.map(save_photo, enrolled))
+                    if url is not None
+                }
+                if urls:
+                    db.set_photo_urls(urls)
+            if added_ids and matcher is not None:
+                matcher.add_embeddings(np.stack(added_embeddings), added_ids)
+        elif kept:
+            for row in kept:
+                row["status"] = "ok"
+        if kept and not allow_duplicates:
+            normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+            accepted.extend(
+                (row, emb) for row, emb in zip(kept, normed) if row["status"] in ("ok", "enrolled")
+            )
+        for row in chunk:
+            row.pop("photo_bytes", None)
+        done[0] += len(chunk)
+        if progress:
+            progress(done[0] / max(1, len(pending)), f"Processed {done[0]}/{len(pending)} student(s)…")
+        return len(kept)
+
+    engine = StageEngine(
+        [
+            Stage("detect", detect),
+            Stage("embed", embed),
+            Stage("write", write, ordered=True),
+        ],
+        queue_size=2,
+    )
+    try:
+        results = engine.run(chunks, check=check)
+    finally:
+        pool.shutdown(wait=False)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+    return {
+        "rows": len(rows),
+        "enrolled": sum(r["status"] == "enrolled" for r in rows),
+        "validated": sum(r["status"] == "ok" for r in rows),
+        "failed": sum(r["status"] == "failed" for r in rows),
+        "stage_stats": engine.stats(),
+        "report": report_rows(rows),
+    }
+
+
+def report_rows(rows: List[Dict]) -> List[Dict]:
+    return [
+        {
+            "row": r["row"],
+            "student_id": r["student_id"],
+            "name": r["name"],
+            "photo": r.get("archive_name") or r.get("photo") or "",
+            "status": r["status"],
+            "error": r.get("error") or "",
+            "uuid": r.get("uuid") or "",
+        }
+        for r in rows
+    ]
+
+
+def report_csv(report: List[Dict]) -> str:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    writer.writerows(report)
+    return out.getvalue()
+
+
+def enroll_roster(
+    roster_text: str,
+    photos,
+    *,
+    db,
+    detector,
+    embedder,
+    matcher,
+    organization_id: str,
+    photo_store=None,
+    workers: int = 4,
+    batch_size: int = BATCH_SIZE,
+    dry_run: bool = False,
+    allow_duplicates: bool = False,
+    progress: Optional[Callable[[float, str], None]] = None,
+    check: Optional[Callable[[], None]] = None,
+) -> Dict:
+    """Roster text plus a photo archive (zip bytes, zip path or directory) → enrollment summary."""
+    rows = read_roster(roster_text)
+    archive = PhotoArchive(photos)
+    existing = db.get_existing_student_ids(organization_id, [r["student_id"] for r in rows])
+    validate_rows(rows, archive, existing)
+    return bulk_enroll(
+        rows, archive,
+        db=db, detector=detector, embedder=embedder, matcher=matcher,
+        organization_id=organization_id, photo_store=photo_store,
+        workers=workers, batch_size=batch_size, dry_run=dry_run,
+        allow_duplicates=allow_duplicates, progress=progress, check=check,
+    )
+
+
+def run_enroll_roster(job, roster_text: str, photos, **kwargs) -> Dict:
+    """``JobQueue`` body for ``enroll_roster``; cancelling stops before the next chunk."""
+    from core.jobs import JobCancelled
+
+    job.start_stage("enroll", "Checking roster…")
+
+    def _progress(fraction: float, message: str) -> None:
+        try:
+            job.report(fraction, message)
+        except JobCancelled:
+            # Raised inside the write stage it would hide which rows were
+            # written; cancellation goes through ``check`` instead.
+            pass
+
+    return enroll_roster(roster_text, photos, progress=_progress, check=job.check, **kwargs)
+
+
+# ── command-line entry point ─────────────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Enroll students from a roster CSV and a photo archive")
+    parser.add_argument("--org", required=True, help="Organization code")
+    parser.add_argument("--roster", required=True, help="Roster CSV")
+    parser.add_argument("--photos", required=True, help="Zip file or directory of photos")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--report", help="Write the per-row report as CSV")
+    parser.add_argument("--dry-run", action="store_true", help="Check photos and IDs but write nothing")
+    parser.add_argument(
+        "--allow-duplicates", action="store_true",
+        help="Enroll faces that match an enrolled student or another roster row",
+    )
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    from core.detector import FaceDetector
+    from core.embedder import FaceEmbedder
+    from core.matcher import FaceMatcher
+    from core.photo_store import get_photo_store
+    from core.templates import load_gallery
+    from database.supabase_db import SupabaseDB
+
+    def log(message: str) -> None:
+        print(message, file=sys.stderr, flush=True)
+
+    load_dotenv()
+    db = SupabaseDB()
+    org = db.get_organization_by_code(args.org)
+    if not org:
+        parser.error(f"Organization '{args.org}' not found")
+    with open(args.roster, encoding="utf-8") as f:
+        roster_text = f.read()
+
+    embedder = FaceEmbedder()
+    matcher = None
+    if not args.allow_duplicates:
+        # The existing gallery, so new faces can be checked against it.
+        matcher = FaceMatcher(dim=embedder.embedding_dim)
+        gallery = load_gallery(db, org["id"], dim=embedder.embedding_dim, model=embedder.model_id)
+        if gallery:
+            matcher.add_embeddings(np.stack([emb for _, _, emb in gallery]), [sid for sid, _, _ in gallery])
+
+    summary = enroll_roster(
+        roster_text,
+        args.photos,
+        db=db,
+        detector=FaceDetector(),
+        embedder=embedder,
+        matcher=matcher,
+        organization_id=org["id"],
+        photo_store=None if args.dry_run else get_photo_store(db),
+        workers=max(1, args.workers),
+        batch_size=max(1, args.batch_size),
+        dry_run=args.dry_run,
+        allow_duplicates=args.allow_duplicates,
+        progress=lambda fraction, message: log(message),
+    )
+    if args.report:
+        with open(args.report, "w", newline="") as f:
+            f.write(report_csv(summary["report"]))
+    for row in summary["report"]:
+        if row["status"] == "failed":
+            log(f"row {row['row']} ({row['student_id']}): {row['error']}")
+    print(json.dumps({k: v for k, v in summary.items() if k != "report"}, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,397 @@
+"""Headless multi-camera attendance ingestion.
+
+Run with::
+
+    python -m core.camera_service --org ORG_CODE \\
+        --camera room101=rtsp://cam1/stream --camera room102=0 \\
+        --lecture room101=<lecture uuid> --marked-by <user uuid>
+
+Each camera is read by its own task into a bounded queue that drops the
+oldest frame when inference falls behind. A single shared detector/embedder
+serves every camera: frames are pulled round-robin into batches, detected on
+a worker pool, and all faces that need an embedding are embedded in one
+batched call. Detection itself still runs one frame per call, because the
+detector takes a single image and picks its input size per frame; raise
+``--workers`` rather than ``--batch-size`` when detection is the bottleneck.
+Per-camera throughput and lag are printed as JSON lines.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from core.video import StreamRecognizer, open_capture
+
+
+class CameraFeed:
+    def __init__(self, name: str, source: Union[str, int], queue_size: int, every_n: int):
+        self.name = name
+        self.source = source
+        self.every_n = max(1, every_n)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.frames_processed = 0
+        self.lag_ms = 0.0
+        self.started = time.monotonic()
+        self.finished = False
+
+    def put_latest(self, item: Tuple[float, np.ndarray]) -> None:
+        # Drop-oldest backpressure: stale frames are worth less than fresh ones.
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.frames_dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(item)
+
+    def metrics(self) -> Dict:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return {
+            "camera": self.name,
+            "frames_read": self.frames_read,
+            "frames_dropped": self.frames_dropped,
+            "frames_processed": self.frames_processed,
+            "queue_depth": self.queue.qsize(),
+            "read_fps": round(self.frames_read / elapsed, 2),
+            "processed_fps": round(self.frames_processed / elapsed, 2),
+            "lag_ms": round(self.lag_ms, 1),
+        }
+
+
+class CameraIngestService:
+    def __init__(
+        self,
+        cameras: Dict[str, Union[str, int]],
+        detector,
+        embedder,
+        matcher,
+        *,
+        threshold: float = 0.5,
+        queue_size: int = 4,
+        batch_size: int = 8,
+        workers: int = 2,
+        every_n: int = 5,
+        on_events: Optional[Callable[[str, List[Dict]], None]] = None,
+    ):
+        self.detector = detector
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.on_events = on_events
+        self.feeds = {
+            name: CameraFeed(name, source, queue_size, every_n)
+            for name, source in cameras.items()
+        }
+        self.recognizers = {
+            name: StreamRecognizer(detector, embedder, matcher, threshold=threshold)
+            for name in cameras
+        }
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="camattend-infer")
+        self._readers = ThreadPoolExecutor(
+            max_workers=max(1, len(cameras)), thread_name_prefix="camattend-read"
+        )
+        self._stop = asyncio.Event()
+
+    def metrics(self) -> Dict[str, Dict]:
+        metrics = {name: feed.metrics() for name, feed in self.feeds.items()}
+        for name, recognizer in self.recognizers.items():
+            metrics[name]["students_seen"] = len(recognizer.seen_students)
+            metrics[name]["embeddings"] = recognizer.stats["embeddings"]
+        return metrics
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def run(
+        self,
+        duration: Optional[float] = None,
+        metrics_interval: float = 10.0,
+        on_metrics: Optional[Callable[[Dict], None]] = None,
+    ) -> Dict[str, Dict]:
+        tasks = [asyncio.create_task(self._read(feed)) for feed in self.feeds.values()]
+        tasks.append(asyncio.create_task(self._infer()))
+        if on_metrics:
+            tasks.append(asyncio.create_task(self._report(metrics_interval, on_metrics)))
+        try:
+            if duration:
+                await asyncio.wait_for(self._stop.wait(), timeout=duration)
+            else:
+                await self._stop.wait()
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._stop.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._flush()
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._readers.shutdown(wait=False, cancel_futures=True)
+        return self.metrics()
+
+    # ── tasks ───────────────────────────────────────────────────────────────
+
+    async def _read(self, feed: CameraFeed) -> None:
+        capture, pending = None, None
+
+        def _call(fn):
+            nonlocal pending
+            pending = self._readers.submit(fn)
+            return asyncio.wrap_future(pending)
+
+        index = 0
+        try:
+            capture = await _call(lambda: open_capture(feed.source))
+            while not self._stop.is_set():
+                if index % feed.every_n:
+                    ok = await _call(capture.grab)
+                    frame = None
+                else:
+                    ok, frame = await _call(capture.read)
+                if not ok:
+                    break
+                index += 1
+                if frame is not None:
+                    feed.frames_read += 1
+                    feed.put_latest((time.time(), frame))
+        finally:
+            feed.finished = True
+            if pending is not None:
+                _release_when_idle(pending, capture)
+
+    async def _infer(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                if all(f.finished and f.queue.empty() for f in self.feeds.values()):
+                    self._stop.set()
+                    return
+                await asyncio.sleep(0.01)
+                continue
+            events = await loop.run_in_executor(None, self._process_batch, batch)
+            if self.on_events:
+                for name, candidates in events.items():
+                    if candidates:
+                        await loop.run_in_executor(None, self.on_events, name, candidates)
+
+    async def _report(self, interval: float, on_metrics: Callable[[Dict], None]) -> None:
+        while not self._stop.is_set():
+            await asyncio.sleep(interval)
+            on_metrics(self.metrics())
+
+    # ── batching ────────────────────────────────────────────────────────────
+
+    def _next_batch(self) -> List[Tuple[str, float, np.ndarray]]:
+        batch = []
+        progressed = True
+        # Round-robin so a busy camera cannot starve the others.
+        while len(batch) < self.batch_size and progressed:
+            progressed = False
+            for feed in self.feeds.values():
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    captured_at, frame = feed.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    continue
+                batch.append((feed.name, captured_at, frame))
+                progressed = True
+        return batch
+
+    def _process_batch(self, batch: List[Tuple[str, float, np.ndarray]]) -> Dict[str, List[Dict]]:
+        # One detector call per frame, in parallel; only embedding is batched.
+        detections = list(self._pool.map(lambda item: self.detector.detect_faces(item[2]), batch))
+
+        # A track seen in several frames of one batch is embedded once, from
+        # its latest frame.
+        pending: Dict[Tuple[str, int], Tuple[object, np.ndarray, np.ndarray]] = {}
+        lost_by_camera: Dict[str, list] = {}
+        for (name, _, frame), (boxes, _, landmarks) in zip(batch, detections):
+            tracks, lost = self.recognizers[name].observe(frame, boxes, landmarks)
+            lost_by_camera.setdefault(name, []).extend(lost)
+            for track in tracks:
+                pending[(name, track.id)] = (track, frame, track.landmark)
+
+        if pending:
+            frames = [frame for _, frame, _ in pending.values()]
+            landmarks = np.array([landmark for _, _, landmark in pending.values()], dtype=np.float32)
+            embeddings = np.asarray(self.embedder.get_embeddings_many(frames, landmarks), dtype=np.float32)
+            by_camera: Dict[str, Tuple[list, list]] = {}
+            for ((name, _), (track, _, _)), emb in zip(pending.items(), embeddings):
+                tracks, embs = by_camera.setdefault(name, ([], []))
+                tracks.append(track)
+                embs.append(emb)
+            for name, (tracks, embs) in by_camera.items():
+                self.recognizers[name].assign_embeddings(tracks, np.stack(embs))
+
+        now = time.time()
+        for name, captured_at, _ in batch:
+            feed = self.feeds[name]
+            feed.frames_processed += 1
+            lag = (now - captured_at) * 1000.0
+            feed.lag_ms = lag if feed.lag_ms == 0 else 0.8 * feed.lag_ms + 0.2 * lag
+
+        return {
+            name: self.recognizers[name].emit(lost_by_camera.get(name, []))
+            for name in {item[0] for item in batch}
+        }
+
+    def _flush(self) -> None:
+        if not self.on_events:
+            return
+        for name, recognizer in self.recognizers.items():
+            remaining = recognizer.flush()
+            if remaining:
+                self.on_events(name, remaining)
+
+
+def _release_when_idle(pending, capture) -> None:
+    """Release a capture once the reader call in flight on it has returned.
+
+    A cancelled task leaves its ``grab``/``read`` running on the reader
+    thread, and OpenCV captures must not be released while another thread
+    reads them, so the release runs as that call's done-callback. A task
+    cancelled while opening releases the capture the open returns.
+    """
+    def _release(done) -> None:
+        target = capture
+        if target is None and not done.cancelled() and done.exception() is None:
+            target = done.result()
+        if target is not None:
+            target.release()
+
+    pending.add_done_callback(_release)
+
+
+# ── command-line entry point ─────────────────────────────────────────────────
+
+def _parse_pairs(values: List[str], flag: str) -> Dict[str, str]:
+    pairs = {}
+    for value in values or []:
+        if "=" not in value:
+            raise SystemExit(f"{flag} expects NAME=VALUE, got '{value}'")
+        name, _, rest = value.partition("=")
+        pairs[name.strip()] = rest.strip()
+    return pairs
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Multi-camera attendance ingestion service")
+    parser.add_argument("--org", required=True, help="Organization code")
+    parser.add_argument("--camera", action="append", required=True, help="NAME=SOURCE (file, RTSP URL or camera index)")
+    parser.add_argument("--lecture", action="append", help="NAME=LECTURE_UUID; decide and write attendance for this camera")
+    parser.add_argument("--marked-by", help="User UUID recorded as marking attendance")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--every-n", type=int, default=5, help="Process every Nth frame per camera")
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--metrics-interval", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    from core.decision_ledger import DecisionLedger
+    from core.detector import FaceDetector
+    from core.embedder import FaceEmbedder
+    from core.langgraph_agent import LangGraphAttendanceAgent
+    from core.matcher import FaceMatcher
+    from core.pipeline import decide_candidates, lecture_start_time, persist_decisions
+    from core.templates import load_gallery
+    from database.supabase_db import SupabaseDB
+
+    load_dotenv()
+    cameras = _parse_pairs(args.camera, "--camera")
+    lectures = _parse_pairs(args.lecture, "--lecture")
+    if lectures and not args.marked_by:
+        parser.error("--marked-by is required when --lecture is given")
+
+    db = SupabaseDB()
+    org = db.get_organization_by_code(args.org)
+    if not org:
+        parser.error(f"Organization '{args.org}' not found")
+
+    detector, embedder = FaceDetector(), FaceEmbedder()
+    matcher = FaceMatcher(dim=embedder.embedding_dim)
+    gallery = load_gallery(db, org["id"], dim=embedder.embedding_dim, model=embedder.model_id)
+    student_lookup = {student_id: name for student_id, name, _ in gallery}
+    matcher.add_embeddings([emb for _, _, emb in gallery], [student_id for student_id, _, _ in gallery])
+
+    agent = LangGraphAttendanceAgent() if lectures else None
+    lecture_rows = {name: db.get_lecture(lecture_id) for name, lecture_id in lectures.items()}
+    ledger = DecisionLedger()
+
+    def on_events(camera: str, candidates: List[Dict]) -> None:
+        lecture = lecture_rows.get(camera)
+        if lecture is None:
+            for cand in candidates:
+                print(json.dumps({
+                    "event": "face",
+                    "camera": camera,
+                    "student_id": cand["student_id"],
+                    "student_name": student_lookup.get(cand["student_id"]),
+                    "score": cand["score"],
+                    "track_id": cand.get("track_id"),
+                }), flush=True)
+            return
+        start = lecture_start_time(lecture)
+        book = ledger.lecture(lecture["id"], db)
+        outcome = decide_candidates(
+            candidates,
+            threshold=args.threshold,
+            class_start_time=start,
+            agent=agent,
+            db=db,
+            organization_id=org["id"],
+            student_lookup=student_lookup,
+            session_id=lecture["id"],
+            mode="camera_service",
+            ledger=book,
+        )
+        persist_decisions(
+            db, outcome["face_decisions"], lecture_id=lecture["id"], marked_by=args.marked_by,
+            ledger=book,
+        )
+        for fd in outcome["face_decisions"]:
+            print(json.dumps({
+                "event": "decision",
+                "camera": camera,
+                "student_id": fd["student_id"] if fd.get("known") else None,
+                "student_name": fd["student_name"],
+                "decision": fd["agent_decision"],
+                "action": fd["action"],
+            }), flush=True)
+
+    service = CameraIngestService(
+        cameras,
+        detector,
+        embedder,
+        matcher,
+        threshold=args.threshold,
+        queue_size=args.queue_size,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        every_n=args.every_n,
+        on_events=on_events,
+    )
+    final = asyncio.run(
+        service.run(
+            duration=args.duration,
+            metrics_interval=args.metrics_interval,
+            on_metrics=lambda m: print(json.dumps({"event": "metrics", "cameras": m}), flush=True),
+        )
+    )
+    print(json.dumps({"event": "final_metrics", "cameras": final}), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+# Attendance statuses that a later photo of the same lecture cannot improve on.
+FINAL_STATUSES = ("present", "late")
+
+
+class LectureLedger:
+    """Students already marked in one lecture, as ``student uuid → entry``."""
+
+    def __init__(self, lecture_id: str):
+        self.lecture_id = lecture_id
+        self._final: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self._final)
+
+    def seed(self, rows: List[Dict]) -> None:
+        """Rows of ``get_lecture_attendance``; only present/late rows are final."""
+        with self._lock:
+            for row in rows:
+                status = (row.get("status") or "").lower()
+                if row.get("student_id") and status in FINAL_STATUSES:
+                    self._final[row["student_id"]] = {
+                        "status": status,
+                        "score": row.get("confidence_score"),
+                    }
+
+    def final(self, student_id: Optional[str]) -> Optional[Dict]:
+        if student_id is None:
+            return None
+        return self._final.get(student_id)
+
+    def record(self, face_decisions: List[Dict]) -> None:
+        """Finalize students whose attendance was just written without review."""
+        with self._lock:
+            for fd in face_decisions:
+                if fd.get("already_decided"):
+                    self.skipped += 1
+                    continue
+                status = (fd.get("agent_decision") or "").lower()
+                if (
+                    fd.get("known")
+                    and fd.get("action") == "MARK_PRESENT"
+                    and status in FINAL_STATUSES
+                    and not fd.get("requires_review")
+                ):
+                    self._final[fd["student_id"]] = {"status": status, "score": fd.get("face_score")}
+
+
+class DecisionLedger:
+    """Per-lecture ledgers of finalized attendance, so repeated photos of a
+    lecture skip the agent and the database for students already marked.
+
+    A lecture's ledger is seeded from the database the first time it is
+    used, which also covers lectures resumed after a restart. Ledgers are
+    kept for the ``max_lectures`` most recently used lectures.
+    """
+
+    def __init__(self, max_lectures: int = 64):
+        self.max_lectures = max_lectures
+        self._lectures: "OrderedDict[str, LectureLedger]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lecture(self, lecture_id: str, db=None) -> LectureLedger:
+        with self._lock:
+            ledger = self._lectures.get(lecture_id)
+            if ledger is not None:
+                self._lectures.move_to_end(lecture_id)
+                return ledger
+        # Seeded outside the lock so one slow query does not stall every
+        # lecture; the ledger is only published below.
+        fresh = LectureLedger(lecture_id)
+        if db is not None:
+            try:
+                fresh.seed(db.get_lecture_attendance(lecture_id))
+            except Exception:
+                pass
+        with self._lock:
+            # Another caller may have published this lecture meanwhile; keep
+            # theirs, which may already hold recorded decisions.
+            ledger = self._lectures.setdefault(lecture_id, fresh)
+            self._lectures.move_to_end(lecture_id)
+            while len(self._lectures) > self.max_lectures:
+                self._lectures.popitem(last=False)
+        return ledger
+
+    def drop_lecture(self, lecture_id: str) -> None:
+        with self._lock:
+            self._lectures.pop(lecture_id, None)
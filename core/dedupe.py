@@ -0,0 +1,161 @@
+"""Find students who are probably enrolled twice under different IDs.
+
+Run with::
+
+    python -m core.dedupe --org ORG_CODE --threshold 0.6 --csv duplicates.csv
+
+Every enrolled template is compared with every other one, block by block,
+so memory stays at ``block²`` similarities however large the gallery is.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# Well above the recognition threshold: two templates this close are
+# almost certainly the same person.
+DUPLICATE_THRESHOLD = 0.6
+BLOCK = 2048
+
+
+def duplicate_threshold() -> float:
+    return float(os.getenv("DUPLICATE_THRESHOLD", str(DUPLICATE_THRESHOLD)))
+
+
+def duplicate_pairs(
+    student_ids: List[str],
+    embeddings,
+    threshold: Optional[float] = None,
+    block: int = BLOCK,
+) -> List[Dict]:
+    """Pairs of different students with any two templates above ``threshold``.
+
+    All-pairs cosine similarity is computed as ``block × block`` matrix
+    products over the upper triangle only. Returns one entry per student
+    pair with its best similarity and how many template pairs crossed the
+    threshold, most similar first.
+    """
+    threshold = duplicate_threshold() if threshold is None else threshold
+    emb = np.asarray(embeddings, dtype=np.float32)
+    if len(emb) < 2:
+        return []
+    emb = emb / np.linalg.norm(emb, axis=1, keepdims=True)
+    owners = np.asarray(student_ids, dtype=object)
+    pairs: Dict[tuple, Dict] = {}
+    n = len(emb)
+    for i in range(0, n, block):
+        left = emb[i:i + block]
+        for j in range(i, n, block):
+            sims = left @ emb[j:j + block].T
+            if i == j:
+                # Same block: keep only the strict upper triangle.
+                sims = np.triu(sims, k=1)
+            rows, cols = np.nonzero(sims >= threshold)
+            for r, c in zip(rows, cols):
+                a, b = owners[i + r], owners[j + c]
+                if a == b:
+                    continue
+                key = (a, b) if str(a) < str(b) else (b, a)
+                score = float(sims[r, c])
+                entry = pairs.setdefault(key, {"a": key[0], "b": key[1], "score": score, "hits": 0})
+                entry["score"] = max(entry["score"], score)
+                entry["hits"] += 1
+    return sorted(pairs.values(), key=lambda p: -p["score"])
+
+
+def enrollment_conflicts(
+    matcher, embeddings, threshold: Optional[float] = None, k: int = 5
+) -> List[Dict]:
+    """Enrolled students whose templates look like the face about to be enrolled.
+
+    One top-``k`` search per new template; a student counts once, with the
+    best score over all templates.
+    """
+    threshold = duplicate_threshold() if threshold is None else threshold
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, matcher.index.d)
+    if matcher.index.ntotal == 0 or len(embeddings) == 0:
+        return []
+    ids, scores = matcher.search(embeddings, k=k)
+    best: Dict[str, float] = {}
+    for row_ids, row_scores in zip(ids, scores):
+        for sid, score in zip(row_ids, row_scores):
+            if sid is not None and score >= threshold:
+                best[sid] = max(best.get(sid, -1.0), float(score))
+    return [
+        {"student_id": sid, "score": score}
+        for sid, score in sorted(best.items(), key=lambda x: -x[1])
+    ]
+
+
+def describe(pairs: List[Dict], students: Dict[str, Dict]) -> List[Dict]:
+    """Attach names and student ID codes from ``students`` (keyed by uuid)."""
+    rows = []
+    for p in pairs:
+        a, b = students.get(p["a"], {}), students.get(p["b"], {})
+        rows.append({
+            "score": round(p["score"], 4),
+            "template_pairs": p["hits"],
+            "student_a": a.get("student_id", p["a"]),
+            "name_a": a.get("name"),
+            "student_b": b.get("student_id", p["b"]),
+            "name_b": b.get("name"),
+            "uuid_a": p["a"],
+            "uuid_b": p["b"],
+        })
+    return rows
+
+
+# ── command-line entry point ─────────────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Report students enrolled more than once")
+    parser.add_argument("--org", required=True, help="Organization code")
+    parser.add_argument("--threshold", type=float, help="Cosine similarity (default: DUPLICATE_THRESHOLD or 0.6)")
+    parser.add_argument("--block", type=int, default=BLOCK, help="Templates per matrix block")
+    parser.add_argument("--csv", dest="csv_path", help="Write the likely duplicates as CSV")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    from core.model_packs import get_pack, model_id
+    from core.templates import load_gallery
+    from database.supabase_db import SupabaseDB
+
+    load_dotenv()
+    db = SupabaseDB()
+    org = db.get_organization_by_code(args.org)
+    if not org:
+        parser.error(f"Organization '{args.org}' not found")
+
+    pack = get_pack()
+    gallery = load_gallery(db, org["id"], dim=pack["embedding_dim"], model=model_id(pack))
+    students = {s["id"]: s for s in db.get_students_by_organization(org["id"], active_only=True)}
+    pairs = duplicate_pairs(
+        [sid for sid, _, _ in gallery],
+        [emb for _, _, emb in gallery] or np.zeros((0, pack["embedding_dim"])),
+        threshold=args.threshold,
+        block=max(1, args.block),
+    )
+    rows = describe(pairs, students)
+    if args.csv_path and rows:
+        with open(args.csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    for row in rows:
+        print(json.dumps(row))
+    print(
+        f"{len(rows)} likely duplicate pair(s) among {len(students)} student(s) "
+        f"and {len(gallery)} template(s)",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
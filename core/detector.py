@@ -1,38 +1,188 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
-import insightface
 from insightface.app import FaceAnalysis
 
+from core.model_opt import load_variant, session_options
+from core.model_packs import ensure_pack, get_pack
+from core.tiling import choose_tiling, nms, tile_origins
+
+
+# Images whose long side exceeds this many detector inputs are tiled in "auto"
+# mode: 4480 px at 640, well above a 12 MP phone photo (4032 px), so only
+# 48 MP+ and stitched hall shots qualify.
+TILE_TRIGGER = 7
+# Smallest face side, in detector-input pixels, that RetinaFace finds reliably.
+MIN_FACE_PX = 32
+MIN_DET_SIZE = 256
+PROBE_EVERY = 10
+
 
 class FaceDetector:
-    def __init__(self, device=None):
-        # Initialize RetinaFace detector from InsightFace
-        self.app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-        self.app.prepare(ctx_id=-1, det_size=(640, 640))
-        
+    def __init__(self, device=None, tiling=None, tile_workers=None, scale_mode=None, pack=None):
+        # Initialize the pack's face detector from InsightFace (MODEL_PACK, see core.model_packs)
+        self.pack = get_pack(pack)
+        self.det_size = self.pack["det_size"]
+        ensure_pack(self.pack["name"])
+        self.app = FaceAnalysis(
+            name=self.pack["name"],
+            allowed_modules=["detection"],
+            providers=['CPUExecutionProvider'],
+            sess_options=session_options(),
+        )
+        self.app.prepare(ctx_id=-1, det_size=(self.det_size, self.det_size))
+        # MODEL_VARIANT selects an optimized or INT8 graph (see core.model_opt).
+        self.variant = load_variant(self.app.det_model)
+        # "auto" tiles only very large photos whose whole-image pass finds no
+        # or only tiny faces, "on" always, "off" never.
+        self.tiling = (tiling or os.getenv("DETECTION_TILING", "auto")).lower()
+        self._tile_pool = ThreadPoolExecutor(
+            max_workers=tile_workers or min(4, os.cpu_count() or 1),
+            thread_name_prefix="camattend-tile",
+        )
+        # "adaptive" shrinks the detector input while the faces seen so far
+        # are large; "full" always detects at the pack's det_size.
+        self.scale_mode = (scale_mode or os.getenv("DETECTION_SCALE", "adaptive")).lower()
+        self._face_fractions = {}
+        self._calls = 0
+        self._scale_lock = threading.Lock()
+
     def detect_faces(self, image):
-        # RetinaFace expects RGB image
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        faces = self.app.get(rgb_image)
-        
-        if len(faces) == 0:
+        if self.tiling == "on":
+            return self.detect_faces_tiled(image)
+
+        h, w = image.shape[:2]
+        size = self._coarse_size((h, w))
+        bboxes, kpss = self._detect_scaled(image, size)
+        if size < self.det_size and not self._confident(bboxes, size / max(h, w)):
+            size = self.det_size
+            bboxes, kpss = self._detect_scaled(image, size)
+        self._observe(bboxes, (h, w), size)
+        # Large photos are tiled only when the whole-image pass may have
+        # missed faces too small for it; that pass is reused, not repeated.
+        if (
+            size == self.det_size
+            and self._use_tiles(image)
+            and not self._confident(bboxes, self.det_size / max(h, w))
+        ):
+            return self.detect_faces_tiled(image, whole=(bboxes, kpss))
+
+        if len(bboxes) == 0:
             return [], [], []
-        
-        # Extract boxes, confidence scores, and landmarks
-        boxes = []
-        probs = []
-        landmarks = []
-        
-        for face in faces:
-            # Bounding box: [x1, y1, x2, y2]
-            bbox = face.bbox.astype(np.float32)
-            boxes.append(bbox)
-            
-            # Detection confidence score
-            probs.append(face.det_score)
-            
-            # Facial landmarks: 5 points (left_eye, right_eye, nose, left_mouth, right_mouth)
-            kps = face.kps.astype(np.float32)
-            landmarks.append(kps)
-        
-        return np.array(boxes), np.array(probs), np.array(landmarks)
\ No newline at end of file
+        # Boxes [x1, y1, x2, y2], detection scores, and 5-point landmarks
+        # (left_eye, right_eye, nose, left_mouth, right_mouth) in full-resolution pixels.
+        return bboxes[:, :4], bboxes[:, 4], kpss
+
+    def detect_faces_tiled(self, image, tile=None, overlap=None, whole=None):
+        """Detect at native resolution over overlapping tiles.
+
+        A downscaled whole-image pass finds faces larger than the overlap
+        (``whole`` passes in one already run); the tiles, run in parallel,
+        find the small back-row faces that vanish when a large photo is
+        squashed to the detector input.
+        """
+        h, w = image.shape[:2]
+        auto_tile, auto_overlap = choose_tiling(h, w, self.det_size)
+        tile = tile or auto_tile
+        overlap = auto_overlap if overlap is None else overlap
+
+        jobs = [] if whole is not None else [(0, 0, None)]
+        jobs += [(x, y, tile) for y in tile_origins(h, tile, overlap) for x in tile_origins(w, tile, overlap)]
+        results = list(self._tile_pool.map(lambda job: self._detect_region(image, *job), jobs))
+        if whole is not None:
+            results.append(whole)
+
+        dets = [d for d, _ in results if len(d)]
+        if not dets:
+            return [], [], []
+        dets = np.concatenate(dets)
+        kpss = np.concatenate([k for d, k in results if len(d)])
+        keep = nms(dets[:, :4], dets[:, 4])
+        return dets[keep, :4], dets[keep, 4], kpss[keep]
+
+    def _detect_scaled(self, image, size):
+        """Detect on a copy whose long side is ``size`` and map results back.
+
+        Alignment later crops from the original image, so embeddings keep
+        full-resolution pixels while detection pays for ``size``² only.
+        """
+        h, w = image.shape[:2]
+        scale = min(1.0, size / float(max(h, w)))
+        small = image if scale == 1.0 else cv2.resize(
+            image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA
+        )
+        bboxes, kpss = self.app.det_model.detect(small, input_size=(size, size))
+        if len(bboxes) == 0:
+            return np.zeros((0, 5), dtype=np.float32), np.zeros((0, 5, 2), dtype=np.float32)
+        bboxes = bboxes.astype(np.float32)
+        kpss = kpss.astype(np.float32)
+        if scale != 1.0:
+            bboxes[:, :4] /= scale
+            kpss /= scale
+        return bboxes, kpss
+
+    def _coarse_size(self, shape):
+        if self.scale_mode != "adaptive":
+            return self.det_size
+        with self._scale_lock:
+            self._calls += 1
+            fraction = self._face_fractions.get(shape)
+            # Re-probe at full size now and then in case smaller faces appear.
+            if fraction is None or self._calls % PROBE_EVERY == 0:
+                return self.det_size
+            # Leave headroom above the refine threshold in _confident.
+            size = 1.5 * MIN_FACE_PX / fraction
+        return int(np.clip(np.ceil(size / 32) * 32, MIN_DET_SIZE, self.det_size))
+
+    @staticmethod
+    def _confident(bboxes, scale):
+        # Nothing found, or faces close to the smallest the detector resolves
+        # at this scale: smaller ones may have been missed, so refine.
+        if len(bboxes) == 0:
+            return False
+        sides = np.minimum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1]) * scale
+        return float(sides.min()) >= 1.25 * MIN_FACE_PX
+
+    def _observe(self, bboxes, shape, size):
+        # Face sizes are learned per frame shape, i.e. per camera or phone,
+        # so a close-up never lowers the scale used for a wide shot.
+        if self.scale_mode != "adaptive" or len(bboxes) == 0 or size != self.det_size:
+            return
+        sides = np.minimum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1])
+        fraction = float(sides.min()) / max(shape)
+        with self._scale_lock:
+            previous = self._face_fractions.pop(shape, None)
+            if previous is not None and fraction > previous:
+                fraction = 0.9 * previous + 0.1 * fraction
+            self._face_fractions[shape] = fraction
+            while len(self._face_fractions) > 16:
+                self._face_fractions.pop(next(iter(self._face_fractions)))
+
+    def _use_tiles(self, image):
+        if self.tiling == "on":
+            return True
+        if self.tiling == "off":
+            return False
+        return max(image.shape[:2]) > TILE_TRIGGER * self.det_size
+
+    def _detect_region(self, image, x, y, tile):
+        if tile is None:
+            return self._detect_scaled(image, self.det_size)
+        crop = image[y:y + tile, x:x + tile]
+        ch, cw = crop.shape[:2]
+        if ch < tile or cw < tile:
+            # Pad edge tiles so every tile runs at scale 1.
+            crop = cv2.copyMakeBorder(crop, 0, tile - ch, 0, tile - cw, cv2.BORDER_CONSTANT)
+        bboxes, kpss = self.app.det_model.detect(crop, input_size=(tile, tile))
+        if len(bboxes) == 0:
+            return np.zeros((0, 5), dtype=np.float32), np.zeros((0, 5, 2), dtype=np.float32)
+        bboxes = bboxes.astype(np.float32)
+        kpss = kpss.astype(np.float32)
+        bboxes[:, [0, 2]] += x
+        bboxes[:, [1, 3]] += y
+        kpss[:, :, 0] += x
+        kpss[:, :, 1] += y
+        return bboxes, kpss
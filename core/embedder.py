@@ -1,26 +1,119 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
 import numpy as np
 import insightface
 from insightface.utils import face_align
 
+from core.alignment import estimate_norm_batch
+from core.model_opt import load_variant, session_options
+from core.model_packs import ensure_pack, get_pack, model_id
+
+
+class BatchAligner:
+    """Warp many faces into one preallocated ``(N, 112, 112, 3)`` buffer.
+
+    Warps run on a thread pool (``cv2.warpAffine`` releases the GIL). The
+    buffer belongs to the calling thread and is reused by its next call, so
+    consume it (e.g. embed it) before aligning again.
+    """
+
+    def __init__(self, image_size=112, workers=None):
+        self.image_size = image_size
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers or min(4, os.cpu_count() or 1),
+            thread_name_prefix="camattend-align",
+        )
+        self._local = threading.local()
+
+    def align(self, image, landmarks):
+        landmarks = np.asarray(landmarks, dtype=np.float32).reshape(-1, 5, 2)
+        return self.align_many([image] * len(landmarks), landmarks)
+
+    def align_many(self, images, landmarks):
+        """Align face ``i`` of ``landmarks`` from ``images[i]``; frames may differ."""
+        matrices = estimate_norm_batch(landmarks, self.image_size)
+        out = self._buffer(len(matrices))
+        size = (self.image_size, self.image_size)
+
+        def _warp(i):
+            cv2.warpAffine(images[i], matrices[i], size, dst=out[i], borderValue=0.0)
+
+        if len(matrices) <= 2:
+            for i in range(len(matrices)):
+                _warp(i)
+        else:
+            list(self._pool.map(_warp, range(len(matrices))))
+        return out
+
+    def _buffer(self, n):
+        buf = getattr(self._local, "buf", None)
+        if buf is None or len(buf) < n:
+            capacity = max(n, 2 * (len(buf) if buf is not None else 4))
+            buf = self._local.buf = np.empty(
+                (capacity, self.image_size, self.image_size, 3), dtype=np.uint8
+            )
+        return buf[:n]
+
 
 class FaceEmbedder:
-    def __init__(self):
+    def __init__(self, pack=None):
+        self.pack = get_pack(pack)
+        self.model_id = model_id(self.pack)
+        ensure_pack(self.pack["name"])
         # Use CPU provider explicitly for cloud environments without CUDA.
         self.app = insightface.app.FaceAnalysis(
-            name="buffalo_l",
+            name=self.pack["name"],
+            allowed_modules=["detection", "recognition"],
             providers=["CPUExecutionProvider"],
+            sess_options=session_options(),
         )
-        self.app.prepare(ctx_id=-1)
+        self.app.prepare(ctx_id=-1, det_size=(self.pack["det_size"], self.pack["det_size"]))
         self.rec_model = self.app.models['recognition']
+        self.embedding_dim = self.rec_model.output_shape[1]
+        if self.embedding_dim != self.pack["embedding_dim"]:
+            raise ValueError(
+                f"{self.pack['name']} recognizer returns {self.embedding_dim}-d embeddings, "
+                f"expected {self.pack['embedding_dim']}"
+            )
+        self.variant = load_variant(self.rec_model)
+        self.aligner = BatchAligner(image_size=self.pack["align_size"])
 
     def get_embedding(self, image, bbox=None, landmark=None):
         if bbox is not None and landmark is not None:
             landmark = np.array(landmark, dtype=np.float32)
-            aligned_face = face_align.norm_crop(image, landmark=landmark)
+            aligned_face = face_align.norm_crop(image, landmark=landmark, image_size=self.aligner.image_size)
             embedding = self.rec_model.get_feat([aligned_face])[0]
             return embedding
         else:
             faces = self.app.get(image)
             if len(faces) == 0:
                 return None
-            return faces[0].embedding
\ No newline at end of file
+            return faces[0].embedding
+
+    def align(self, image, landmark):
+        return face_align.norm_crop(
+            image, landmark=np.asarray(landmark, dtype=np.float32), image_size=self.aligner.image_size
+        )
+
+    def embed_aligned(self, aligned_faces):
+        # One ONNX run for the whole batch instead of one per face.
+        if len(aligned_faces) == 0:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        if isinstance(aligned_faces, np.ndarray) and aligned_faces.ndim == 4:
+            # Straight from the aligner's buffer: BGR NHWC uint8 → RGB NCHW float.
+            batch = aligned_faces[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32)
+            return self.rec_model.forward(batch)
+        return self.rec_model.get_feat(list(aligned_faces))
+
+    def get_embeddings(self, image, landmarks):
+        if len(landmarks) == 0:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        return self.embed_aligned(self.aligner.align(image, landmarks))
+
+    def get_embeddings_many(self, images, landmarks):
+        if len(landmarks) == 0:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        return self.embed_aligned(self.aligner.align_many(images, landmarks))
@@ -0,0 +1,103 @@
+from typing import Dict, List
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+FUSION_MODES = ("max", "consensus")
+
+
+def assign_identities(candidates: List[Dict], threshold: float) -> List[Dict]:
+    """Give every student at most one face within a single photo.
+
+    When several faces have the same top-1 student, the faces and their
+    top-k students above ``threshold`` are solved as one assignment
+    (Hungarian, maximising the summed margin over ``threshold``). A face
+    that loses its student is demoted to its best free candidate, or below
+    the threshold (unknown); either way ``demoted_from`` is set.
+    """
+    top1 = [
+        c["student_id"] for c in candidates
+        if c["student_id"] is not None and c["score"] is not None and c["score"] > threshold
+    ]
+    if len(top1) == len(set(top1)):
+        return candidates
+
+    faces = [
+        i for i, c in enumerate(candidates)
+        if c["student_id"] is not None and c["score"] is not None and c["score"] > threshold
+    ]
+    students = sorted({sid for i in faces for sid, sc in candidates[i]["topk"] if sc > threshold})
+    column = {sid: j for j, sid in enumerate(students)}
+    # One "unknown" column per face, worth nothing; a real student is worth
+    # how far it clears the threshold.
+    gain = np.full((len(faces), len(students) + len(faces)), -1.0)
+    for row, i in enumerate(faces):
+        gain[row, len(students) + row] = 0.0
+        for sid, sc in candidates[i]["topk"]:
+            if sc > threshold:
+                gain[row, column[sid]] = sc - threshold
+    rows, cols = linear_sum_assignment(gain, maximize=True)
+
+    assigned = {faces[r]: (students[c] if c < len(students) else None) for r, c in zip(rows, cols)}
+    taken = {sid for sid in assigned.values() if sid is not None}
+    out = list(candidates)
+    for i, sid in assigned.items():
+        cand = candidates[i]
+        if sid == cand["student_id"]:
+            continue
+        free = [t for t in cand["topk"] if t[0] != sid and t[0] not in taken]
+        topk = [t for t in cand["topk"] if t[0] == sid] + free
+        demoted = dict(cand, topk=topk, demoted_from=cand["student_id"])
+        # Demoted to unknown: whatever is left scores at or below the threshold.
+        demoted["student_id"], demoted["score"] = topk[0] if topk else (None, None)
+        out[i] = demoted
+    return out
+
+
+def fuse_candidates(
+    per_photo: List[List[Dict]], threshold: float, mode: str = "max"
+) -> List[Dict]:
+    """Merge face candidates from several photos of the same lecture.
+
+    Every student matched above ``threshold`` in any photo becomes a single
+    candidate, so the agent and the database see each student once. ``max``
+    keeps the best score over all sightings; ``consensus`` uses the
+    quality-weighted mean of the scores. Faces that matched nobody are kept
+    per face, since there is no identity to merge them on. Within a photo,
+    each student is first given to one face only (``assign_identities``).
+    """
+    if mode not in FUSION_MODES:
+        raise ValueError(f"Unknown fusion mode '{mode}', expected one of {FUSION_MODES}")
+
+    by_student: Dict[str, List[Dict]] = {}
+    fused: List[Dict] = []
+    for candidates in per_photo:
+        for cand in assign_identities(candidates, threshold):
+            known = (
+                cand["student_id"] is not None
+                and cand["score"] is not None
+                and cand["score"] > threshold
+            )
+            if known:
+                by_student.setdefault(cand["student_id"], []).append(cand)
+            else:
+                fused.append(cand)
+
+    for student_id, sightings in by_student.items():
+        best = max(sightings, key=lambda c: (c["score"], c["quality"]))
+        scores = np.array([c["score"] for c in sightings], dtype=np.float32)
+        if mode == "max":
+            score = float(scores.max())
+        else:
+            weights = np.array([max(c["quality"], 1e-3) for c in sightings], dtype=np.float32)
+            score = float(np.average(scores, weights=weights))
+
+        merged = dict(best)
+        merged["score"] = score
+        merged["quality"] = float(max(c["quality"] for c in sightings))
+        merged["sightings"] = [s for c in sightings for s in c["sightings"]]
+        merged["support"] = len(sightings)
+        fused.append(merged)
+
+    return fused
@@ -0,0 +1,132 @@
+import io
+import os
+import threading
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+
+# EXIF orientation tag value → OpenCV operations that undo it.
+_ORIENTATION_OPS = {
+    2: (None, 1),
+    3: (cv2.ROTATE_180, None),
+    4: (None, 0),
+    5: ("transpose", None),
+    6: (cv2.ROTATE_90_CLOCKWISE, None),
+    7: ("transpose", -1),
+    8: (cv2.ROTATE_90_COUNTERCLOCKWISE, None),
+}
+
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def default_max_side() -> Optional[int]:
+    value = int(os.getenv("IMAGE_MAX_SIDE", "0") or 0)
+    return value or None
+
+
+def probe_image(data: bytes) -> Tuple[Tuple[int, int], int]:
+    """Return ``((width, height), exif_orientation)`` without decoding pixels."""
+    with Image.open(io.BytesIO(data)) as image:
+        try:
+            orientation = int(image.getexif().get(0x0112, 1))
+        except Exception:
+            orientation = 1
+        return image.size, orientation
+
+
+class ImageDecoder:
+    """Decode encoded photos straight to the BGR uint8 layout the models use.
+
+    The compressed bytes are wrapped without copying, EXIF orientation is
+    applied, and JPEGs larger than ``max_side`` are decoded at 1/2, 1/4 or
+    1/8 scale by the codec itself (DCT scaling) so the full-size frame never
+    exists in memory. With ``reuse=True`` the rotated/resized output is
+    written into a per-thread scratch buffer that is recycled on the next
+    call; use it only when the caller is done with the image by then.
+    """
+
+    def __init__(self, max_side: Optional[int] = None, reuse: bool = False):
+        self.max_side = max_side
+        self.reuse = reuse
+        self._local = threading.local()
+
+    def decode(self, data: bytes, max_side: Optional[int] = None) -> np.ndarray:
+        max_side = max_side or self.max_side
+        try:
+            (width, height), orientation = probe_image(data)
+        except Exception:
+            (width, height), orientation = (0, 0), 1
+
+        flags = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+        if max_side and max(width, height) > max_side:
+            for factor, reduced in _REDUCED_FLAGS:
+                if max(width, height) // factor >= max_side:
+                    flags = reduced | cv2.IMREAD_IGNORE_ORIENTATION
+                    break
+
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        if image is None:
+            return self._decode_with_pil(data, max_side)
+
+        image = self._orient(image, orientation)
+        if max_side and max(image.shape[:2]) > max_side:
+            scale = max_side / float(max(image.shape[:2]))
+            size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+            image = cv2.resize(
+                image, size, dst=self._scratch("resize", (size[1], size[0], 3)),
+                interpolation=cv2.INTER_AREA,
+            )
+        return image
+
+    def _orient(self, image: np.ndarray, orientation: int) -> np.ndarray:
+        ops = _ORIENTATION_OPS.get(orientation)
+        if ops is None:
+            return image
+        rotate, flip = ops
+        h, w = image.shape[:2]
+        if rotate == "transpose":
+            image = cv2.transpose(image, dst=self._scratch("orient", (w, h, 3)))
+        elif rotate is not None:
+            shape = (h, w, 3) if rotate == cv2.ROTATE_180 else (w, h, 3)
+            image = cv2.rotate(image, rotate, dst=self._scratch("orient", shape))
+        if flip is not None:
+            # Flipping in place avoids another full-frame buffer.
+            cv2.flip(image, flip, dst=image)
+        return image
+
+    def _scratch(self, name: str, shape) -> Optional[np.ndarray]:
+        if not self.reuse:
+            return None
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buf = buffers.get(name)
+        if buf is None or buf.shape != tuple(shape):
+            buf = buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buf
+
+    @staticmethod
+    def _decode_with_pil(data: bytes, max_side: Optional[int]) -> np.ndarray:
+        # Formats OpenCV cannot read; slower but complete.
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if max_side:
+                image.draft("RGB", (max_side, max_side))
+                image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            rgb = np.asarray(image.convert("RGB"))
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+_default_decoder = ImageDecoder()
+
+
+def decode_image(data: bytes, max_side: Optional[int] = None) -> np.ndarray:
+    """Decode to a fresh BGR array (safe to cache), honouring ``IMAGE_MAX_SIDE``."""
+    return _default_decoder.decode(data, max_side=max_side or default_max_side())
@@ -0,0 +1,188 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """A unit of background work with structured, pollable stage progress.
+
+    The worker function receives the job and reports progress through
+    ``start_stage``/``report``. Both raise ``JobCancelled`` once the job has
+    been cancelled, so cancellation takes effect at the next checkpoint.
+    """
+
+    def __init__(self, kind: str, lecture_id: Optional[str], label: str = ""):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.lecture_id = lecture_id
+        self.label = label
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.message = ""
+        self.stages: List[Dict] = []
+        self.result = None
+        self.error: Optional[str] = None
+        self.attached = False
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self.status in {"done", "failed", "cancelled"}
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def check(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def start_stage(self, name: str, message: str = "") -> None:
+        self.check()
+        now = time.time()
+        with self._lock:
+            if self.stages and self.stages[-1]["finished_at"] is None:
+                self.stages[-1]["finished_at"] = now
+            self.stages.append({"name": name, "started_at": now, "finished_at": None})
+            self.stage = name
+            self.progress = 0.0
+            self.message = message
+
+    def report(self, progress: float, message: str = "") -> None:
+        self.check()
+        with self._lock:
+            self.progress = max(0.0, min(1.0, float(progress)))
+            if message:
+                self.message = message
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "lecture_id": self.lecture_id,
+                "label": self.label,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": self.progress,
+                "message": self.message,
+                "stages": [dict(s) for s in self.stages],
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+    def _finish(self, status: str, result=None, error: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            if self.stages and self.stages[-1]["finished_at"] is None:
+                self.stages[-1]["finished_at"] = now
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = now
+            if status == "done":
+                self.progress = 1.0
+
+
+class JobQueue:
+    """Thread-pool backed queue of ``Job`` objects.
+
+    Jobs outlive the Streamlit script run that submitted them; the page only
+    polls ``jobs()`` for status and collects finished results.
+    """
+
+    def __init__(self, max_workers: int = 2, max_finished: int = 50):
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="camattend-job"
+        )
+        self._jobs: Dict[str, Job] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        fn: Callable[..., object],
+        *args,
+        kind: str = "recognize",
+        lecture_id: Optional[str] = None,
+        label: str = "",
+        **kwargs,
+    ) -> str:
+        job = Job(kind=kind, lecture_id=lecture_id, label=label)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._futures[job.id] = self._executor.submit(self._run, job, fn, args, kwargs)
+            self._prune()
+        return job.id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def jobs(self, lecture_id: Optional[str] = None) -> List[Job]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if lecture_id is not None:
+            jobs = [j for j in jobs if j.lecture_id == lecture_id]
+        return sorted(jobs, key=lambda j: j.created_at)
+
+    def active(self, lecture_id: Optional[str] = None) -> List[Job]:
+        return [j for j in self.jobs(lecture_id) if not j.done]
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        job.cancel()
+        future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            job._finish("cancelled")
+        return True
+
+    def cancel_lecture(self, lecture_id: str) -> int:
+        return sum(1 for j in self.active(lecture_id) if self.cancel(j.id))
+
+    def shutdown(self, wait: bool = False) -> None:
+        for job in self.active():
+            job.cancel()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    # ── private helpers ─────────────────────────────────────────────────────
+
+    def _run(self, job: Job, fn, args, kwargs) -> None:
+        if job.cancelled:
+            job._finish("cancelled")
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            job._finish("cancelled")
+        except Exception as exc:
+            job._finish("failed", error=f"{type(exc).__name__}: {exc}")
+        else:
+            job._finish("done", result=result)
+
+    def _prune(self) -> None:
+        finished = [j for j in self._jobs.values() if j.done and j.attached]
+        finished.sort(key=lambda j: j.finished_at or 0)
+        for job in finished[: max(0, len(finished) - self.max_finished)]:
+            self._jobs.pop(job.id, None)
+            self._futures.pop(job.id, None)
@@ -7,6 +7,9 @@ from typing import Annotated, Dict, List, Optional, TypedDict
 
 from dotenv import load_dotenv
 
+from core import margins
+from core.session_store import SessionStore
+
 load_dotenv()
 
 try:
@@ -41,6 +44,7 @@ class AttendanceState(TypedDict):
     previous_errors: int
     low_conf_ratio: float
     total_faces: int
+    score_margin: Optional[float]
     unknown_frequency: int
     uncertainty_score: float
 
@@ -80,12 +84,21 @@ class LangGraphAttendanceAgent:
     MED_CONF = 0.65
     LOW_CONF = 0.45
 
+    # Lead of the best student over the runner-up; see core.margins.
+    CLEAR_MARGIN = margins.CLEAR_MARGIN
+    AMBIGUOUS_MARGIN = margins.AMBIGUOUS_MARGIN
+
     GRACE = 5
     LATE_WIN = 15
     REVIEW_WIN = 30
     ABSENT_WIN = 45
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "llama-3.1-8b-instant"):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "llama-3.1-8b-instant",
+        session_store: Optional[SessionStore] = None,
+    ):
         raw_key = (
             api_key
             or os.getenv("groq_api")
@@ -96,7 +109,15 @@ class LangGraphAttendanceAgent:
         self.api_key = raw_key.strip("'\"") if raw_key else None
         self.model = model
         self.groq_client = Groq(api_key=self.api_key) if self.api_key and Groq else None
-        self.session_memory: Dict[str, Dict] = {}
+        if session_store is None:
+            session_store = SessionStore(
+                max_sessions=int(os.getenv("AGENT_MAX_SESSIONS", "64")),
+                max_observations=int(os.getenv("AGENT_MAX_OBSERVATIONS", "500")),
+                idle_ttl=float(os.getenv("AGENT_SESSION_TTL_SECONDS", str(6 * 3600))),
+                snapshot_path=os.getenv("AGENT_SESSION_SNAPSHOT") or None,
+            )
+            session_store.restore()
+        self.session_memory = session_store
         self.graph = self._build_graph()
 
     # ── graph construction ──────────────────────────────────────────────────
@@ -148,6 +169,7 @@ class LangGraphAttendanceAgent:
                 "llm"
                 if (
                     self.MED_CONF <= s.get("confidence_score", 0) < self.HIGH_CONF
+                    and not self._clear_margin(s)
                     and self.groq_client is not None
                 )
                 else "rule"
@@ -189,6 +211,7 @@ class LangGraphAttendanceAgent:
             "previous_errors": int(ctx.get("previous_recognition_errors", 0)),
             "low_conf_ratio": float(ctx.get("low_conf_ratio", 0.0)),
             "total_faces": int(ctx.get("total_faces", 1)),
+            "score_margin": ctx.get("score_margin"),
             "unknown_frequency": 0,
             "trace": [
                 f"preprocess → student={state['student_name']} "
@@ -284,26 +307,35 @@ class LangGraphAttendanceAgent:
         )
         unknown_risk = 1.0 if is_unknown else 0.0
         crowd_risk = max(0.0, min(1.0, low_conf_ratio))
+        margin = state.get("score_margin")
+        # No runner-up means no look-alike to confuse the match with.
+        ambiguity_risk = margins.ambiguity_risk(margin, is_unknown)
 
         score = round(
             max(
                 0.0,
                 min(
                     1.0,
-                    0.32 * conf_risk
-                    + 0.14 * quality_risk
-                    + 0.14 * error_risk
-                    + 0.12 * timing_risk
-                    + 0.12 * history_risk
-                    + 0.10 * unknown_risk
-                    + 0.06 * crowd_risk,
+                    # Weights sum to 1.0.
+                    0.28 * conf_risk
+                    + 0.12 * quality_risk
+                    + 0.12 * error_risk
+                    + 0.11 * timing_risk
+                    + 0.11 * history_risk
+                    + 0.09 * unknown_risk
+                    + 0.05 * crowd_risk
+                    + 0.12 * ambiguity_risk,
                 ),
             ),
             3,
         )
+        margin_note = f" margin={margin:.3f}" if margin is not None else ""
         return {
             "uncertainty_score": score,
-            "trace": [f"compute_uncertainty → score={score:.3f}"],
+            "trace": [
+                f"compute_uncertainty → score={score:.3f}{margin_note}"
+                + (" (clear, rules only)" if self._clear_margin(state) else "")
+            ],
         }
 
     def _node_rule_decision(self, state: AttendanceState) -> dict:
@@ -348,15 +380,30 @@ class LangGraphAttendanceAgent:
             decision, action = "ABSENT", "ESCALATE_TO_INSTRUCTOR"
             parts.append(f"Beyond attendance window ({time_offset:.1f}min).")
 
+        margin = state.get("score_margin")
+        # A runner-up inside CLEAR_MARGIN raises uncertainty; it must never be
+        # what lifts a medium-confidence face out of the soft flag.
+        close_runner_up = margins.close_runner_up(margin)
         if (
             self.MED_CONF <= conf < self.HIGH_CONF
-            and uncertainty < 0.60
+            and (uncertainty < 0.60 or close_runner_up)
             and decision in {"PRESENT", "LATE"}
         ):
             requires_review = True
             action = "SOFT_FLAG"
             parts.append("Medium confidence — soft flagged for optional review.")
 
+        if (
+            margins.ambiguous(margin)
+            and not state.get("is_unknown")
+            and decision in {"PRESENT", "LATE"}
+        ):
+            requires_review = True
+            action = "SOFT_FLAG"
+            parts.append(
+                f"Runner-up student scores within {margin:.2f} — identity soft flagged for review."
+            )
+
         if conf < self.MED_CONF and history.get("avg_attendance", 0) < 0.5:
             decision, requires_review, action = "FLAGGED", True, "ESCALATE_TO_INSTRUCTOR"
             parts.append("Low confidence combined with poor attendance history.")
@@ -413,6 +460,7 @@ Policy:
 - LATE: reliable face, after grace period but within late window
 - ABSENT: far outside attendance window
 - FLAGGED: missing history, borderline confidence/timing, needs human review
+- A small score_margin in Context means another enrolled student matches almost as well; prefer FLAGGED
 
 Return ONLY valid JSON (no markdown, no extra text):
 {{"decision": "PRESENT|LATE|ABSENT|FLAGGED", "confidence_score": 0.0, "reasoning": "...", "requires_review": true}}"""
@@ -468,6 +516,11 @@ Return ONLY valid JSON (no markdown, no extra text):
             fallback["trace"] = [f"llm_decision → LLM failed ({exc}), rule fallback"]
             return fallback
 
+    def _clear_margin(self, state) -> bool:
+        """The best student leads the runner-up by enough that the LLM adds nothing."""
+        margin = state.get("score_margin")
+        return margin is not None and not state.get("is_unknown") and not margins.close_runner_up(margin)
+
     def _node_finalize(self, state: AttendanceState) -> dict:
         session_id = state.get("session_id")
         if session_id:
@@ -510,6 +563,7 @@ Return ONLY valid JSON (no markdown, no extra text):
             "previous_errors": 0,
             "low_conf_ratio": 0.0,
             "total_faces": 1,
+            "score_margin": None,
             "unknown_frequency": 0,
             "uncertainty_score": 0.0,
             "decision": "FLAGGED",
@@ -542,17 +596,22 @@ Return ONLY valid JSON (no markdown, no extra text):
         }
 
     def get_session_summary(self, session_id: str) -> Dict:
-        obs = self.session_memory.get(session_id, {}).get("observations", [])
-        summary: Dict[str, int] = {"PRESENT": 0, "LATE": 0, "ABSENT": 0, "FLAGGED": 0}
-        for o in obs:
-            d = o.get("decision", "FLAGGED")
-            summary[d] = summary.get(d, 0) + 1
-        return {
-            "session_id": session_id,
-            "total_observations": len(obs),
-            "summary": summary,
-            "observations": obs,
-        }
+        return self.session_memory.summary(session_id)
+
+    def assign_unknown_face(self, session_id: Optional[str], embedding) -> Dict:
+        if not session_id or embedding is None:
+            return {"cluster_id": None, "count": 0}
+        cluster_id, count = self.session_memory.assign_unknown(session_id, embedding)
+        return {"cluster_id": cluster_id, "count": count}
+
+    def end_session(self, session_id: str) -> Dict:
+        summary = self.session_memory.summary(session_id)
+        self.session_memory.drop(session_id)
+        try:
+            self.session_memory.snapshot()
+        except OSError:
+            pass
+        return summary
 
     def batch_process_recognitions(
         self,
@@ -586,18 +645,11 @@ Return ONLY valid JSON (no markdown, no extra text):
     ) -> int:
         if not session_id or not sig:
             return 0
-        session = self.session_memory.setdefault(
-            session_id, {"observations": [], "unknown_faces": {}}
-        )
-        unknown_faces = session.setdefault("unknown_faces", {})
-        unknown_faces[sig] = unknown_faces.get(sig, 0) + 1
-        return unknown_faces[sig]
+        return self.session_memory.unknown_count(session_id, sig)
 
     def _record_session(self, session_id: str, state: dict) -> None:
-        self.session_memory.setdefault(
-            session_id, {"observations": [], "unknown_faces": {}}
-        )
-        self.session_memory[session_id]["observations"].append(
+        self.session_memory.record(
+            session_id,
             {
                 "student_name": state.get("student_name"),
                 "decision": state.get("decision"),
@@ -607,7 +659,7 @@ Return ONLY valid JSON (no markdown, no extra text):
                 "requires_review": state.get("requires_review", False),
                 "agent_type": state.get("agent_type"),
                 "time_offset_minutes": state.get("time_offset_minutes"),
-            }
+            },
         )
 
     def _summarize_recent_attendance(self, records: List[Dict]) -> str:
@@ -0,0 +1,35 @@
+"""Runner-up margins: how far the best enrolled student leads the next one.
+
+Shared by the pipeline, which measures them from the top-k search, and the
+attendance agent, which turns them into uncertainty and soft flags.
+"""
+from typing import List, Optional
+
+
+# Lead of the best student over the runner-up (cosine similarity). At or
+# above CLEAR_MARGIN no enrolled look-alike competes with the match; below
+# AMBIGUOUS_MARGIN the two are a coin toss.
+CLEAR_MARGIN = 0.20
+AMBIGUOUS_MARGIN = 0.05
+
+
+def score_margin(topk: List) -> Optional[float]:
+    """How far the best student is ahead of the runner-up; None without a runner-up."""
+    if len(topk) < 2:
+        return None
+    return float(topk[0][1]) - float(topk[1][1])
+
+
+def ambiguity_risk(margin: Optional[float], is_unknown: bool = False) -> float:
+    """0 for a clear lead (or no runner-up at all), rising to 1 for a tie."""
+    if margin is None or is_unknown:
+        return 0.0
+    return 1.0 - max(0.0, min(1.0, margin / CLEAR_MARGIN))
+
+
+def close_runner_up(margin: Optional[float]) -> bool:
+    return margin is not None and margin < CLEAR_MARGIN
+
+
+def ambiguous(margin: Optional[float]) -> bool:
+    return margin is not None and margin < AMBIGUOUS_MARGIN
@@ -1,24 +1,193 @@
+import itertools
+import os
+import threading
+from collections import Counter
+
 import faiss
 import numpy as np
 
+from core.model_packs import get_pack
+
+
+AGGREGATES = ("max", "top2")
+MAX_ROSTER_VIEWS = 16
+# Serial numbers for roster views; unlike id(), never reused once a view is freed.
+_roster_serials = itertools.count(1)
+
 
 class FaceMatcher:
-    def __init__(self, dim=512):
+    def __init__(self, dim=None, aggregate=None):
+        # Defaults to the embedding size of the active model pack (MODEL_PACK).
+        dim = dim or get_pack()["embedding_dim"]
         self.index = faiss.IndexFlatIP(dim)
         self.student_ids = []
+        # Students may hold several templates. "max" scores a student by the
+        # best template; "top2" averages the best two (one if only one hits).
+        self.aggregate = (aggregate or os.getenv("MATCH_AGGREGATE", "max")).lower()
+        self._templates = Counter()
+        self._rosters = {}
+        # Bumped on every gallery change so cached match results can be invalidated.
+        self.version = 0
 
     def add_embedding(self, embedding, student_id):
         embedding = embedding / np.linalg.norm(embedding)
         embedding = np.array([embedding]).astype("float32")
         self.index.add(embedding)
         self.student_ids.append(student_id)
+        self._templates[student_id] += 1
+        self.version += 1
+
+    def add_embeddings(self, embeddings, student_ids):
+        # One index update (and one version bump) for a whole batch.
+        embeddings = np.asarray(embeddings, dtype="float32").reshape(-1, self.index.d)
+        if len(embeddings) == 0:
+            return
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        self.index.add(np.ascontiguousarray(embeddings))
+        self.student_ids.extend(student_ids)
+        self._templates.update(student_ids)
+        self.version += 1
+
+    def search(self, embeddings, k=5):
+        """Top-``k`` distinct students per query, best first.
+
+        With several templates per student the index is searched deeper, so
+        that ``k`` distinct students survive once hits are grouped.
+        """
+        embeddings = np.asarray(embeddings, dtype="float32").reshape(-1, self.index.d)
+        if embeddings.shape[0] == 0:
+            return [], np.zeros((0, k), dtype="float32")
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        per_student = max(self._templates.values(), default=1)
+        if per_student == 1:
+            distances, indices = self.index.search(np.ascontiguousarray(embeddings), k)
+            ids = [
+                [self.student_ids[idx] if idx != -1 else None for idx in row]
+                for row in indices
+            ]
+            return ids, distances
+
+        depth = min(self.index.ntotal, k * per_student)
+        distances, indices = self.index.search(np.ascontiguousarray(embeddings), depth)
+        ids = []
+        scores = np.full((len(embeddings), k), np.finfo(np.float32).min, dtype=np.float32)
+        for row, (row_dist, row_idx) in enumerate(zip(distances, indices)):
+            hits = {}
+            for dist, idx in zip(row_dist, row_idx):
+                if idx != -1:
+                    hits.setdefault(self.student_ids[idx], []).append(float(dist))
+            ranked = sorted(
+                ((sid, self._combine(h)) for sid, h in hits.items()), key=lambda x: -x[1]
+            )[:k]
+            ids.append([sid for sid, _ in ranked] + [None] * (k - len(ranked)))
+            scores[row, :len(ranked)] = [score for _, score in ranked]
+        return ids, scores
+
+    def vectors(self):
+        """Every stored template (normalized) with its student id, in index order."""
+        if self.index.ntotal == 0:
+            return [], np.zeros((0, self.index.d), dtype="float32")
+        return list(self.student_ids), self.index.reconstruct_n(0, self.index.ntotal)
+
+    def for_roster(self, student_ids, fallback_below=None):
+        """A view that only searches ``student_ids`` (e.g. a course roster).
+
+        Views are cached per roster; each builds its own sub-index on first
+        use and again after the gallery changes. With ``fallback_below``,
+        faces whose best roster score is under it are searched org-wide too.
+        """
+        key = (frozenset(student_ids), fallback_below)
+        view = self._rosters.get(key)
+        if view is None:
+            if len(self._rosters) >= MAX_ROSTER_VIEWS:
+                self._rosters.pop(next(iter(self._rosters)))
+            view = self._rosters[key] = RosterMatcher(self, key[0], fallback_below)
+        return view
+
+    def _combine(self, hits):
+        # Hits arrive best first.
+        if self.aggregate == "top2" and len(hits) > 1:
+            return (hits[0] + hits[1]) / 2.0
+        return hits[0]
 
     def match(self, embedding):
-        embedding = embedding / np.linalg.norm(embedding)
-        embedding = np.array([embedding]).astype("float32")
-        distances, indices = self.index.search(embedding, k=1)
-        idx = indices[0][0]
-        if idx == -1:
+        ids, distances = self.search(embedding, k=1)
+        student_id = ids[0][0]
+        if student_id is None:
             return None, None
-        student_id = self.student_ids[idx]
-        return student_id, distances[0][0]
\ No newline at end of file
+        return student_id, distances[0][0]
+
+    def stats(self):
+        """Gallery size and the per-student storage and search cost."""
+        students = len(self._templates)
+        vectors = self.index.ntotal
+        vector_bytes = self.index.d * 4
+        return {
+            "students": students,
+            "vectors": vectors,
+            "templates_per_student": round(vectors / students, 2) if students else 0.0,
+            "bytes": vectors * vector_bytes,
+            "bytes_per_student": round(vectors * vector_bytes / students) if students else 0,
+            # A flat index compares every query with every vector.
+            "dot_products_per_query": vectors,
+        }
+
+
+class RosterMatcher:
+    """``FaceMatcher.search`` over a subset of students; see ``FaceMatcher.for_roster``."""
+
+    def __init__(self, parent, roster, fallback_below=None):
+        self.parent = parent
+        self.roster = roster
+        self.fallback_below = fallback_below
+        self.fallbacks = 0
+        self._serial = next(_roster_serials)
+        self._sub = None
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        # Distinct from the org-wide matcher so cached matches are not shared.
+        return ("roster", self._serial, self.parent.version)
+
+    @property
+    def index(self):
+        return self._view().index
+
+    def _view(self):
+        with self._lock:
+            if self._built_at != self.parent.version:
+                ids, vectors = self.parent.vectors()
+                keep = [i for i, sid in enumerate(ids) if sid in self.roster]
+                sub = FaceMatcher(dim=self.parent.index.d, aggregate=self.parent.aggregate)
+                sub.add_embeddings(vectors[keep], [ids[i] for i in keep])
+                self._sub, self._built_at = sub, self.parent.version
+            return self._sub
+
+    def search(self, embeddings, k=5):
+        ids, scores = self._view().search(embeddings, k=k)
+        if self.fallback_below is None or len(ids) == 0:
+            return ids, scores
+        misses = [i for i, row in enumerate(scores) if row[0] < self.fallback_below]
+        if misses:
+            embeddings = np.asarray(embeddings, dtype="float32").reshape(-1, self.parent.index.d)
+            wide_ids, wide_scores = self.parent.search(embeddings[misses], k=k)
+            scores = np.array(scores, copy=True)
+            for row, i in enumerate(misses):
+                if wide_scores[row][0] > scores[i][0]:
+                    ids[i], scores[i] = wide_ids[row], wide_scores[row]
+                    self.fallbacks += 1
+        return ids, scores
+
+    def match(self, embedding):
+        ids, distances = self.search(embedding, k=1)
+        student_id = ids[0][0]
+        if student_id is None:
+            return None, None
+        return student_id, distances[0][0]
+
+    def stats(self):
+        stats = self._view().stats()
+        stats["fallbacks"] = self.fallbacks
+        return stats
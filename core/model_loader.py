@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+
+STEPS = ("detector", "embedder", "agent", "warm-up")
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLoader:
+    """Load the face models on a background thread and warm them up.
+
+    Importing insightface/onnxruntime and creating the ONNX sessions takes
+    seconds, and the first inference of each session pays its own graph
+    initialization on top. The loader does all of it off the request path:
+    the UI starts it at login, renders immediately, and polls ``status()``
+    until ``ready``. The detector and embedder are thread-safe and shared by
+    every browser session in the process.
+    """
+
+    def __init__(self, warmup: Optional[bool] = None):
+        self.warmup = warmup if warmup is not None else os.getenv("MODEL_WARMUP", "1") != "0"
+        self.detector = None
+        self.embedder = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._state = {
+            "state": "idle",
+            "step": None,
+            "seconds": {},
+            "error": None,
+            "started_at": None,
+            "ready_at": None,
+        }
+
+    def start(self) -> "ModelLoader":
+        with self._lock:
+            if self._thread is None or (self._state["state"] == "failed" and not self._thread.is_alive()):
+                self._state.update(state="loading", error=None, started_at=time.time(), seconds={})
+                self._thread = threading.Thread(target=self._run, name="camattend-models", daemon=True)
+                self._thread.start()
+        return self
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {**self._state, "seconds": dict(self._state["seconds"])}
+
+    def _step(self, name: str, fn) -> None:
+        with self._lock:
+            self._state["step"] = name
+        started = time.perf_counter()
+        fn()
+        with self._lock:
+            self._state["seconds"][name] = round(time.perf_counter() - started, 2)
+
+    def _load_detector(self) -> None:
+        from core.detector import FaceDetector
+
+        self.detector = FaceDetector()
+
+    def _load_embedder(self) -> None:
+        from core.embedder import FaceEmbedder
+
+        self.embedder = FaceEmbedder()
+
+    @staticmethod
+    def _import_agent() -> None:
+        # Agents hold per-session memory, so only the slow langgraph/groq
+        # imports happen here; each browser session builds its own agent.
+        import core.langgraph_agent  # noqa: F401
+
+    def _run(self) -> None:
+        try:
+            self._step("detector", self._load_detector)
+            self._step("embedder", self._load_embedder)
+            self._step("agent", self._import_agent)
+            if self.warmup:
+                self._step("warm-up", self.warm_up)
+        except Exception as exc:
+            # The UI shows ``status()["error"]``; the traceback goes to the log.
+            with self._lock:
+                step = self._state["step"]
+                self._state.update(state="failed", error=f"{step}: {type(exc).__name__}: {exc}")
+            logger.exception("Loading face models failed at step %r", step)
+            return
+        with self._lock:
+            self._state.update(state="ready", step=None, ready_at=time.time())
+        self._ready.set()
+
+    def warm_up(self) -> None:
+        """Run each model once on synthetic input so real requests skip first-run costs."""
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 255, size=(720, 1280, 3), dtype=np.uint8)
+        self.detector.detect_faces(image)
+
+        # Four synthetic faces at different positions exercise the batched
+        # aligner and a multi-face recognition batch.
+        from insightface.utils import face_align
+
+        template = face_align.arcface_dst.astype(np.float32) * 2.0
+        landmarks = np.stack([template + np.float32([100 + 250 * i, 200]) for i in range(4)])
+        self.embedder.get_embeddings(image, landmarks)
+        self.embedder.get_embeddings(image, landmarks[:1])
+
+
+_LOADER: Optional[ModelLoader] = None
+_LOADER_LOCK = threading.Lock()
+
+
+def get_loader() -> ModelLoader:
+    """The process-wide loader; Streamlit reruns and sessions all share it."""
+    global _LOADER
+    with _LOADER_LOCK:
+        if _LOADER is None:
+            _LOADER = ModelLoader()
+        return _LOADER
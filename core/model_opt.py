@@ -0,0 +1,355 @@
+"""Optimized and INT8-quantized ONNX variants of the face models.
+
+Build and validate variants once, then select one at runtime with
+``MODEL_VARIANT``::
+
+    python -m core.model_opt build --variant int8-static --calibration calib_photos/
+    python -m core.model_opt check --variant int8-static --calibration calib_photos/
+    MODEL_VARIANT=int8-static streamlit run app.py
+
+``build`` writes ``<model>.<variant>.onnx`` files into ``MODEL_CACHE_DIR``
+and runs ``check``, which embeds the calibration faces with the fp32 and the
+variant recognition models and compares them. Quantized variants are only
+loaded when their last check passed.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+VARIANTS = ("fp32", "optimized", "int8-dynamic", "int8-static")
+QUANTIZED = ("int8-dynamic", "int8-static")
+# Minimum cosine similarity to the fp32 embedding of the same face.
+MIN_MEAN_COSINE = 0.99
+MIN_WORST_COSINE = 0.97
+MANIFEST = "manifest.json"
+# Intra-op threads per session unless ORT_INTRA_THREADS says otherwise.
+MAX_INTRA_THREADS = 4
+
+logger = logging.getLogger(__name__)
+
+
+def cache_dir() -> str:
+    path = os.getenv("MODEL_CACHE_DIR", os.path.join(".camattend", "models"))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def default_intra_threads() -> int:
+    return max(1, min(MAX_INTRA_THREADS, (os.cpu_count() or 1) // 2))
+
+
+def session_options(optimized_path: Optional[str] = None):
+    """ONNX Runtime options: full graph optimization and explicit thread counts.
+
+    ``ORT_INTRA_THREADS``/``ORT_INTER_THREADS`` size the pools. ORT's own
+    default of one thread per core, per session, oversubscribes the CPU once
+    the detector and embedder sessions run alongside the tile and worker
+    pools, so the intra-op default is half the cores, at most
+    ``MAX_INTRA_THREADS``; 0 restores ORT's default.
+    """
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    opts.intra_op_num_threads = int(os.getenv("ORT_INTRA_THREADS", str(default_intra_threads())))
+    opts.inter_op_num_threads = int(os.getenv("ORT_INTER_THREADS", "1"))
+    if optimized_path:
+        opts.optimized_model_filepath = optimized_path
+    return opts
+
+
+def variant_path(model_file: str, variant: str) -> str:
+    # Prefixed with the pack directory so packs sharing a file name never collide.
+    pack = os.path.basename(os.path.dirname(os.path.abspath(model_file)))
+    stem = os.path.splitext(os.path.basename(model_file))[0]
+    return os.path.join(cache_dir(), f"{pack}.{stem}.{variant}.onnx")
+
+
+def read_manifest() -> Dict:
+    path = os.path.join(cache_dir(), MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest: Dict) -> None:
+    path = os.path.join(cache_dir(), MANIFEST)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+# ── runtime ──────────────────────────────────────────────────────────────────
+
+def load_variant(model, variant: Optional[str] = None) -> str:
+    """Swap ``model.session`` for the requested variant; returns the variant in use.
+
+    ``optimized`` is built on first use. Quantized variants must have been
+    built and passed ``check``; otherwise the stock fp32 session is kept.
+    """
+    import onnxruntime as ort
+
+    variant = (variant or os.getenv("MODEL_VARIANT", "fp32")).lower()
+    if variant == "fp32" or variant not in VARIANTS:
+        return "fp32"
+
+    path = variant_path(model.model_file, variant)
+    providers = model.session.get_providers()
+    if variant == "optimized":
+        if not os.path.exists(path):
+            # Saving the optimized graph is a side effect of creating a session.
+            ort.InferenceSession(model.model_file, session_options(path), providers=providers)
+    else:
+        entry = read_manifest().get(os.path.basename(path))
+        forced = os.getenv("MODEL_VARIANT_FORCE") == "1"
+        if not os.path.exists(path) or not (forced or (entry and entry.get("passed"))):
+            logger.warning("%s missing or not validated; using fp32", os.path.basename(path))
+            return "fp32"
+
+    model.session = ort.InferenceSession(path, session_options(), providers=providers)
+    return variant
+
+
+# ── building ─────────────────────────────────────────────────────────────────
+
+def _array_reader(input_name: str, blobs: List[np.ndarray]):
+    """``CalibrationDataReader`` over a list of preprocessed input blobs."""
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._iter = iter(blobs)
+
+        def get_next(self):
+            blob = next(self._iter, None)
+            return None if blob is None else {input_name: blob}
+
+    return _Reader()
+
+
+def detector_blobs(det_model, images: List[np.ndarray], size: int = 640) -> List[np.ndarray]:
+    import cv2
+
+    blobs = []
+    for image in images:
+        h, w = image.shape[:2]
+        scale = size / float(max(h, w))
+        resized = cv2.resize(image, (int(w * scale), int(h * scale)))
+        canvas = np.zeros((size, size, 3), dtype=np.uint8)
+        canvas[: resized.shape[0], : resized.shape[1]] = resized
+        blobs.append(
+            cv2.dnn.blobFromImage(
+                canvas, 1.0 / det_model.input_std, (size, size),
+                (det_model.input_mean,) * 3, swapRB=True,
+            )
+        )
+    return blobs
+
+
+def recognition_batch(rec_model, aligned: np.ndarray) -> np.ndarray:
+    # Same preprocessing as FaceEmbedder.embed_aligned.
+    batch = aligned[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32)
+    return (batch - rec_model.input_mean) / rec_model.input_std
+
+
+def build_variant(model, variant: str, calibration_blobs: Optional[List[np.ndarray]] = None) -> str:
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    src = model.model_file
+    dst = variant_path(src, variant)
+    if variant == "optimized":
+        import onnxruntime as ort
+
+        ort.InferenceSession(src, session_options(dst), providers=["CPUExecutionProvider"])
+        return dst
+
+    prepared = variant_path(src, "preprocessed")
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+
+        quant_pre_process(src, prepared)
+    except Exception:
+        prepared = src
+
+    if variant == "int8-dynamic":
+        quantize_dynamic(prepared, dst, weight_type=QuantType.QInt8)
+    elif variant == "int8-static":
+        if not calibration_blobs:
+            raise ValueError("int8-static needs calibration images")
+        input_name = model.session.get_inputs()[0].name
+        quantize_static(
+            prepared,
+            dst,
+            _array_reader(input_name, calibration_blobs),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+    else:
+        raise ValueError(f"Unknown variant '{variant}', expected one of {VARIANTS}")
+    if prepared != src and os.path.exists(prepared):
+        os.remove(prepared)
+    return dst
+
+
+# ── accuracy check ───────────────────────────────────────────────────────────
+
+def compare_embeddings(reference: np.ndarray, candidate: np.ndarray) -> Dict:
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cos = (ref * cand).sum(axis=1)
+    return {
+        "faces": int(len(cos)),
+        "mean_cosine": round(float(cos.mean()), 5) if len(cos) else None,
+        "worst_cosine": round(float(cos.min()), 5) if len(cos) else None,
+        "passed": bool(
+            len(cos) and cos.mean() >= MIN_MEAN_COSINE and cos.min() >= MIN_WORST_COSINE
+        ),
+    }
+
+
+def _load_calibration(pattern_or_dir: str, limit: int) -> List[np.ndarray]:
+    from core.image_io import decode_image
+
+    if os.path.isdir(pattern_or_dir):
+        paths = sorted(
+            p for p in glob.glob(os.path.join(pattern_or_dir, "**", "*"), recursive=True)
+            if p.lower().endswith((".jpg", ".jpeg", ".png"))
+        )
+    else:
+        paths = sorted(glob.glob(pattern_or_dir, recursive=True))
+    images = []
+    for path in paths[:limit]:
+        with open(path, "rb") as f:
+            images.append(decode_image(f.read(), max_side=1920))
+    return images
+
+
+def _calibration_faces(detector, embedder, images: List[np.ndarray]) -> np.ndarray:
+    crops = []
+    for image in images:
+        _, _, landmarks = detector.detect_faces(image)
+        if len(landmarks):
+            crops.append(np.array(embedder.aligner.align(image, landmarks)))
+    if not crops:
+        size = embedder.aligner.image_size
+        return np.zeros((0, size, size, 3), dtype=np.uint8)
+    return np.concatenate(crops)
+
+
+def check_variant(detector, embedder, variant: str, images: List[np.ndarray]) -> Dict:
+    """Compare fp32 and ``variant`` embeddings (and detections) on calibration photos."""
+    import onnxruntime as ort
+
+    result: Dict = {"passed": True}
+    rec = embedder.rec_model
+    rec_file = variant_path(rec.model_file, variant)
+    if os.path.exists(rec_file):
+        batch = recognition_batch(rec, _calibration_faces(detector, embedder, images))
+        variant_session = ort.InferenceSession(
+            rec_file, session_options(), providers=rec.session.get_providers()
+        )
+
+        def _run(session):
+            started = time.perf_counter()
+            out = session.run(None, {session.get_inputs()[0].name: batch})[0]
+            return out, time.perf_counter() - started
+
+        if len(batch):
+            reference, fp32_seconds = _run(rec.session)
+            candidate, variant_seconds = _run(variant_session)
+            result.update(compare_embeddings(reference, candidate))
+            result["fp32_seconds"] = round(fp32_seconds, 4)
+            result["variant_seconds"] = round(variant_seconds, 4)
+        else:
+            result.update(faces=0, passed=False)
+
+    det = detector.app.det_model
+    det_file = variant_path(det.model_file, variant)
+    if os.path.exists(det_file):
+        fp32_det = det.session
+        fp32_counts = [len(detector.detect_faces(im)[0]) for im in images]
+        det.session = ort.InferenceSession(det_file, session_options(), providers=fp32_det.get_providers())
+        try:
+            variant_counts = [len(detector.detect_faces(im)[0]) for im in images]
+        finally:
+            det.session = fp32_det
+        missed = sum(max(0, a - b) for a, b in zip(fp32_counts, variant_counts))
+        result["detections_fp32"] = sum(fp32_counts)
+        result["detections_variant"] = sum(variant_counts)
+        # Losing more than 2% of faces fails the variant even if embeddings agree.
+        result["passed"] = result["passed"] and missed <= 0.02 * max(1, sum(fp32_counts))
+    return result
+
+
+def _record(variant: str, models, result: Dict) -> None:
+    manifest = read_manifest()
+    for model in models:
+        path = variant_path(model.model_file, variant)
+        if os.path.exists(path):
+            manifest[os.path.basename(path)] = {**result, "checked_at": time.time()}
+    _write_manifest(manifest)
+
+
+# ── command-line entry point ─────────────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build and validate optimized/INT8 face models")
+    parser.add_argument("command", choices=("build", "check"))
+    parser.add_argument("--variant", choices=VARIANTS[1:], required=True)
+    parser.add_argument("--calibration", help="Directory or glob of calibration photos")
+    parser.add_argument("--limit", type=int, default=200, help="Maximum calibration photos")
+    parser.add_argument("--models", choices=("both", "detection", "recognition"), default="both")
+    args = parser.parse_args(argv)
+
+    if args.variant in QUANTIZED and not args.calibration:
+        parser.error("quantized variants need --calibration photos for the accuracy check")
+
+    from core.detector import FaceDetector
+    from core.embedder import FaceEmbedder
+
+    # The reference models must be the stock fp32 graphs, detected at a fixed scale.
+    os.environ["MODEL_VARIANT"] = "fp32"
+    detector, embedder = FaceDetector(scale_mode="full"), FaceEmbedder()
+    models = []
+    if args.models in ("both", "detection"):
+        models.append(detector.app.det_model)
+    if args.models in ("both", "recognition"):
+        models.append(embedder.rec_model)
+    images = _load_calibration(args.calibration, args.limit) if args.calibration else []
+
+    if args.command == "build":
+        for model in models:
+            blobs = None
+            if args.variant == "int8-static":
+                if model is embedder.rec_model:
+                    blobs = [
+                        recognition_batch(model, face[None])
+                        for face in _calibration_faces(detector, embedder, images)
+                    ]
+                else:
+                    blobs = detector_blobs(model, images)
+            path = build_variant(model, args.variant, blobs)
+            print(f"built {path}")
+
+    if args.variant in QUANTIZED or images:
+        result = check_variant(detector, embedder, args.variant, images)
+        _record(args.variant, models, result)
+        print(json.dumps(result, indent=2))
+        return 0 if result["passed"] else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
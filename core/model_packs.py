@@ -0,0 +1,239 @@
+"""InsightFace model packs and a per-pack benchmark.
+
+``MODEL_PACK`` picks the detector/recognizer pair used everywhere::
+
+    MODEL_PACK=buffalo_s streamlit run app.py
+
+Embeddings from different packs live in different spaces, so the gallery
+must be re-embedded (``python -m core.reembed``) before switching. To
+compare packs on your own hardware and faces::
+
+    python -m core.model_packs bench --pairs people/ --packs buffalo_l buffalo_s
+
+``people/`` holds one sub-directory per person with two or more photos each.
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+MODEL_PACKS = {
+    "buffalo_l": {
+        "name": "buffalo_l",
+        "detector": "det_10g",
+        "recognizer": "w600k_r50",
+        "embedding_dim": 512,
+        "align_size": 112,
+        "det_size": 640,
+    },
+    # Mobile detector and MobileFaceNet recognizer: several times faster on
+    # CPU at a small cost in accuracy, for small rooms on weak hardware.
+    "buffalo_s": {
+        "name": "buffalo_s",
+        "detector": "det_500m",
+        "recognizer": "w600k_mbf",
+        "embedding_dim": 512,
+        "align_size": 112,
+        "det_size": 640,
+    },
+    "antelopev2": {
+        "name": "antelopev2",
+        "detector": "scrfd_10g_bnkps",
+        "recognizer": "glintr100",
+        "embedding_dim": 512,
+        "align_size": 112,
+        "det_size": 640,
+    },
+}
+DEFAULT_PACK = "buffalo_l"
+
+
+def get_pack(name: Optional[str] = None) -> Dict:
+    """The pack ``name``, or the one selected by ``MODEL_PACK``."""
+    name = (name or os.getenv("MODEL_PACK", DEFAULT_PACK)).lower()
+    if name not in MODEL_PACKS:
+        raise ValueError(f"Unknown model pack '{name}'; choose one of {', '.join(MODEL_PACKS)}")
+    return MODEL_PACKS[name]
+
+
+def model_id(pack: Dict) -> str:
+    """Tag stored with every embedding; embeddings only compare within one id."""
+    return f"{pack['name']}/{pack['recognizer']}"
+
+
+def ensure_pack(name: str, root: str = "~/.insightface") -> str:
+    """Download ``name`` if needed and return its model directory.
+
+    The antelopev2 archive unpacks into a nested ``antelopev2/antelopev2``
+    folder that ``FaceAnalysis`` cannot see; its models are moved up a level.
+    """
+    from insightface.utils.storage import ensure_available
+
+    model_dir = ensure_available("models", name, root=os.path.expanduser(root))
+    if not glob.glob(os.path.join(model_dir, "*.onnx")):
+        for path in glob.glob(os.path.join(model_dir, "*", "*.onnx")):
+            shutil.move(path, os.path.join(model_dir, os.path.basename(path)))
+    return model_dir
+
+
+# ── benchmark ────────────────────────────────────────────────────────────────
+
+def verification_metrics(embeddings: np.ndarray, labels: List[str], threshold: float) -> Dict:
+    """Pairwise verification over every pair of ``embeddings``.
+
+    Reports the best achievable accuracy (and its threshold), the accuracy at
+    the app's matching ``threshold`` and the true-accept rate at 1% false
+    accepts.
+    """
+    emb = np.asarray(embeddings, dtype=np.float32)
+    emb = emb / np.linalg.norm(emb, axis=1, keepdims=True)
+    labels = np.asarray(labels)
+    i, j = np.triu_indices(len(emb), k=1)
+    scores = np.einsum("nd,nd->n", emb[i], emb[j])
+    same = labels[i] == labels[j]
+    genuine, impostor = scores[same], scores[~same]
+    if len(genuine) == 0 or len(impostor) == 0:
+        return {"genuine_pairs": int(len(genuine)), "impostor_pairs": int(len(impostor))}
+
+    candidates = np.unique(np.round(scores, 3))
+    accuracy = [
+        ((genuine >= t).sum() + (impostor < t).sum()) / len(scores) for t in candidates
+    ]
+    best = int(np.argmax(accuracy))
+    far_threshold = float(np.quantile(impostor, 0.99))
+    return {
+        "genuine_pairs": int(len(genuine)),
+        "impostor_pairs": int(len(impostor)),
+        "accuracy": round(float(accuracy[best]), 4),
+        "best_threshold": round(float(candidates[best]), 3),
+        "accuracy_at_threshold": round(
+            float(((genuine >= threshold).sum() + (impostor < threshold).sum()) / len(scores)), 4
+        ),
+        "tar_at_far_1pct": round(float((genuine > far_threshold).mean()), 4),
+    }
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _bench_pack(pack: str, people: Dict[str, List[str]], threshold: float) -> Dict:
+    # Runs in a fresh process so memory figures belong to this pack alone.
+    os.environ["MODEL_PACK"] = pack
+    from core.detector import FaceDetector
+    from core.embedder import FaceEmbedder
+    from core.image_io import decode_image
+
+    ensure_pack(pack)
+    baseline = _rss_mb()
+    started = time.perf_counter()
+    detector, embedder = FaceDetector(scale_mode="full"), FaceEmbedder()
+    load_seconds = time.perf_counter() - started
+    model_mb = _rss_mb() - baseline
+
+    detect_ms, embed_ms, embeddings, labels = [], [], [], []
+    for person, paths in people.items():
+        for path in paths:
+            with open(path, "rb") as f:
+                image = decode_image(f.read())
+            t0 = time.perf_counter()
+            boxes, _, landmarks = detector.detect_faces(image)
+            detect_ms.append((time.perf_counter() - t0) * 1000)
+            if len(boxes) == 0:
+                continue
+            # Verification photos are portraits: keep the largest face.
+            largest = int(np.argmax((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])))
+            t0 = time.perf_counter()
+            emb = embedder.get_embeddings(image, landmarks[[largest]])[0]
+            embed_ms.append((time.perf_counter() - t0) * 1000)
+            embeddings.append(np.array(emb))
+            labels.append(person)
+
+    result = {
+        "pack": pack,
+        "images": len(detect_ms),
+        "faces": len(embeddings),
+        "load_seconds": round(load_seconds, 2),
+        "model_memory_mb": round(model_mb, 1),
+        "peak_memory_mb": round(_rss_mb(), 1),
+        "detect_ms": round(float(np.median(detect_ms)), 1) if detect_ms else None,
+        "embed_ms": round(float(np.median(embed_ms)), 1) if embed_ms else None,
+    }
+    if detect_ms and embed_ms:
+        per_image = np.median(detect_ms) + np.median(embed_ms)
+        result["images_per_second"] = round(1000.0 / per_image, 2)
+    if embeddings:
+        result.update(verification_metrics(np.stack(embeddings), labels, threshold))
+    return result
+
+
+def _collect_people(root: str) -> Dict[str, List[str]]:
+    people = {}
+    for person in sorted(os.listdir(root)):
+        paths = sorted(
+            p for p in glob.glob(os.path.join(root, person, "*"))
+            if p.lower().endswith((".jpg", ".jpeg", ".png"))
+        )
+        if len(paths) >= 2:
+            people[person] = paths
+    return people
+
+
+def benchmark(packs: List[str], pairs_dir: str, threshold: float = 0.5, limit: int = 0) -> List[Dict]:
+    people = _collect_people(pairs_dir)
+    if limit:
+        people = dict(list(people.items())[:limit])
+    results = []
+    for pack in packs:
+        get_pack(pack)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            results.append(pool.submit(_bench_pack, pack, people, threshold).result())
+    return results
+
+
+# ── command-line entry point ─────────────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare InsightFace model packs")
+    parser.add_argument("command", choices=("list", "bench"))
+    parser.add_argument("--packs", nargs="+", choices=list(MODEL_PACKS), default=list(MODEL_PACKS))
+    parser.add_argument("--pairs", help="Directory with one sub-directory of photos per person")
+    parser.add_argument("--limit", type=int, default=0, help="Use at most this many people")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Matching threshold to score")
+    parser.add_argument("--json", dest="json_path", help="Also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for pack in MODEL_PACKS.values():
+            print(json.dumps(pack))
+        return 0
+    if not args.pairs:
+        parser.error("bench needs --pairs")
+
+    results = benchmark(args.packs, args.pairs, threshold=args.threshold, limit=args.limit)
+    columns = (
+        "pack", "images_per_second", "detect_ms", "embed_ms",
+        "model_memory_mb", "accuracy", "accuracy_at_threshold", "tar_at_far_1pct",
+    )
+    print("  ".join(f"{c:>22}" for c in columns))
+    for row in results:
+        print("  ".join(f"{str(row.get(c, '-')):>22}" for c in columns))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import os
+import re
+from typing import Optional
+
+
+class LocalPhotoStore:
+    """Enrollment photos on the local disk, addressed as ``local://org/student.jpg``."""
+
+    scheme = "local"
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.getenv("PHOTO_STORE_DIR", os.path.join(".camattend", "photos"))
+
+    def save(self, organization_id: str, student_id: str, data: bytes, ext: str = "jpg") -> str:
+        key = _key(organization_id, student_id, ext)
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return f"{self.scheme}://{key}"
+
+    def load(self, url: str) -> bytes:
+        with open(os.path.join(self.root, _strip(url, self.scheme)), "rb") as f:
+            return f.read()
+
+
+class SupabasePhotoStore:
+    """Enrollment photos in a Supabase Storage bucket, addressed as ``supabase://bucket/key``."""
+
+    scheme = "supabase"
+
+    def __init__(self, client, bucket: Optional[str] = None):
+        self.client = client
+        self.bucket = bucket or os.getenv("PHOTO_STORE_BUCKET", "enrollment-photos")
+
+    def save(self, organization_id: str, student_id: str, data: bytes, ext: str = "jpg") -> str:
+        key = _key(organization_id, student_id, ext)
+        self.client.storage.from_(self.bucket).upload(
+            key, data, {"content-type": f"image/{'jpeg' if ext == 'jpg' else ext}", "upsert": "true"}
+        )
+        return f"{self.scheme}://{self.bucket}/{key}"
+
+    def load(self, url: str) -> bytes:
+        bucket, _, key = _strip(url, self.scheme).partition("/")
+        return self.client.storage.from_(bucket).download(key)
+
+
+def _key(organization_id: str, student_id: str, ext: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", student_id)
+    return f"{organization_id}/{safe}.{ext}"
+
+
+def _strip(url: str, scheme: str) -> str:
+    prefix = f"{scheme}://"
+    if not url.startswith(prefix):
+        raise ValueError(f"Not a {scheme} photo URL: {url}")
+    return url[len(prefix):]
+
+
+def get_photo_store(db=None):
+    """The store selected by ``PHOTO_STORE`` (``local`` by default, or ``supabase``)."""
+    kind = os.getenv("PHOTO_STORE", "local").lower()
+    if kind == "supabase":
+        if db is None:
+            raise ValueError("PHOTO_STORE=supabase needs a database client")
+        return SupabasePhotoStore(db.client)
+    return LocalPhotoStore()
+
+
+def load_photo(url: str, db=None) -> bytes:
+    """Fetch a photo saved by either store, whichever is configured now."""
+    if url.startswith(f"{SupabasePhotoStore.scheme}://"):
+        if db is None:
+            raise ValueError("Loading a supabase:// photo needs a database client")
+        return SupabasePhotoStore(db.client).load(url)
+    return LocalPhotoStore().load(url)
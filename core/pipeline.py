@@ -0,0 +1,686 @@
+import hashlib
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from core.fusion import fuse_candidates
+from core.image_io import decode_image
+from core.margins import score_margin
+from core.quality import gate_reasons, score_faces
+from core.stage_engine import Stage, StageEngine
+
+
+TOP_K = 5
+
+
+def hash_image_bytes(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+# ── expensive stage: detect → embed → match ──────────────────────────────────
+
+def analyze_image(
+    image_bgr, detector, embedder, matcher, top_k: int = TOP_K, floors: Optional[Dict] = None
+) -> Dict:
+    """Run everything that does not depend on recognition settings.
+
+    The returned analysis holds the decoded image, detections, embeddings,
+    per-face quality and top-k gallery matches. It can be cached and fed to
+    the decision stage again when only the threshold or timing changes.
+    """
+    return embed_analysis(
+        detect_image(image_bgr, detector), embedder, matcher, top_k=top_k, floors=floors
+    )
+
+
+def detect_image(image_bgr, detector) -> Dict:
+    boxes, probs, landmarks = detector.detect_faces(image_bgr)
+    return {
+        "image": image_bgr,
+        "total_detected": len(boxes),
+        "boxes": np.asarray(boxes, dtype=np.float32).reshape(-1, 4),
+        "probs": np.asarray(probs, dtype=np.float32).reshape(-1),
+        "landmarks": np.asarray(landmarks, dtype=np.float32).reshape(-1, 5, 2),
+    }
+
+
+def embed_analysis(
+    analysis: Dict, embedder, matcher, top_k: int = TOP_K, floors: Optional[Dict] = None
+) -> Dict:
+    image_bgr = analysis["image"]
+    boxes, landmarks = analysis["boxes"], analysis["landmarks"]
+
+    # Score every face first; faces below the floors never reach ArcFace.
+    scores = score_faces(image_bgr, boxes, landmarks)
+    reasons = gate_reasons(scores, floors)
+    gated = [
+        {"box": boxes[i], "quality": float(scores["quality"][i]), "reasons": reasons[i]}
+        for i in range(len(boxes))
+        if reasons[i]
+    ]
+
+    # All passing faces are aligned into one buffer and embedded in one run.
+    kept = [i for i in range(len(boxes)) if not reasons[i]]
+    embeddings = (
+        np.asarray(embedder.get_embeddings(image_bgr, landmarks[kept]), dtype=np.float32)
+        if kept
+        else np.zeros((0, 0), dtype=np.float32)
+    )
+
+    analysis.update(
+        boxes=boxes[kept],
+        probs=analysis["probs"][kept],
+        landmarks=landmarks[kept],
+        embeddings=embeddings,
+        quality=scores["quality"][kept],
+        gated=gated,
+        floors=floors,
+    )
+    match_analysis(analysis, matcher, top_k=top_k)
+    return analysis
+
+
+def match_analysis(analysis: Dict, matcher, top_k: int = TOP_K) -> Dict:
+    # Matching is cheap; redo it only when the gallery changed since last time.
+    if (
+        analysis.get("matcher_version") == matcher.version
+        and analysis.get("top_k") == top_k
+    ):
+        return analysis
+    if len(analysis["embeddings"]):
+        ids, scores = matcher.search(analysis["embeddings"], k=top_k)
+    else:
+        ids, scores = [], np.zeros((0, top_k), dtype=np.float32)
+    analysis["topk_ids"] = ids
+    analysis["topk_scores"] = np.asarray(scores, dtype=np.float32)
+    analysis["top_k"] = top_k
+    analysis["matcher_version"] = matcher.version
+    return analysis
+
+
+def analysis_candidates(analysis: Dict, photo_index: int = 0) -> List[Dict]:
+    candidates = []
+    for i, box in enumerate(analysis["boxes"]):
+        ids = analysis["topk_ids"][i]
+        scores = analysis["topk_scores"][i]
+        student_id = ids[0] if ids else None
+        topk = [(sid, float(sc)) for sid, sc in zip(ids, scores) if sid is not None]
+        candidates.append(
+            {
+                "box": box,
+                "student_id": student_id,
+                "score": float(scores[0]) if student_id is not None else None,
+                "quality": float(analysis["quality"][i]),
+                "embedding": analysis["embeddings"][i],
+                "topk": topk,
+                "margin": score_margin(topk),
+                "photo_index": photo_index,
+                "sightings": [
+                    {"photo_index": photo_index, "box": [int(v) for v in box]}
+                ],
+            }
+        )
+    for face in analysis.get("gated", []):
+        box = face["box"]
+        candidates.append(
+            {
+                "box": box,
+                "student_id": None,
+                "score": None,
+                "quality": face["quality"],
+                "embedding": None,
+                "topk": [],
+                "photo_index": photo_index,
+                "sightings": [
+                    {"photo_index": photo_index, "box": [int(v) for v in box]}
+                ],
+                "gate_reasons": face["reasons"],
+            }
+        )
+    return candidates
+
+
+def count_matches(analysis: Dict, threshold: float) -> int:
+    scores = analysis.get("topk_scores")
+    if scores is None or len(scores) == 0:
+        return 0
+    known = np.array([bool(ids) and ids[0] is not None for ids in analysis["topk_ids"]])
+    return int(np.count_nonzero(known & (scores[:, 0] > threshold)))
+
+
+# ── cheap stage: per-face agent decisions ────────────────────────────────────
+
+ACTION_COLORS = {
+    "MARK_PRESENT": (0, 220, 90),
+    "SOFT_FLAG": (0, 210, 255),
+    "ESCALATE_TO_INSTRUCTOR": (0, 140, 255),
+    "RETAKE_PHOTO": (0, 60, 255),
+    "SUGGEST_ENROLL_NEW_STUDENT": (200, 0, 255),
+}
+
+# A photo is worth retaking only when gated faces are a large share of it,
+# the same bar batch_quality_guard applies to low-confidence faces.
+RETAKE_MIN_GATED = 3
+RETAKE_GATED_SHARE = 0.5
+
+FLAGGED_ACTIONS = {
+    "SOFT_FLAG",
+    "RETAKE_PHOTO",
+    "ESCALATE_TO_INSTRUCTOR",
+    "SUGGEST_ENROLL_NEW_STUDENT",
+}
+
+
+def decide_candidates(
+    candidates: List[Dict],
+    *,
+    threshold: float,
+    class_start_time: datetime,
+    agent,
+    db,
+    organization_id: str,
+    student_lookup: Dict,
+    session_id: Optional[str],
+    enable_agent: bool = True,
+    class_start_offset: Optional[float] = None,
+    mode: str = "image_upload",
+    progress: Optional[Callable[[float, str], None]] = None,
+    ledger=None,
+) -> Dict:
+    """Agent decision per candidate.
+
+    With a ``LectureLedger``, a student already marked PRESENT/LATE in this
+    lecture is answered from the ledger (no history fetch, agent call or
+    write) unless the new photo could upgrade LATE to PRESENT.
+    """
+    # Gated faces were never recognised, so they say nothing about how well
+    # recognition went for the rest of the photo.
+    recognised = [c for c in candidates if not c.get("gate_reasons")]
+    low_conf_count = sum(
+        1
+        for c in recognised
+        if c["student_id"] is None or c["score"] is None or c["score"] <= threshold
+    )
+    low_conf_ratio = low_conf_count / max(1, len(recognised))
+
+    faces_per_photo: Dict[int, int] = {}
+    gated_per_photo: Dict[int, int] = {}
+    for c in candidates:
+        photo = c.get("photo_index", 0)
+        faces_per_photo[photo] = faces_per_photo.get(photo, 0) + 1
+        if c.get("gate_reasons"):
+            gated_per_photo[photo] = gated_per_photo.get(photo, 0) + 1
+    retake_photos = {
+        photo
+        for photo, gated in gated_per_photo.items()
+        if gated >= RETAKE_MIN_GATED and gated / faces_per_photo[photo] >= RETAKE_GATED_SHARE
+    }
+
+    face_decisions = []
+    present_students: set = set()
+    unknown_count = 0
+    gated_count = 0
+    flagged_count = 0
+    retake_required = False
+
+    for i, cand in enumerate(candidates):
+        if progress:
+            progress(i / max(1, len(candidates)), f"Deciding face {i + 1}/{len(candidates)}…")
+        student_id = cand["student_id"]
+        score = cand["score"]
+        quality = cand["quality"]
+        now = datetime.now()
+        known = student_id is not None and score is not None and score > threshold
+        topk = cand.get("topk") or []
+        margin = score_margin(topk)
+
+        lecture_context = {
+            "mode": mode,
+            "class_start_offset_minutes": class_start_offset,
+            "threshold": threshold,
+            "image_quality": quality,
+            "previous_recognition_errors": 0,
+            "low_conf_ratio": low_conf_ratio,
+            "total_faces": len(recognised),
+            "is_unknown": not known,
+            "face_signature": None,
+            # From the same top-k search: a small margin means two enrolled
+            # students look alike to the model.
+            "score_margin": round(margin, 4) if margin is not None else None,
+            "runner_up_score": round(topk[1][1], 4) if len(topk) > 1 else None,
+            # Its best match was given to a better-matching face in the same photo.
+            "demoted": bool(cand.get("demoted_from")),
+        }
+
+        if cand.get("gate_reasons"):
+            reasons = cand["gate_reasons"]
+            student_name = "Unknown"
+            # One poor face (often someone in the background) needs a look,
+            # not a new photo; only a mostly-gated photo is worth retaking.
+            retake = cand.get("photo_index", 0) in retake_photos
+            ar = {
+                "decision": "FLAGGED",
+                "confidence": 0.0,
+                "uncertainty_score": 1.0,
+                "action": "RETAKE_PHOTO" if retake else "SOFT_FLAG",
+                "reasoning": (
+                    f"Skipped recognition — face {', '.join(r.replace('_', ' ') for r in reasons)}."
+                    + (" Most faces in this photo are too poor to recognise." if retake else "")
+                ),
+                "requires_review": True,
+                "agent_type": "quality_gate",
+                "time_offset_minutes": (now - class_start_time).total_seconds() / 60,
+                "trace": [f"quality_gate → {', '.join(reasons)}"],
+            }
+            gated_count += 1
+        elif known and _ledger_hit(ledger, student_id, now, class_start_time, agent):
+            student_name = student_lookup.get(student_id, student_id)
+            entry = ledger.final(student_id)
+            ar = {
+                "decision": entry["status"].upper(),
+                "confidence": float(score),
+                "uncertainty_score": 0.0,
+                "action": "MARK_PRESENT",
+                "reasoning": f"Already marked {entry['status'].upper()} earlier in this lecture.",
+                "requires_review": False,
+                "agent_type": "ledger",
+                "time_offset_minutes": (now - class_start_time).total_seconds() / 60,
+                "trace": [f"ledger → already {entry['status'].upper()}, skipped agent and write"],
+                "already_decided": True,
+            }
+        elif known:
+            student_name = student_lookup.get(student_id, student_id)
+            try:
+                student_history = db.get_student_attendance_stats(student_id, organization_id)
+            except Exception:
+                student_history = None
+            try:
+                attendance_records = db.get_student_attendance_history(student_id)
+            except Exception:
+                attendance_records = []
+            if student_history:
+                lecture_context["previous_recognition_errors"] = int(
+                    student_history.get("previous_recognition_errors", 0)
+                )
+
+            if enable_agent and agent:
+                ar = agent.make_decision(
+                    student_name=student_name,
+                    confidence_score=float(score),
+                    current_time=now,
+                    class_start_time=class_start_time,
+                    student_history=student_history,
+                    attendance_records=attendance_records,
+                    lecture_context=lecture_context,
+                    session_id=session_id,
+                )
+            else:
+                ar = {
+                    "decision": "PRESENT",
+                    "confidence": float(score),
+                    "uncertainty_score": 0.1,
+                    "action": "MARK_PRESENT",
+                    "reasoning": "Agent disabled — using threshold match only.",
+                    "requires_review": False,
+                    "agent_type": "disabled",
+                    "time_offset_minutes": (now - class_start_time).total_seconds() / 60,
+                    "trace": [],
+                }
+        else:
+            student_name = "Unknown"
+            if enable_agent and agent:
+                cluster = agent.assign_unknown_face(session_id, cand["embedding"])
+                lecture_context["face_signature"] = cluster["cluster_id"]
+                ar = agent.make_decision(
+                    student_name=student_name,
+                    confidence_score=float(score) if score else 0.0,
+                    current_time=now,
+                    class_start_time=class_start_time,
+                    student_history=None,
+                    attendance_records=[],
+                    lecture_context=lecture_context,
+                    session_id=session_id,
+                )
+            else:
+                ar = {
+                    "decision": "FLAGGED",
+                    "confidence": float(score) if score else 0.0,
+                    "uncertainty_score": 0.8,
+                    "action": "ESCALATE_TO_INSTRUCTOR",
+                    "reasoning": "Below recognition threshold.",
+                    "requires_review": True,
+                    "agent_type": "threshold_filter",
+                    "time_offset_minutes": (now - class_start_time).total_seconds() / 60,
+                    "trace": [],
+                }
+            unknown_count += 1
+
+        trace = ar.get("trace", [])
+        if cand.get("demoted_from"):
+            lost_to = student_lookup.get(cand["demoted_from"], cand["demoted_from"])
+            trace = [f"assignment → {lost_to} matched another face in this photo better"] + trace
+
+        action = ar.get("action", "ESCALATE_TO_INSTRUCTOR")
+        face_decisions.append(
+            {
+                "student_id": student_id,
+                "student_name": student_name,
+                "known": known,
+                "box": [int(v) for v in cand["box"]],
+                "photo_index": cand.get("photo_index", 0),
+                "sightings": cand.get("sightings", []),
+                "face_score": round(float(score), 3) if score else None,
+                "score_margin": round(margin, 3) if margin is not None else None,
+                "image_quality": round(float(quality), 3),
+                "uncertainty": round(float(ar.get("uncertainty_score", 0)), 3),
+                "agent_decision": ar.get("decision"),
+                "action": action,
+                "requires_review": ar.get("requires_review", False),
+                "agent_type": ar.get("agent_type"),
+                "reasoning": ar.get("reasoning"),
+                "time_offset_minutes": ar.get("time_offset_minutes"),
+                "trace": trace,
+                "demoted_from": cand.get("demoted_from"),
+                "already_decided": ar.get("already_decided", False),
+            }
+        )
+
+        if action == "MARK_PRESENT" and ar.get("decision") in {"PRESENT", "LATE"}:
+            present_students.add(student_name)
+        elif action in FLAGGED_ACTIONS:
+            flagged_count += 1
+            if action == "RETAKE_PHOTO":
+                retake_required = True
+
+    face_decisions.sort(key=_result_sort_key)
+    return {
+        "face_decisions": face_decisions,
+        "faces": len(candidates),
+        "recognized": len(present_students),
+        "flagged": flagged_count,
+        "unknown": unknown_count,
+        "gated": gated_count,
+        "retake_required": retake_required,
+    }
+
+
+def _ledger_hit(ledger, student_id, now, class_start_time, agent) -> bool:
+    entry = ledger.final(student_id) if ledger is not None else None
+    if entry is None:
+        return False
+    if entry["status"] == "late":
+        # A photo inside the grace period could still make them PRESENT.
+        grace = getattr(agent, "GRACE", 5)
+        return (now - class_start_time).total_seconds() / 60 > grace
+    return True
+
+
+def persist_decisions(
+    db,
+    face_decisions: List[Dict],
+    *,
+    lecture_id: str,
+    marked_by: str,
+    progress: Optional[Callable[[float, str], None]] = None,
+    ledger=None,
+) -> int:
+    attendance = []
+    for i, fd in enumerate(face_decisions):
+        if progress:
+            progress(i / max(1, len(face_decisions)), f"Saving {i + 1}/{len(face_decisions)}…")
+        if fd.get("already_decided"):
+            continue
+        score = fd.get("face_score")
+        # Save audit trail
+        try:
+            db.save_agent_decision(
+                lecture_id=lecture_id,
+                student_id=fd["student_id"] if fd.get("known") else None,
+                student_name=fd.get("student_name"),
+                face_confidence=float(score) if score else 0.0,
+                agent_decision=fd.get("agent_decision") or "FLAGGED",
+                agent_reasoning=fd.get("reasoning") or "",
+                agent_type=fd.get("agent_type") or "rule_based",
+                time_offset_minutes=fd.get("time_offset_minutes"),
+                requires_review=fd.get("requires_review", False),
+            )
+        except Exception:
+            pass
+
+        if fd.get("known") and fd.get("agent_decision") in {"PRESENT", "LATE", "ABSENT"}:
+            attendance.append(
+                {
+                    "student_id": fd["student_id"],
+                    "confidence_score": float(score),
+                    "status": fd["agent_decision"].lower(),
+                    "notes": fd.get("reasoning") or "",
+                }
+            )
+
+    if not attendance:
+        if ledger is not None:
+            ledger.record(face_decisions)
+        return 0
+    # One upsert for the whole photo set instead of one round trip per face.
+    try:
+        db.mark_bulk_attendance(lecture_id, marked_by, attendance)
+    except Exception:
+        return 0
+    if ledger is not None:
+        ledger.record(face_decisions)
+    return len(attendance)
+
+
+def annotate_image(image_bgr, face_decisions: List[Dict], photo_index: int = 0):
+    img_annotated = image_bgr.copy()
+    for fd in face_decisions:
+        color = ACTION_COLORS.get(fd.get("action"), (120, 120, 120))
+        boxes = [
+            s["box"] for s in fd.get("sightings", []) if s["photo_index"] == photo_index
+        ]
+        for x1, y1, x2, y2 in boxes:
+            cv2.rectangle(img_annotated, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(
+                img_annotated,
+                f"{fd.get('student_name')} | {fd.get('agent_decision') or 'FLAGGED'}",
+                (x1, max(y1 - 8, 10)),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.6,
+                color,
+                2,
+            )
+    return cv2.cvtColor(img_annotated, cv2.COLOR_BGR2RGB)
+
+
+# Sort: auto-present first (most confident), then soft-flagged present/late,
+# then other flagged, then absent — within each tier sort by confidence desc.
+def _result_sort_key(r):
+    d = r.get("agent_decision", "FLAGGED")
+    conf = r.get("face_score") or 0.0
+    flagged = r.get("requires_review", False)
+    if d in {"PRESENT", "LATE"} and not flagged:
+        return (0, -conf)
+    if d in {"PRESENT", "LATE"} and flagged:
+        return (1, -conf)
+    if d == "FLAGGED":
+        return (2, -conf)
+    return (3, -conf)  # ABSENT
+
+
+def lecture_start_time(lecture: Dict) -> datetime:
+    """Scheduled start of a ``lectures`` row, or now if it has none."""
+    try:
+        return datetime.combine(
+            datetime.fromisoformat(str(lecture["lecture_date"])).date(),
+            datetime.strptime(str(lecture["start_time"])[:8], "%H:%M:%S").time(),
+        )
+    except (KeyError, TypeError, ValueError):
+        return datetime.now()
+
+
+# ── full run, as executed by a background job ────────────────────────────────
+
+def analyze_photos(
+    photos: List[Dict],
+    *,
+    detector,
+    embedder,
+    matcher,
+    cache,
+    session_id: Optional[str],
+    max_workers: int = 4,
+    progress: Optional[Callable[[float, str], None]] = None,
+    stats: Optional[Dict] = None,
+    quality_floors: Optional[Dict] = None,
+) -> List[Dict]:
+    """Analyse several photos concurrently, reusing cached analyses.
+
+    ``photos`` items carry ``bytes`` and ``hash``. Decode, detection and
+    embedding run as overlapping stages, so photo N+1 is detected while
+    photo N is embedded. ONNX Runtime and OpenCV release the GIL, so threads
+    keep every core busy without copying the models into other processes.
+    Per-stage utilization is written into ``stats`` when given.
+    """
+    def _decode(photo):
+        cached = cache.get(session_id, photo["hash"]) if cache is not None else None
+        if cached is not None and cached.get("floors") == quality_floors:
+            return {"photo": photo, "analysis": cached, "cached": True}
+        return {"photo": photo, "analysis": {"image": decode_image(photo["bytes"])}, "cached": False}
+
+    def _detect(item):
+        if not item["cached"]:
+            item["analysis"] = detect_image(item["analysis"]["image"], detector)
+        return item
+
+    def _embed(item):
+        analysis = item["analysis"]
+        if item["cached"]:
+            return match_analysis(analysis, matcher)
+        embed_analysis(analysis, embedder, matcher, floors=quality_floors)
+        if cache is not None:
+            cache.put(session_id, item["photo"]["hash"], analysis)
+        return analysis
+
+    workers = max(1, min(max_workers, len(photos)))
+    engine = StageEngine(
+        [
+            Stage("decode", _decode),
+            Stage("detect", _detect, workers=workers),
+            Stage("embed", _embed, workers=max(1, workers // 2)),
+        ],
+        queue_size=max(2, workers),
+    )
+    done = [0]
+
+    def _on_result(_, __):
+        done[0] += 1
+        if progress:
+            progress(done[0] / len(photos), f"Analysed {done[0]}/{len(photos)} photo(s)…")
+
+    analyses = engine.run(photos, on_result=_on_result)
+    if stats is not None:
+        stats.update(engine.stats())
+    for analysis in analyses:
+        if isinstance(analysis, Exception):
+            raise analysis
+    return analyses
+
+
+def run_recognition(
+    job,
+    photos: List[Dict],
+    *,
+    detector,
+    embedder,
+    matcher,
+    agent,
+    db,
+    cache,
+    session_id: Optional[str],
+    marked_by: str,
+    organization_id: str,
+    student_lookup: Dict,
+    threshold: float,
+    class_start_time: datetime,
+    class_start_offset: Optional[float] = None,
+    enable_agent: bool = True,
+    fusion: str = "max",
+    analyze_workers: int = 4,
+    quality_floors: Optional[Dict] = None,
+    ledger=None,
+) -> Dict:
+    # Students already marked in this lecture skip the agent and the write.
+    book = ledger.lecture(job.lecture_id, db) if ledger is not None else None
+    job.start_stage("analyze", f"Detecting and embedding faces in {len(photos)} photo(s)…")
+    stage_stats: Dict = {}
+    analyses = analyze_photos(
+        photos,
+        detector=detector,
+        embedder=embedder,
+        matcher=matcher,
+        cache=cache,
+        session_id=session_id,
+        max_workers=analyze_workers,
+        progress=job.report,
+        stats=stage_stats,
+        quality_floors=quality_floors,
+    )
+
+    per_photo = [analysis_candidates(a, photo_index=i) for i, a in enumerate(analyses)]
+    total_detected = sum(a["total_detected"] for a in analyses)
+    if total_detected == 0 or not any(per_photo):
+        return {
+            "photos": len(photos),
+            "faces": 0,
+            "message": (
+                "No faces detected in the image."
+                if total_detected == 0
+                else "Could not extract embeddings from detected faces."
+            ),
+        }
+
+    candidates = fuse_candidates(per_photo, threshold, mode=fusion)
+    job.start_stage("decide", f"Deciding for {len(candidates)} face(s)…")
+    outcome = decide_candidates(
+        candidates,
+        threshold=threshold,
+        class_start_time=class_start_time,
+        agent=agent,
+        db=db,
+        organization_id=organization_id,
+        student_lookup=student_lookup,
+        session_id=session_id,
+        enable_agent=enable_agent,
+        class_start_offset=class_start_offset,
+        mode="image_upload" if len(photos) == 1 else "multi_photo",
+        progress=job.report,
+        ledger=book,
+    )
+
+    job.start_stage("save", "Writing attendance…")
+    outcome["written"] = persist_decisions(
+        db,
+        outcome["face_decisions"],
+        lecture_id=job.lecture_id,
+        marked_by=marked_by,
+        progress=job.report,
+        ledger=book,
+    )
+    outcome["photos"] = len(photos)
+    outcome["already_decided"] = sum(1 for fd in outcome["face_decisions"] if fd.get("already_decided"))
+    outcome["stage_stats"] = stage_stats
+    outcome["faces_detected"] = sum(len(c) for c in per_photo)
+    outcome["present_ids"] = sorted(
+        fd["student_id"]
+        for fd in outcome["face_decisions"]
+        if fd.get("known")
+        and fd.get("action") == "MARK_PRESENT"
+        and fd.get("agent_decision") in {"PRESENT", "LATE"}
+    )
+    outcome["annotated"] = [
+        annotate_image(a["image"], outcome["face_decisions"], photo_index=i)
+        for i, a in enumerate(analyses)
+    ]
+    return outcome
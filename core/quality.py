@@ -0,0 +1,99 @@
+import os
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+
+# Crops are resampled to this size so blur and brightness are scored on a
+# common scale for every face in one vectorized pass.
+PATCH = 48
+
+
+def default_floors() -> Dict[str, float]:
+    """Gate floors, overridable through ``QUALITY_*`` environment variables."""
+    return {
+        "min_face_px": float(os.getenv("QUALITY_MIN_FACE_PX", "20")),
+        "min_sharpness": float(os.getenv("QUALITY_MIN_SHARPNESS", "0.03")),
+        "min_brightness": float(os.getenv("QUALITY_MIN_BRIGHTNESS", "0.12")),
+        "max_yaw": float(os.getenv("QUALITY_MAX_YAW", "0.7")),
+    }
+
+
+def score_faces(image_bgr: np.ndarray, boxes, landmarks=None) -> Dict[str, np.ndarray]:
+    """Score every face box at once, before any embedding is computed.
+
+    Returns arrays of per-face ``size`` (shorter box side in pixels),
+    ``sharpness``, ``brightness``, ``size_score``, ``yaw``/``roll`` estimated
+    from the 5-point landmarks, and the combined ``quality`` in [0, 1].
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    n = len(boxes)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.float32)
+        return {k: empty for k in ("size", "sharpness", "brightness", "size_score", "yaw", "roll", "quality")}
+
+    h, w = image_bgr.shape[:2]
+    x1 = np.clip(boxes[:, 0], 0, w - 1).astype(np.int32)
+    y1 = np.clip(boxes[:, 1], 0, h - 1).astype(np.int32)
+    x2 = np.clip(boxes[:, 2], 0, w).astype(np.int32)
+    y2 = np.clip(boxes[:, 3], 0, h).astype(np.int32)
+    valid = (x2 > x1) & (y2 > y1)
+
+    patches = np.zeros((n, PATCH, PATCH), dtype=np.float32)
+    for i in np.flatnonzero(valid):
+        crop = image_bgr[y1[i]:y2[i], x1[i]:x2[i]]
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        patches[i] = cv2.resize(gray, (PATCH, PATCH), interpolation=cv2.INTER_AREA)
+
+    brightness = np.clip(patches.mean(axis=(1, 2)) / 255.0, 0.0, 1.0)
+    # 4-neighbour Laplacian over the whole stack at once.
+    lap = (
+        patches[:, :-2, 1:-1] + patches[:, 2:, 1:-1] + patches[:, 1:-1, :-2]
+        + patches[:, 1:-1, 2:] - 4.0 * patches[:, 1:-1, 1:-1]
+    )
+    sharpness = np.clip(lap.var(axis=(1, 2)) / 180.0, 0.0, 1.0)
+    size = np.minimum(x2 - x1, y2 - y1).clip(min=0).astype(np.float32)
+    area_ratio = ((x2 - x1) * (y2 - y1)).clip(min=0) / float(h * w)
+    size_score = np.clip(area_ratio / 0.07, 0.0, 1.0)
+
+    yaw = np.zeros(n, dtype=np.float32)
+    roll = np.zeros(n, dtype=np.float32)
+    if landmarks is not None and len(landmarks) == n:
+        lm = np.asarray(landmarks, dtype=np.float32).reshape(n, 5, 2)
+        left_eye, right_eye, nose = lm[:, 0], lm[:, 1], lm[:, 2]
+        eye_mid = (left_eye + right_eye) / 2.0
+        eye_vec = right_eye - left_eye
+        eye_dist = np.maximum(np.linalg.norm(eye_vec, axis=1), 1e-6)
+        # Nose offset from the eye midpoint, in eye distances: ~0 frontal,
+        # approaching 1 in profile.
+        yaw = (nose[:, 0] - eye_mid[:, 0]) / eye_dist
+        roll = np.degrees(np.arctan2(eye_vec[:, 1], eye_vec[:, 0]))
+
+    quality = np.clip(0.45 * sharpness + 0.35 * brightness + 0.20 * size_score, 0.0, 1.0)
+    quality[~valid] = 0.3
+    return {
+        "size": size,
+        "sharpness": sharpness.astype(np.float32),
+        "brightness": brightness.astype(np.float32),
+        "size_score": size_score.astype(np.float32),
+        "yaw": yaw.astype(np.float32),
+        "roll": roll.astype(np.float32),
+        "quality": quality.astype(np.float32),
+    }
+
+
+def gate_reasons(scores: Dict[str, np.ndarray], floors: Optional[Dict] = None) -> List[List[str]]:
+    """Per face, the list of floors it fails; an empty list passes the gate."""
+    floors = {**default_floors(), **(floors or {})}
+    reasons = [[] for _ in range(len(scores["quality"]))]
+    checks = (
+        ("too_small", scores["size"] < floors["min_face_px"]),
+        ("blurred", scores["sharpness"] < floors["min_sharpness"]),
+        ("too_dark", scores["brightness"] < floors["min_brightness"]),
+        ("turned_away", np.abs(scores["yaw"]) > floors["max_yaw"]),
+    )
+    for reason, failed in checks:
+        for i in np.flatnonzero(failed):
+            reasons[i].append(reason)
+    return reasons
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+class RecognitionCache:
+    """LRU cache of image analyses keyed by (session, image hash).
+
+    Entries hold everything ``analyze_image`` produced, including the decoded
+    image, so a rerun with new settings skips decode, detection, embedding and
+    matching. The cache is bounded both by entry count and by the total bytes
+    of the arrays it holds, and all entries for a session can be dropped when
+    that lecture ends.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 16,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_entries_per_session: int = 8,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entries_per_session = max_entries_per_session
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._sizes: Dict[Tuple[str, str], int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get(self, session_id: Optional[str], image_hash: str) -> Optional[Dict]:
+        key = (session_id or "", image_hash)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, session_id: Optional[str], image_hash: str) -> Optional[Dict]:
+        return self._entries.get((session_id or "", image_hash))
+
+    def put(self, session_id: Optional[str], image_hash: str, analysis: Dict) -> None:
+        key = (session_id or "", image_hash)
+        size = self._analysis_bytes(analysis)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = analysis
+            self._sizes[key] = size
+            self._bytes += size
+
+            session_keys = [k for k in self._entries if k[0] == key[0]]
+            for old in session_keys[: max(0, len(session_keys) - self.max_entries_per_session)]:
+                self._remove(old)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def drop_session(self, session_id: Optional[str]) -> int:
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == (session_id or "")]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    # ── private helpers ─────────────────────────────────────────────────────
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        self._entries.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+
+    @staticmethod
+    def _analysis_bytes(analysis: Dict) -> int:
+        return sum(v.nbytes for v in analysis.values() if isinstance(v, np.ndarray))
@@ -0,0 +1,211 @@
+"""Re-embed an organization's gallery with another model, then swap it in.
+
+Run with::
+
+    python -m core.reembed --org ORG_CODE --pack buffalo_s --swap
+
+Each student's stored enrollment photo is embedded with the target pack and
+written to ``students.staged_embedding``; recognition keeps using
+``face_embedding`` meanwhile. Students enrolled from several templates have
+every template photo re-embedded and staged instead, and their centroid is
+re-derived from those. Students already staged for the target model are
+skipped, so an interrupted run resumes where it stopped. With ``--swap``, a
+complete run promotes all staged embeddings and templates in one database
+statement; restart recognition with ``MODEL_PACK`` set to the new pack. As
+with students that failed, the swap is refused while any template is still
+on another model unless ``--allow-missing`` is passed.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from core.image_io import decode_image
+from core.model_packs import MODEL_PACKS, get_pack, model_id
+from core.photo_store import load_photo
+from core.templates import centroid
+
+
+# Enrollment photos are portraits; this keeps decode and detection cheap.
+PHOTO_MAX_SIDE = 1600
+
+
+def stale_templates(templates: List[Dict], target: str, legacy: str) -> List[Dict]:
+    """Template rows whose live or staged embedding is not from ``target`` yet."""
+    return [
+        t for t in templates
+        if (t.get("embedding_model") or legacy) != target
+        and t.get("staged_embedding_model") != target
+    ]
+
+
+def pending_students(
+    students: List[Dict], target: str, legacy: str, templates: Optional[Dict[str, List[Dict]]] = None
+) -> List[Dict]:
+    """Students whose live or staged embedding, or any template, is not from ``target`` yet."""
+    templates = templates or {}
+    return [
+        s for s in students
+        if (
+            (s.get("embedding_model") or legacy) != target
+            and s.get("staged_embedding_model") != target
+        )
+        or stale_templates(templates.get(s["id"], []), target, legacy)
+    ]
+
+
+def embed_photo(data: bytes, detector, embedder) -> np.ndarray:
+    image = decode_image(data, max_side=PHOTO_MAX_SIDE)
+    boxes, _, landmarks = detector.detect_faces(image)
+    if len(boxes) == 0:
+        raise ValueError("no face found in the enrollment photo")
+    # The enrolled student is the largest face in their own photo.
+    largest = int(np.argmax((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])))
+    return np.array(embedder.get_embeddings(image, landmarks[[largest]])[0])
+
+
+def reembed_students(
+    students: List[Dict],
+    db,
+    detector,
+    embedder,
+    target: str,
+    templates: Optional[Dict[str, List[Dict]]] = None,
+    workers: int = 4,
+    log=None,
+) -> Dict:
+    """Stage a ``target`` embedding for every student; returns done/failed lists.
+
+    ``templates`` maps a student uuid to its ``student_templates`` rows.
+    """
+    done, failed = [], []
+    started = time.monotonic()
+    templates = templates or {}
+
+    def _one(student: Dict) -> str:
+        rows = templates.get(student["id"])
+        if rows:
+            if not all(row.get("photo_url") for row in rows):
+                raise ValueError("template without a stored photo")
+            embs = [embed_photo(load_photo(row["photo_url"], db), detector, embedder) for row in rows]
+            for row, template_emb in zip(rows, embs):
+                db.stage_template_embedding(row["id"], template_emb, target)
+            # Staged last, so a staged student always has staged templates.
+            emb = centroid(embs, [row.get("quality") or 1.0 for row in rows])
+        else:
+            if not student.get("photo_url"):
+                raise ValueError("no enrollment photo stored")
+            emb = embed_photo(load_photo(student["photo_url"], db), detector, embedder)
+        db.stage_student_embedding(student["id"], emb, target)
+        return student["id"]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="camattend-reembed") as pool:
+        futures = {pool.submit(_one, s): s for s in students}
+        for count, future in enumerate(as_completed(futures), start=1):
+            student = futures[future]
+            try:
+                done.append(future.result())
+            except Exception as exc:
+                failed.append({
+                    "id": student["id"],
+                    "student_id": student.get("student_id"),
+                    "name": student.get("name"),
+                    "error": f"{type(exc).__name__}: {exc}",
+                })
+            if log and (count % 25 == 0 or count == len(students)):
+                rate = count / max(time.monotonic() - started, 1e-6)
+                log(f"re-embedded {count}/{len(students)} student(s) · {rate:.1f}/s")
+    return {"done": done, "failed": failed}
+
+
+# ── command-line entry point ─────────────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-embed an organization's gallery with another model")
+    parser.add_argument("--org", required=True, help="Organization code")
+    parser.add_argument("--pack", choices=list(MODEL_PACKS), help="Target model pack (default: MODEL_PACK)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--swap", action="store_true", help="Promote the staged embeddings when complete")
+    parser.add_argument(
+        "--allow-missing", action="store_true",
+        help="Swap even if some students could not be re-embedded (they drop out of recognition)",
+    )
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    from core.detector import FaceDetector
+    from core.embedder import FaceEmbedder
+    from database.supabase_db import LEGACY_EMBEDDING_MODEL, SupabaseDB
+
+    def log(message: str) -> None:
+        print(message, file=sys.stderr, flush=True)
+
+    load_dotenv()
+    db = SupabaseDB()
+    org = db.get_organization_by_code(args.org)
+    if not org:
+        parser.error(f"Organization '{args.org}' not found")
+
+    pack = get_pack(args.pack)
+    target = model_id(pack)
+    students = db.get_students_by_organization(org["id"], active_only=True)
+    active = {s["id"] for s in students}
+
+    def _templates() -> Dict[str, List[Dict]]:
+        by_student: Dict[str, List[Dict]] = {}
+        for row in db.get_template_rows(org["id"]):
+            if row["student_id"] in active:
+                by_student.setdefault(row["student_id"], []).append(row)
+        return by_student
+
+    templates = _templates()
+    pending = pending_students(students, target, LEGACY_EMBEDDING_MODEL, templates)
+    log(f"{len(students)} student(s), {len(pending)} to re-embed with {target}")
+
+    outcome = {"done": [], "failed": []}
+    if pending:
+        detector, embedder = FaceDetector(pack=pack["name"]), FaceEmbedder(pack=pack["name"])
+        outcome = reembed_students(
+            pending, db, detector, embedder, target,
+            templates=templates, workers=args.workers, log=log,
+        )
+    for item in outcome["failed"]:
+        log(f"failed: {item['student_id']} ({item['name']}): {item['error']}")
+
+    swapped = 0
+    if args.swap:
+        # Reloaded: templates staged by this run are no longer stale.
+        stale = [
+            t for rows in _templates().values()
+            for t in stale_templates(rows, target, LEGACY_EMBEDDING_MODEL)
+        ]
+        if (outcome["failed"] or stale) and not args.allow_missing:
+            log(
+                f"not swapping: {len(outcome['failed'])} student(s) failed and "
+                f"{len(stale)} template(s) are still on another model; "
+                "fix them and rerun, or pass --allow-missing"
+            )
+        else:
+            swapped = db.swap_staged_embeddings(org["id"], target)
+            log(f"swapped {swapped} embedding(s) to {target}; restart recognition with MODEL_PACK={pack['name']}")
+
+    print(json.dumps({
+        "organization": args.org,
+        "model": target,
+        "students": len(students),
+        "pending": len(pending),
+        "reembedded": len(outcome["done"]),
+        "failed": outcome["failed"],
+        "stale_templates": len(stale) if args.swap else None,
+        "swapped": swapped,
+    }, default=str))
+    return 1 if outcome["failed"] and not args.allow_missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
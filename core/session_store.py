@@ -0,0 +1,229 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+from core.unknown_faces import UnknownFaceIndex
+
+
+class SessionStore:
+    """Bounded in-memory store for per-session agent memory.
+
+    Each session keeps a ring buffer of its most recent observations and
+    running decision counters, so summaries never rescan history. The least
+    recently used session is dropped once ``max_sessions`` is reached, and
+    sessions idle for longer than ``idle_ttl`` seconds are evicted on access.
+    Unknown faces are clustered per session by an ``UnknownFaceIndex``.
+    When ``snapshot_path`` is set the store can be written to and restored
+    from disk so session memory survives a restart.
+    """
+
+    DECISIONS = ("PRESENT", "LATE", "ABSENT", "FLAGGED")
+    SNAPSHOT_VERSION = 2
+
+    def __init__(
+        self,
+        max_sessions: int = 64,
+        max_observations: int = 500,
+        idle_ttl: float = 6 * 3600,
+        snapshot_path: Optional[str] = None,
+        snapshot_interval: float = 60.0,
+        unknown_threshold: Optional[float] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.max_observations = max_observations
+        self.idle_ttl = idle_ttl
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.unknown_threshold = unknown_threshold
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.RLock()
+        # Serializes snapshot writes, so an older payload never lands last.
+        self._write_lock = threading.Lock()
+        self._last_snapshot = time.monotonic()
+
+    # ── session access ──────────────────────────────────────────────────────
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            self.evict_idle()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._touch(session_id, session)
+            return session
+
+    def session(self, session_id: str) -> Dict:
+        with self._lock:
+            self.evict_idle()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._new_session()
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._touch(session_id, session)
+            return session
+
+    def drop(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        if not self.idle_ttl:
+            return 0
+        now = time.time() if now is None else now
+        with self._lock:
+            stale = [
+                sid for sid, s in self._sessions.items()
+                if now - s["last_seen"] > self.idle_ttl
+            ]
+            for sid in stale:
+                del self._sessions[sid]
+            return len(stale)
+
+    # ── recording ───────────────────────────────────────────────────────────
+
+    def record(self, session_id: str, observation: Dict) -> None:
+        with self._lock:
+            session = self.session(session_id)
+            session["observations"].append(observation)
+            decision = observation.get("decision") or "FLAGGED"
+            session["counts"][decision] = session["counts"].get(decision, 0) + 1
+            session["total"] += 1
+        self._maybe_snapshot()
+
+    def assign_unknown(self, session_id: str, embedding) -> Tuple[str, int]:
+        with self._lock:
+            return self.session(session_id)["unknown_faces"].assign(embedding)
+
+    def unknown_count(self, session_id: str, cluster_id: str) -> int:
+        with self._lock:
+            session = self.get(session_id)
+            if session is None:
+                return 0
+            return session["unknown_faces"].count(cluster_id)
+
+    def summary(self, session_id: str) -> Dict:
+        with self._lock:
+            session = self.get(session_id)
+            counts = {d: 0 for d in self.DECISIONS}
+            if session is None:
+                return {
+                    "session_id": session_id,
+                    "total_observations": 0,
+                    "summary": counts,
+                    "observations": [],
+                }
+            counts.update(session["counts"])
+            return {
+                "session_id": session_id,
+                "total_observations": session["total"],
+                "summary": counts,
+                "observations": list(session["observations"]),
+            }
+
+    # ── persistence ─────────────────────────────────────────────────────────
+
+    def snapshot(self, path: Optional[str] = None) -> Optional[str]:
+        path = path or self.snapshot_path
+        if not path:
+            return None
+        with self._write_lock:
+            return self._write_snapshot(path)
+
+    def restore(self, path: Optional[str] = None) -> int:
+        path = path or self.snapshot_path
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                payload = json.load(fh)
+        except (OSError, json.JSONDecodeError):
+            return 0
+        if payload.get("version") != self.SNAPSHOT_VERSION:
+            return 0
+
+        sessions = sorted(
+            payload.get("sessions", {}).items(),
+            key=lambda item: item[1].get("last_seen", 0.0),
+        )
+        with self._lock:
+            for sid, data in sessions[-self.max_sessions:]:
+                session = self._new_session()
+                session["observations"].extend(data.get("observations", []))
+                if data.get("unknown_faces"):
+                    session["unknown_faces"] = UnknownFaceIndex.from_dict(
+                        data["unknown_faces"]
+                    )
+                session["counts"].update(data.get("counts", {}))
+                session["total"] = int(data.get("total", len(session["observations"])))
+                session["last_seen"] = float(data.get("last_seen", time.time()))
+                self._sessions[sid] = session
+            self.evict_idle()
+            return len(self._sessions)
+
+    # ── private helpers ─────────────────────────────────────────────────────
+
+    def _write_snapshot(self, path: str) -> str:
+        with self._lock:
+            payload = {
+                "version": self.SNAPSHOT_VERSION,
+                "sessions": {
+                    sid: {
+                        "observations": list(s["observations"]),
+                        "unknown_faces": s["unknown_faces"].to_dict(),
+                        "counts": dict(s["counts"]),
+                        "total": s["total"],
+                        "last_seen": s["last_seen"],
+                    }
+                    for sid, s in self._sessions.items()
+                },
+            }
+            self._last_snapshot = time.monotonic()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # A temp file of its own, so another process snapshotting to the same
+        # path never shares a half-written file with this one.
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=directory, suffix=".tmp", delete=False
+        ) as fh:
+            tmp_path = fh.name
+            try:
+                json.dump(payload, fh, default=str)
+            except BaseException:
+                fh.close()
+                os.unlink(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+        return path
+
+    def _new_session(self) -> Dict:
+        return {
+            "observations": deque(maxlen=self.max_observations),
+            "unknown_faces": UnknownFaceIndex(threshold=self.unknown_threshold),
+            "counts": {},
+            "total": 0,
+            "last_seen": time.time(),
+        }
+
+    def _touch(self, session_id: str, session: Dict) -> None:
+        session["last_seen"] = time.time()
+        self._sessions.move_to_end(session_id)
+
+    def _maybe_snapshot(self) -> None:
+        if not self.snapshot_path or self.snapshot_interval is None:
+            return
+        if time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+            try:
+                self.snapshot()
+            except OSError:
+                pass
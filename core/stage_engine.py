@@ -0,0 +1,221 @@
+import heapq
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class Stage:
+    """One step of a ``StageEngine``.
+
+    ``fn`` maps one item to one item. ``workers`` threads run it
+    concurrently; with ``processes=True`` each thread hands its item to a
+    process pool of the same size instead (``fn`` and items must pickle).
+    ``ordered=True`` feeds items to a single worker in input order, for
+    stateful steps such as tracking.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        workers: int = 1,
+        processes: bool = False,
+        ordered: bool = False,
+    ):
+        if ordered and workers != 1:
+            raise ValueError(f"Ordered stage '{name}' must have exactly one worker")
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.processes = processes
+        self.ordered = ordered
+
+
+class _Envelope:
+    __slots__ = ("seq", "value", "error")
+
+    def __init__(self, seq: int, value, error: Optional[BaseException] = None):
+        self.seq = seq
+        self.value = value
+        self.error = error
+
+    def __lt__(self, other):
+        return self.seq < other.seq
+
+
+_DONE = object()
+
+
+class StageEngine:
+    """Run items through stages connected by bounded queues.
+
+    Every stage works on a different item at the same time, so photo N+1 is
+    detected while photo N is embedded and N-1 is written. Bounded queues
+    keep memory flat when a fast stage feeds a slow one. A failing item
+    carries its exception through the remaining stages instead of stopping
+    the run; ``run`` returns results in input order with exceptions in place.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 4):
+        if not stages:
+            raise ValueError("StageEngine needs at least one stage")
+        self.stages = stages
+        self.queue_size = queue_size
+        self._stats: Dict[str, Dict] = {}
+        self._elapsed = 0.0
+
+    def run(
+        self,
+        items: Iterable,
+        on_result: Optional[Callable[[int, object], None]] = None,
+        check: Optional[Callable[[], None]] = None,
+    ) -> List:
+        """Process ``items`` and return their results in input order.
+
+        ``on_result(index, result)`` is called as results arrive. ``check``
+        is called before each item is fed. If either raises, feeding stops,
+        the items already in flight drain, and the exception is re-raised.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        queues.append(queue.Queue())
+        self._stats = {
+            s.name: {"workers": s.workers, "items": 0, "errors": 0, "busy": 0.0, "max_queue": 0}
+            for s in self.stages
+        }
+        lock = threading.Lock()
+        remaining = [s.workers for s in self.stages]
+        pools = [
+            ProcessPoolExecutor(max_workers=s.workers) if s.processes else None
+            for s in self.stages
+        ]
+        aborted: List[BaseException] = []
+        stop = threading.Event()
+        started = time.monotonic()
+
+        def _feed():
+            try:
+                for seq, item in enumerate(items):
+                    if stop.is_set():
+                        break
+                    if check is not None:
+                        check()
+                    queues[0].put(_Envelope(seq, item))
+            except BaseException as exc:
+                aborted.append(exc)
+            finally:
+                # Release generator-backed sources (e.g. video captures) early.
+                close = getattr(items, "close", None)
+                if close is not None:
+                    close()
+                for _ in range(self.stages[0].workers):
+                    queues[0].put(_DONE)
+
+        def _work(index: int):
+            stage = self.stages[index]
+            stats = self._stats[stage.name]
+            inbox, outbox = queues[index], queues[index + 1]
+            held, next_seq = [], 0
+            while True:
+                env = inbox.get()
+                with lock:
+                    stats["max_queue"] = max(stats["max_queue"], inbox.qsize() + 1)
+                if env is _DONE:
+                    break
+                if stage.ordered:
+                    heapq.heappush(held, env)
+                    ready = []
+                    while held and held[0].seq == next_seq:
+                        ready.append(heapq.heappop(held))
+                        next_seq += 1
+                else:
+                    ready = [env]
+                for env in ready:
+                    outbox.put(self._apply(stage, pools[index], env, stats, lock))
+            # An ordered stage may still hold items whose predecessors failed
+            # to arrive (e.g. after an aborted feed); release them in order.
+            while held:
+                outbox.put(self._apply(stage, pools[index], heapq.heappop(held), stats, lock))
+            with lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last:
+                downstream = self.stages[index + 1].workers if index + 1 < len(self.stages) else 1
+                for _ in range(downstream):
+                    outbox.put(_DONE)
+
+        threads = [threading.Thread(target=_feed, name="stage-feed", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                threads.append(
+                    threading.Thread(target=_work, args=(index,), name=f"stage-{stage.name}-{n}", daemon=True)
+                )
+        for thread in threads:
+            thread.start()
+
+        results: Dict[int, object] = {}
+        sink = queues[-1]
+        while True:
+            env = sink.get()
+            if env is _DONE:
+                break
+            value = env.error if env.error is not None else env.value
+            results[env.seq] = value
+            if on_result is not None and not stop.is_set():
+                try:
+                    on_result(env.seq, value)
+                except BaseException as exc:
+                    # Stop feeding but keep draining so every thread exits.
+                    aborted.append(exc)
+                    stop.set()
+
+        for thread in threads:
+            thread.join()
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown()
+        self._elapsed = time.monotonic() - started
+        if aborted:
+            raise aborted[0]
+        return [results[i] for i in sorted(results)]
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-stage item counts, busy time and utilization of the last run.
+
+        Utilization is busy time over wall time times workers; the stage
+        closest to 1.0 is the bottleneck worth more workers.
+        """
+        elapsed = max(self._elapsed, 1e-6)
+        return {
+            name: {
+                "workers": s["workers"],
+                "items": s["items"],
+                "errors": s["errors"],
+                "busy_seconds": round(s["busy"], 3),
+                "utilization": round(s["busy"] / (elapsed * s["workers"]), 3),
+                "max_queue": s["max_queue"],
+            }
+            for name, s in self._stats.items()
+        }
+
+    @staticmethod
+    def _apply(stage: Stage, pool, env: _Envelope, stats: Dict, lock) -> _Envelope:
+        if env.error is not None:
+            return env
+        t0 = time.perf_counter()
+        try:
+            if pool is not None:
+                value = pool.submit(stage.fn, env.value).result()
+            else:
+                value = stage.fn(env.value)
+            out = _Envelope(env.seq, value)
+        except Exception as exc:
+            out = _Envelope(env.seq, None, exc)
+        busy = time.perf_counter() - t0
+        with lock:
+            stats["items"] += 1
+            stats["busy"] += busy
+            if out.error is not None:
+                stats["errors"] += 1
+        return out
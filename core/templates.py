@@ -0,0 +1,137 @@
+import os
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.quality import gate_reasons, score_faces
+
+
+TEMPLATE_MODES = ("all", "centroid")
+MAX_TEMPLATES = 5
+# Templates closer than this to one already kept add nothing (e.g. adjacent clip frames).
+DUPLICATE_COSINE = 0.95
+CLIP_FRAMES = 24
+
+
+def template_mode() -> str:
+    """``all`` keeps every template in the gallery, ``centroid`` one vector per student."""
+    mode = os.getenv("ENROLL_TEMPLATES", "all").lower()
+    return mode if mode in TEMPLATE_MODES else "all"
+
+
+def centroid(embeddings, weights=None) -> np.ndarray:
+    """Quality-weighted mean of the L2-normalized templates, renormalized."""
+    emb = np.asarray(embeddings, dtype=np.float32)
+    emb = emb / np.linalg.norm(emb, axis=1, keepdims=True)
+    w = np.ones(len(emb), dtype=np.float32) if weights is None else np.asarray(weights, dtype=np.float32)
+    mean = (emb * np.maximum(w, 1e-3)[:, None]).sum(axis=0)
+    return (mean / np.linalg.norm(mean)).astype(np.float32)
+
+
+def clip_frames(data: bytes, suffix: str = ".mp4", max_frames: int = CLIP_FRAMES) -> List[np.ndarray]:
+    """Evenly spaced BGR frames from an encoded video clip."""
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        f.write(data)
+        path = f.name
+    try:
+        cap = cv2.VideoCapture(path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or max_frames
+        wanted = set(np.linspace(0, total - 1, num=min(total, max_frames)).astype(int).tolist())
+        frames, index = [], 0
+        while len(frames) < len(wanted):
+            ok = cap.grab()
+            if not ok:
+                break
+            if index in wanted:
+                ok, frame = cap.retrieve()
+                if ok:
+                    frames.append(frame)
+            index += 1
+        cap.release()
+        return frames
+    finally:
+        os.unlink(path)
+
+
+def extract_templates(
+    images: List[np.ndarray],
+    detector,
+    embedder,
+    single_face: Optional[List[bool]] = None,
+    max_templates: int = MAX_TEMPLATES,
+    floors: Optional[Dict] = None,
+) -> Tuple[List[Dict], List[Tuple[int, str]]]:
+    """Embed the enrolled face of every image and keep the best distinct ones.
+
+    ``single_face[i]`` rejects image ``i`` when it holds several faces (a
+    photo); otherwise its largest face is used (a clip frame). Returns the
+    kept templates, best quality first, and ``(image index, reason)`` for
+    every image that was dropped.
+    """
+    single_face = single_face or [True] * len(images)
+    rejected, kept_images, kept_landmarks, qualities, sources = [], [], [], [], []
+    for i, image in enumerate(images):
+        boxes, _, landmarks = detector.detect_faces(image)
+        if len(boxes) == 0:
+            rejected.append((i, "no face detected"))
+            continue
+        if len(boxes) > 1 and single_face[i]:
+            rejected.append((i, f"{len(boxes)} faces detected"))
+            continue
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        landmarks = np.asarray(landmarks, dtype=np.float32).reshape(-1, 5, 2)
+        j = int(np.argmax((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])))
+        scores = score_faces(image, boxes[[j]], landmarks[[j]])
+        reasons = gate_reasons(scores, floors)[0]
+        if reasons:
+            rejected.append((i, f"photo quality: {', '.join(reasons)}"))
+            continue
+        kept_images.append(image)
+        kept_landmarks.append(landmarks[j])
+        qualities.append(float(scores["quality"][0]))
+        sources.append(i)
+    if not kept_images:
+        return [], rejected
+
+    # Every accepted face goes through ArcFace in one batch.
+    embeddings = np.asarray(
+        embedder.get_embeddings_many(kept_images, np.stack(kept_landmarks)), dtype=np.float32
+    )
+    normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    templates: List[Dict] = []
+    for k in np.argsort(qualities)[::-1]:
+        if len(templates) >= max_templates:
+            rejected.append((sources[k], "enough templates already"))
+            continue
+        if any(float(normed[k] @ t["normed"]) > DUPLICATE_COSINE for t in templates):
+            rejected.append((sources[k], "near-duplicate of a kept template"))
+            continue
+        templates.append({
+            "embedding": embeddings[k],
+            "normed": normed[k],
+            "quality": qualities[k],
+            "source": sources[k],
+        })
+    for t in templates:
+        t.pop("normed")
+    return templates, rejected
+
+
+def load_gallery(db, organization_id: str, dim: int, model: str, mode: Optional[str] = None) -> List[Tuple]:
+    """``(student uuid, name, embedding)`` rows for the matcher.
+
+    In ``all`` mode students with stored templates contribute one row per
+    template; everyone else (and every student in ``centroid`` mode)
+    contributes their single ``face_embedding``.
+    """
+    rows = db.get_student_embeddings(organization_id, dim=dim, model=model)
+    if (mode or template_mode()) != "all":
+        return rows
+    templates = db.get_student_templates(organization_id, dim=dim, model=model)
+    gallery = []
+    for student_id, name, emb in rows:
+        for template in templates.get(student_id) or [emb]:
+            gallery.append((student_id, name, template))
+    return gallery
@@ -0,0 +1,53 @@
+"""Tiling and box merging for detection on native-resolution photos.
+
+Kept free of model imports so ``core.detector`` and its tests share them.
+"""
+import numpy as np
+
+
+DET_SIZE = 640
+
+
+def choose_tiling(height, width, det_size=DET_SIZE):
+    """Pick ``(tile, overlap)`` in pixels for a native-resolution tiled pass.
+
+    Tiles are multiples of 32 (the detector's largest stride). The overlap
+    must exceed the largest face that only the tiles can find; bigger faces
+    are caught by the downscaled whole-image pass.
+    """
+    long_side = max(height, width)
+    tile = det_size if long_side <= 4000 else int(det_size * 1.5) // 32 * 32
+    overlap = max(64, int(tile * 0.2) // 32 * 32)
+    return tile, overlap
+
+
+def tile_origins(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+
+def nms(boxes, scores, iou_threshold=0.4):
+    """Greedy non-maximum suppression. Returns kept indices by descending score."""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        # Intersection over the smaller box also removes the clipped half-face
+        # a tile sees next to the full face found by its neighbour.
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-6)
+        iom = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        order = rest[(iou <= iou_threshold) & (iom <= 0.8)]
+    return np.array(keep, dtype=np.int64)
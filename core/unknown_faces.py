@@ -0,0 +1,136 @@
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+# Looser than recognition: one stranger's sightings across a lecture vary
+# more than an enrollment photo and a live face of the same student.
+CLUSTER_THRESHOLD = 0.45
+
+
+def cluster_threshold() -> float:
+    return float(os.getenv("UNKNOWN_CLUSTER_THRESHOLD", str(CLUSTER_THRESHOLD)))
+
+
+class UnknownFaceIndex:
+    """Online nearest-centroid clustering of unrecognised face embeddings.
+
+    Every unknown face is compared against all running cluster centroids in a
+    single matrix-vector product. If the best cosine similarity clears
+    ``threshold`` the face joins that cluster, otherwise it starts a new one.
+    Cluster ids are assigned once and never reused, so the same stranger keeps
+    the same id for the lifetime of the session.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, max_clusters: int = 256):
+        self.threshold = cluster_threshold() if threshold is None else threshold
+        self.max_clusters = max_clusters
+        self.dim: Optional[int] = None
+        self._sums: Optional[np.ndarray] = None       # (capacity, dim) running sums
+        self._centroids: Optional[np.ndarray] = None  # (capacity, dim) unit vectors
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._ids = []
+        self._slots: Dict[str, int] = {}  # cluster id → row in the arrays above
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def assign(self, embedding) -> Tuple[str, int]:
+        vec = self._normalize(embedding)
+        size = len(self._ids)
+        self._ensure_capacity(vec.shape[0], min(size + 1, self.max_clusters))
+
+        if size:
+            sims = self._centroids[:size] @ vec
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                self._sums[best] += vec
+                self._centroids[best] = self._sums[best] / np.linalg.norm(self._sums[best])
+                self._counts[best] += 1
+                return self._ids[best], int(self._counts[best])
+
+        slot = size
+        if size >= self.max_clusters:
+            # Recycle the smallest cluster; one-off sightings are the least useful.
+            slot = int(np.argmin(self._counts[:size]))
+            del self._slots[self._ids[slot]]
+            self._ids[slot] = self._new_id()
+        else:
+            self._ids.append(self._new_id())
+        self._slots[self._ids[slot]] = slot
+        self._sums[slot] = vec
+        self._centroids[slot] = vec
+        self._counts[slot] = 1
+        return self._ids[slot], 1
+
+    def count(self, cluster_id: str) -> int:
+        slot = self._slots.get(cluster_id)
+        return 0 if slot is None else int(self._counts[slot])
+
+    def clusters(self) -> Dict[str, int]:
+        return {cid: int(c) for cid, c in zip(self._ids, self._counts)}
+
+    # ── persistence ─────────────────────────────────────────────────────────
+
+    def to_dict(self) -> Dict:
+        size = len(self._ids)
+        return {
+            "threshold": self.threshold,
+            "max_clusters": self.max_clusters,
+            "next_id": self._next_id,
+            "ids": list(self._ids),
+            "counts": self._counts[:size].tolist(),
+            "sums": self._sums[:size].tolist() if size else [],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "UnknownFaceIndex":
+        index = cls(
+            threshold=float(data["threshold"]) if "threshold" in data else None,
+            max_clusters=int(data.get("max_clusters", 256)),
+        )
+        sums = np.asarray(data.get("sums", []), dtype=np.float32)
+        if sums.ndim == 2 and sums.shape[0]:
+            size = min(sums.shape[0], index.max_clusters)
+            sums = sums[:size]
+            index._ensure_capacity(sums.shape[1], size)
+            index._sums[:size] = sums
+            index._centroids[:size] = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+            index._counts[:size] = np.asarray(data.get("counts", [1] * size), dtype=np.int64)
+            index._ids = list(data.get("ids", []))[:size]
+            index._slots = {cid: slot for slot, cid in enumerate(index._ids)}
+        index._next_id = int(data.get("next_id", len(index._ids)))
+        return index
+
+    # ── private helpers ─────────────────────────────────────────────────────
+
+    def _normalize(self, embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _ensure_capacity(self, dim: int, needed: int) -> None:
+        if self.dim is None:
+            self.dim = dim
+            self._sums = np.zeros((0, dim), dtype=np.float32)
+            self._centroids = np.zeros((0, dim), dtype=np.float32)
+        elif dim != self.dim:
+            raise ValueError(f"Embedding dim {dim} does not match index dim {self.dim}")
+
+        capacity = self._sums.shape[0]
+        if needed <= capacity:
+            return
+        # Grow geometrically so appends stay amortised O(1).
+        new_capacity = min(self.max_clusters, max(needed, 16, capacity * 2))
+        for name in ("_sums", "_centroids", "_counts"):
+            old = getattr(self, name)
+            grown = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:capacity] = old[:capacity]
+            setattr(self, name, grown)
+
+    def _new_id(self) -> str:
+        cid = f"unk-{self._next_id}"
+        self._next_id += 1
+        return cid
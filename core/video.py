@@ -0,0 +1,436 @@
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from core.pipeline import (
+    _result_sort_key,
+    annotate_image,
+    decide_candidates,
+    persist_decisions,
+)
+from core.quality import gate_reasons, score_faces
+from core.stage_engine import Stage, StageEngine
+
+
+# ── frame sources ────────────────────────────────────────────────────────────
+
+def open_capture(source: Union[str, int]) -> cv2.VideoCapture:
+    """Open a video file, RTSP/HTTP URL or local camera index."""
+    if isinstance(source, str) and source.strip().isdigit():
+        source = int(source.strip())
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video source: {source}")
+    return capture
+
+
+def sample_frames(
+    source: Union[str, int],
+    every_n: int = 5,
+    max_seconds: Optional[float] = None,
+) -> Iterator[Tuple[int, float, np.ndarray]]:
+    """Yield ``(frame_index, timestamp, frame_bgr)`` for every ``every_n``-th frame.
+
+    Skipped frames are only grabbed, not decoded, so sampling is cheap even
+    for high frame-rate streams.
+    """
+    capture = open_capture(source)
+    started = time.monotonic()
+    index = 0
+    try:
+        while True:
+            if max_seconds is not None and time.monotonic() - started > max_seconds:
+                break
+            if index % every_n:
+                if not capture.grab():
+                    break
+                index += 1
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield index, time.time(), frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def is_file_source(source: Union[str, int]) -> bool:
+    """Only files have a frame count; cameras and RTSP/HTTP streams do not."""
+    return isinstance(source, str) and os.path.isfile(source)
+
+
+def frame_count(source: Union[str, int]) -> int:
+    capture = open_capture(source)
+    try:
+        return int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    finally:
+        capture.release()
+
+
+# ── tracking ─────────────────────────────────────────────────────────────────
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+class FaceTrack:
+    """One tracked face with an alpha-beta (steady-state Kalman) motion model."""
+
+    ALPHA = 0.6
+    BETA = 0.2
+
+    def __init__(self, track_id: int, box: np.ndarray, landmark: np.ndarray):
+        self.id = track_id
+        self.state = self._to_state(box)      # cx, cy, w, h
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.landmark = landmark
+        self.hits = 1
+        self.misses = 0
+        self.best_quality = -1.0
+        self.pending_quality = 0.0
+        self.embedding: Optional[np.ndarray] = None
+        self.student_id: Optional[str] = None
+        self.score: Optional[float] = None
+        self.topk: List = []
+        self.emitted = False
+
+    @property
+    def box(self) -> np.ndarray:
+        cx, cy, w, h = self.state
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dtype=np.float32)
+
+    def predict(self) -> np.ndarray:
+        self.state = self.state + self.velocity
+        return self.box
+
+    def update(self, box: np.ndarray, landmark: np.ndarray) -> None:
+        residual = self._to_state(box) - self.state
+        self.state = self.state + self.ALPHA * residual
+        self.velocity = self.velocity + self.BETA * residual
+        self.landmark = landmark
+        self.hits += 1
+        self.misses = 0
+
+    @staticmethod
+    def _to_state(box: np.ndarray) -> np.ndarray:
+        x1, y1, x2, y2 = box[:4]
+        return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float32)
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks: List[FaceTrack] = []
+        self._next_id = 0
+
+    def update(self, boxes: np.ndarray, landmarks: np.ndarray) -> Tuple[List[FaceTrack], List[FaceTrack], List[FaceTrack]]:
+        """Advance one frame. Returns ``(matched, created, lost)`` tracks."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        predicted = np.array([t.predict() for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        ious = iou_matrix(predicted, boxes)
+
+        matched, used_tracks, used_dets = [], set(), set()
+        # Greedy assignment on descending IoU is plenty for classroom motion.
+        for flat in np.argsort(-ious, axis=None):
+            ti, di = np.unravel_index(flat, ious.shape)
+            if ious[ti, di] < self.iou_threshold:
+                break
+            if ti in used_tracks or di in used_dets:
+                continue
+            self.tracks[ti].update(boxes[di], landmarks[di])
+            matched.append(self.tracks[ti])
+            used_tracks.add(ti)
+            used_dets.add(di)
+
+        created = []
+        for di in range(len(boxes)):
+            if di not in used_dets:
+                track = FaceTrack(self._next_id, boxes[di], landmarks[di])
+                self._next_id += 1
+                self.tracks.append(track)
+                created.append(track)
+
+        lost, alive = [], []
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_tracks and track not in created:
+                track.misses += 1
+            (lost if track.misses > self.max_misses else alive).append(track)
+        self.tracks = alive
+        return matched, created, lost
+
+
+# ── streaming recognition ────────────────────────────────────────────────────
+
+class StreamRecognizer:
+    """Detect, track and identify faces across sampled video frames.
+
+    A track is embedded when it first appears and again only when its face
+    quality improves by ``requality_margin``; every other frame costs one
+    detection pass. Each student is emitted at most once per stream, and
+    tracks that never match are emitted as unknown when they are lost.
+    """
+
+    def __init__(
+        self,
+        detector,
+        embedder,
+        matcher,
+        threshold: float = 0.5,
+        min_hits: int = 2,
+        requality_margin: float = 0.1,
+        top_k: int = 5,
+        quality_floors: Optional[Dict] = None,
+    ):
+        self.detector = detector
+        self.embedder = embedder
+        self.matcher = matcher
+        self.threshold = threshold
+        self.min_hits = min_hits
+        self.requality_margin = requality_margin
+        self.top_k = top_k
+        self.tracker = FaceTracker()
+        self.seen_students: set = set()
+        self.quality_floors = quality_floors
+        self.stats = {"frames": 0, "detections": 0, "embeddings": 0, "tracks": 0, "gated": 0}
+
+    def process(self, frame_bgr: np.ndarray) -> List[Dict]:
+        boxes, _, landmarks = self.detector.detect_faces(frame_bgr)
+        pending, lost = self.observe(frame_bgr, boxes, landmarks)
+        if pending:
+            embeddings = self.embedder.get_embeddings(frame_bgr, [t.landmark for t in pending])
+            self.assign_embeddings(pending, embeddings)
+        return self.emit(lost)
+
+    def observe(self, frame_bgr: np.ndarray, boxes, landmarks) -> Tuple[List[FaceTrack], List[FaceTrack]]:
+        """Feed one frame's detections to the tracker.
+
+        Returns the tracks that need a (re-)embedding and the tracks lost on
+        this frame. Splitting this from ``process`` lets a caller batch the
+        embedding step across several streams.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        landmarks = np.asarray(landmarks, dtype=np.float32).reshape(-1, 5, 2)
+        matched, created, lost = self.tracker.update(boxes, landmarks)
+        self.stats["frames"] += 1
+        self.stats["detections"] += len(boxes)
+        self.stats["tracks"] += len(created)
+
+        pending = []
+        tracks = created + matched
+        if not tracks:
+            return pending, lost
+        scores = score_faces(
+            frame_bgr,
+            np.array([t.box for t in tracks], dtype=np.float32),
+            np.array([t.landmark for t in tracks], dtype=np.float32),
+        )
+        reasons = gate_reasons(scores, self.quality_floors)
+        for track, quality, failed in zip(tracks, scores["quality"], reasons):
+            # Faces below the quality floors are tracked but never embedded.
+            if failed:
+                self.stats["gated"] += 1
+                continue
+            if track.embedding is not None and quality < track.best_quality + self.requality_margin:
+                continue
+            track.pending_quality = float(quality)
+            pending.append(track)
+        return pending, lost
+
+    def assign_embeddings(self, tracks: List[FaceTrack], embeddings) -> None:
+        if not tracks:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(tracks), -1)
+        ids, scores = self.matcher.search(embeddings, k=self.top_k)
+        for track, emb, row_ids, row_scores in zip(tracks, embeddings, ids, scores):
+            self.stats["embeddings"] += 1
+            track.best_quality = track.pending_quality
+            track.embedding = emb
+            track.topk = [
+                (sid, float(sc)) for sid, sc in zip(row_ids, row_scores) if sid is not None
+            ]
+            track.student_id, track.score = track.topk[0] if track.topk else (None, None)
+
+    def emit(self, lost: List[FaceTrack]) -> List[Dict]:
+        events = []
+        for track in self.tracker.tracks:
+            if track.score is not None and track.score > self.threshold:
+                self._emit(track, events)
+        for track in lost:
+            self._emit(track, events)
+        return events
+
+    def flush(self) -> List[Dict]:
+        """Emit remaining unidentified tracks at the end of the stream."""
+        events = []
+        for track in self.tracker.tracks:
+            self._emit(track, events)
+        return events
+
+    def _emit(self, track: FaceTrack, events: List[Dict]) -> None:
+        if track.emitted or track.hits < self.min_hits or track.embedding is None:
+            return
+        track.emitted = True
+        if track.score is not None and track.score > self.threshold:
+            if track.student_id in self.seen_students:
+                return
+            self.seen_students.add(track.student_id)
+        events.append(self._candidate(track))
+
+    def _candidate(self, track: FaceTrack) -> Dict:
+        box = [int(v) for v in track.box]
+        return {
+            "box": box,
+            "student_id": track.student_id,
+            "score": track.score,
+            "quality": float(max(track.best_quality, 0.0)),
+            "embedding": track.embedding,
+            "topk": track.topk,
+            "photo_index": 0,
+            "sightings": [{"photo_index": 0, "box": box}],
+            "track_id": track.id,
+            "track_hits": track.hits,
+        }
+
+
+def run_stream(
+    job,
+    source: Union[str, int],
+    *,
+    detector,
+    embedder,
+    matcher,
+    agent,
+    db,
+    session_id: Optional[str],
+    marked_by: str,
+    organization_id: str,
+    student_lookup: Dict,
+    threshold: float,
+    class_start_time,
+    enable_agent: bool = True,
+    every_n: int = 5,
+    max_seconds: Optional[float] = None,
+    detect_workers: int = 2,
+    ledger=None,
+) -> Dict:
+    """Background job body for live video / camera attendance."""
+    book = ledger.lecture(job.lecture_id, db) if ledger is not None else None
+    job.start_stage("stream", f"Opening {source}…")
+    # Opening a stream twice just to learn it has no frame count is slow.
+    total_frames = frame_count(source) if is_file_source(source) else 0
+    recognizer = StreamRecognizer(detector, embedder, matcher, threshold=threshold)
+    face_decisions: List[Dict] = []
+    counts = {"recognized": 0, "flagged": 0, "unknown": 0, "written": 0}
+    last_frame = None
+    started = time.monotonic()
+
+    def _decide(events):
+        outcome = decide_candidates(
+            events,
+            threshold=threshold,
+            class_start_time=class_start_time,
+            agent=agent,
+            db=db,
+            organization_id=organization_id,
+            student_lookup=student_lookup,
+            session_id=session_id,
+            enable_agent=enable_agent,
+            mode="video_stream",
+            ledger=book,
+        )
+        counts["written"] += persist_decisions(
+            db, outcome["face_decisions"], lecture_id=job.lecture_id, marked_by=marked_by,
+            ledger=book,
+        )
+        for key in ("recognized", "flagged", "unknown"):
+            counts[key] += outcome[key]
+        face_decisions.extend(outcome["face_decisions"])
+
+    # Detection of frame N+1 overlaps tracking/embedding of frame N and the
+    # agent + database round-trips for earlier events.
+    def _detect(item):
+        index, _, frame = item
+        return index, frame, detector.detect_faces(frame)
+
+    def _track(item):
+        index, frame, (boxes, _, landmarks) = item
+        pending, lost = recognizer.observe(frame, boxes, landmarks)
+        if pending:
+            embeddings = embedder.get_embeddings(frame, [t.landmark for t in pending])
+            recognizer.assign_embeddings(pending, embeddings)
+        return index, frame, recognizer.emit(lost)
+
+    def _persist(item):
+        index, frame, events = item
+        if events:
+            _decide(events)
+        return index, frame
+
+    def _on_frame(_, result):
+        nonlocal last_frame
+        if isinstance(result, Exception):
+            raise result
+        index, last_frame = result
+        if total_frames:
+            fraction = index / total_frames
+        elif max_seconds:
+            fraction = (time.monotonic() - started) / max_seconds
+        else:
+            fraction = 0.0
+        job.report(
+            fraction,
+            f"{recognizer.stats['frames']} frames · {len(recognizer.seen_students)} students · "
+            f"{recognizer.stats['embeddings']} embeddings",
+        )
+
+    engine = StageEngine(
+        [
+            Stage("detect", _detect, workers=detect_workers),
+            Stage("track", _track, ordered=True),
+            Stage("persist", _persist),
+        ],
+        queue_size=max(2, detect_workers),
+    )
+    engine.run(
+        sample_frames(source, every_n=every_n, max_seconds=max_seconds),
+        on_result=_on_frame,
+        check=job.check,
+    )
+
+    remaining = recognizer.flush()
+    if remaining:
+        _decide(remaining)
+
+    face_decisions.sort(key=_result_sort_key)
+    return {
+        "photos": 1,
+        "faces": len(face_decisions),
+        "faces_detected": recognizer.stats["tracks"],
+        "face_decisions": face_decisions,
+        "present_ids": sorted(
+            fd["student_id"]
+            for fd in face_decisions
+            if fd.get("known")
+            and fd.get("action") == "MARK_PRESENT"
+            and fd.get("agent_decision") in {"PRESENT", "LATE"}
+        ),
+        "retake_required": False,
+        "stream_stats": dict(recognizer.stats),
+        "stage_stats": engine.stats(),
+        "annotated": [] if last_frame is None else [annotate_image(last_frame, [])],
+        **counts,
+    }
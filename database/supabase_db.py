@@ -8,6 +8,12 @@ from datetime import date, time
 from typing import List, Dict, Tuple
 
 
+# Embeddings enrolled before they were tagged came from buffalo_l.
+LEGACY_EMBEDDING_MODEL = "buffalo_l/w600k_r50"
+# PostgREST returns at most this many rows per request (its max-rows default).
+PAGE_SIZE = 1000
+
+
 class SupabaseDB:
     def __init__(self):
         self.url = os.getenv("SUPABASE_URL")
@@ -34,9 +40,8 @@ class SupabaseDB:
     def enroll_student(self, organization_id: str, student_id: str, name: str, 
                       embedding: np.ndarray, email: str = None, phone: str = None,
                       department: str = None, enrollment_year: int = None,
-                      photo_url: str = None) -> Dict:
-        embedding_bytes = embedding.astype(np.float32).tobytes()
-        embedding_b64 = base64.b64encode(embedding_bytes).decode('utf-8')
+                      photo_url: str = None, embedding_model: str = None) -> Dict:
+        embedding_b64 = self._encode_embedding(embedding)
         
         data = {
             "organization_id": organization_id,
@@ -47,6 +52,7 @@ class SupabaseDB:
             "department": department,
             "enrollment_year": enrollment_year,
             "face_embedding": embedding_b64,
+            "embedding_model": embedding_model,
             "photo_url": photo_url
         }
         
@@ -59,6 +65,52 @@ class SupabaseDB:
                 return None
             raise
 
+    def enroll_students(self, organization_id: str, students: List[Dict]) -> List[Dict]:
+        """Insert many students in one request; returns the inserted rows.
+
+        Each dict holds ``enroll_student``'s keyword arguments. If the batch
+        insert is rejected (e.g. one ID was taken meanwhile), rows are retried
+        one by one so only the conflicting ones are missing from the result.
+        """
+        records = [
+            {
+                "organization_id": organization_id,
+                "student_id": s["student_id"],
+                "name": s["name"],
+                "email": s.get("email"),
+                "phone": s.get("phone"),
+                "department": s.get("department"),
+                "enrollment_year": s.get("enrollment_year"),
+                "face_embedding": self._encode_embedding(s["embedding"]),
+                "embedding_model": s.get("embedding_model"),
+                "photo_url": s.get("photo_url"),
+            }
+            for s in students
+        ]
+        if not records:
+            return []
+        try:
+            result = self.client.table("students").insert(records).execute()
+            return result.data if result.data else []
+        except APIError:
+            inserted = []
+            for s in students:
+                row = self.enroll_student(organization_id, **s)
+                if row:
+                    inserted.append(row)
+            return inserted
+
+    def get_existing_student_ids(self, organization_id: str, student_ids: List[str]) -> set:
+        """Which of ``student_ids`` are already enrolled, in one query per 500 IDs."""
+        existing = set()
+        ids = sorted(set(student_ids))
+        for i in range(0, len(ids), 500):
+            result = self.client.table("students").select("student_id").eq(
+                "organization_id", organization_id
+            ).in_("student_id", ids[i:i + 500]).execute()
+            existing.update(row["student_id"] for row in result.data or [])
+        return existing
+
     def get_student_by_org_and_student_id(self, organization_id: str, student_id: str) -> Dict:
         result = self.client.table("students").select("*").eq(
             "organization_id", organization_id
@@ -76,29 +128,39 @@ class SupabaseDB:
         result = query.execute()
         return result.data if result.data else []
     
-    def get_student_embeddings(self, org_id: str) -> List[Tuple[str, str, np.ndarray]]:
+    @staticmethod
+    def _encode_embedding(embedding: np.ndarray) -> str:
+        return base64.b64encode(embedding.astype(np.float32).tobytes()).decode('utf-8')
+
+    @staticmethod
+    def _decode_embedding(embedding_data) -> np.ndarray:
+        if isinstance(embedding_data, bytes):
+            embedding_bytes = embedding_data
+        elif isinstance(embedding_data, str):
+            if embedding_data.startswith('\\x'):
+                hex_str = embedding_data[2:]
+                base64_bytes = bytes.fromhex(hex_str)
+                base64_str = base64_bytes.decode('utf-8')
+                embedding_bytes = base64.b64decode(base64_str)
+            else:
+                embedding_bytes = base64.b64decode(embedding_data)
+        else:
+            return None
+        return np.frombuffer(embedding_bytes, dtype=np.float32)
+
+    def get_student_embeddings(self, org_id: str, dim: int = 512,
+                               model: str = None) -> List[Tuple[str, str, np.ndarray]]:
         students = self.get_students_by_organization(org_id, active_only=True)
         embeddings = []
         
         for student in students:
-            embedding_data = student['face_embedding']
-            
+            # Embeddings from another model live in another space; skip them.
+            if model and (student.get('embedding_model') or LEGACY_EMBEDDING_MODEL) != model:
+                continue
             try:
-                if isinstance(embedding_data, bytes):
-                    embedding_bytes = embedding_data
-                elif isinstance(embedding_data, str):
-                    if embedding_data.startswith('\\x'):
-                        hex_str = embedding_data[2:]
-                        base64_bytes = bytes.fromhex(hex_str)
-                        base64_str = base64_bytes.decode('utf-8')
-                        embedding_bytes = base64.b64decode(base64_str)
-                    else:
-                        embedding_bytes = base64.b64decode(embedding_data)
-                else:
-                    continue
-                
-                emb = np.frombuffer(embedding_bytes, dtype=np.float32)
-                if emb.shape[0] != 512:
+                emb = self._decode_embedding(student['face_embedding'])
+                # Embeddings from a model pack with another size are skipped.
+                if emb is None or emb.shape[0] != dim:
                     continue
                 
                 embeddings.append((student['id'], student['name'], emb))
@@ -106,7 +168,95 @@ class SupabaseDB:
                 continue
         
         return embeddings
+
+    def _select_all(self, query) -> List[Dict]:
+        """Every row of ``query()``, fetched ``PAGE_SIZE`` rows at a time.
+
+        ``query`` builds a fresh, stably ordered select for each page, since
+        PostgREST silently truncates larger responses.
+        """
+        rows, start = [], 0
+        while True:
+            page = query().range(start, start + PAGE_SIZE - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            start += PAGE_SIZE
+
+    def add_student_templates(self, organization_id: str, student_uuid: str,
+                              templates: List[Dict], embedding_model: str = None) -> List[Dict]:
+        """Store extra enrollment templates (``embedding``, ``quality``, ``photo_url``) for a student."""
+        records = [
+            {
+                "organization_id": organization_id,
+                "student_id": student_uuid,
+                "embedding": self._encode_embedding(t["embedding"]),
+                "embedding_model": embedding_model,
+                "quality": t.get("quality"),
+                "photo_url": t.get("photo_url"),
+            }
+            for t in templates
+        ]
+        if not records:
+            return []
+        result = self.client.table("student_templates").insert(records).execute()
+        return result.data if result.data else []
+
+    def get_student_templates(self, org_id: str, dim: int = 512,
+                              model: str = None) -> Dict[str, List[np.ndarray]]:
+        """Templates per student uuid, filtered like ``get_student_embeddings``."""
+        rows = self._select_all(lambda: self.client.table("student_templates").select(
+            "student_id, embedding, embedding_model"
+        ).eq("organization_id", org_id).order("id"))
+        templates: Dict[str, List[np.ndarray]] = {}
+        for row in rows:
+            if model and (row.get('embedding_model') or LEGACY_EMBEDDING_MODEL) != model:
+                continue
+            try:
+                emb = self._decode_embedding(row['embedding'])
+            except Exception:
+                continue
+            if emb is None or emb.shape[0] != dim:
+                continue
+            templates.setdefault(row['student_id'], []).append(emb)
+        return templates
+
+    def get_template_rows(self, org_id: str) -> List[Dict]:
+        """Template metadata (no vectors) for re-embedding: photo, quality and models."""
+        return self._select_all(lambda: self.client.table("student_templates").select(
+            "id, student_id, photo_url, quality, embedding_model, staged_embedding_model"
+        ).eq("organization_id", org_id).order("id"))
+
+    def stage_template_embedding(self, template_id: str, embedding: np.ndarray, model: str) -> Dict:
+        result = self.client.table("student_templates").update({
+            "staged_embedding": self._encode_embedding(embedding),
+            "staged_embedding_model": model,
+        }).eq("id", template_id).execute()
+        return result.data[0] if result.data else None
+
+    def stage_student_embedding(self, student_uuid: str, embedding: np.ndarray, model: str) -> Dict:
+        """Write a re-embedded vector next to the live one; recognition keeps using the live one."""
+        result = self.client.table("students").update({
+            "staged_embedding": self._encode_embedding(embedding),
+            "staged_embedding_model": model,
+        }).eq("id", student_uuid).execute()
+        return result.data[0] if result.data else None
+
+    def swap_staged_embeddings(self, org_id: str, model: str) -> int:
+        """Promote every staged ``model`` embedding (and template) of the organization in one statement."""
+        result = self.client.rpc(
+            "swap_staged_embeddings", {"org_uuid": org_id, "model_id": model}
+        ).execute()
+        return int(result.data or 0)
     
+    def set_photo_urls(self, photo_urls: Dict[str, str]) -> int:
+        """Set ``photo_url`` for many students (uuid → url) in one statement."""
+        result = self.client.rpc(
+            "set_photo_urls",
+            {"updates": [{"id": uuid, "photo_url": url} for uuid, url in photo_urls.items()]},
+        ).execute()
+        return int(result.data or 0)
+
     def update_student(self, student_uuid: str, **kwargs) -> Dict:
         data = {k: v for k, v in kwargs.items() if v is not None}
         result = self.client.table("students").update(data).eq("id", student_uuid).execute()
@@ -114,7 +264,33 @@ class SupabaseDB:
     
     def deactivate_student(self, student_uuid: str) -> Dict:
         return self.update_student(student_uuid, is_active=False)
-    
+
+    def get_course_roster(self, org_id: str, course_code: str) -> set:
+        """Student uuids enrolled in ``course_code``."""
+        rows = self._select_all(lambda: self.client.table("course_enrollments").select("student_id").eq(
+            "organization_id", org_id
+        ).eq("course_code", course_code).order("id"))
+        return {row["student_id"] for row in rows}
+
+    def get_course_codes(self, org_id: str) -> List[str]:
+        rows = self._select_all(lambda: self.client.table("course_enrollments").select("course_code").eq(
+            "organization_id", org_id
+        ).order("id"))
+        return sorted({row["course_code"] for row in rows})
+
+    def set_course_roster(self, org_id: str, course_code: str, student_uuids: List[str]) -> int:
+        """Replace the roster of ``course_code``; returns the number of students on it."""
+        self.client.table("course_enrollments").delete().eq(
+            "organization_id", org_id
+        ).eq("course_code", course_code).execute()
+        ids = sorted(set(student_uuids))
+        for i in range(0, len(ids), 500):
+            self.client.table("course_enrollments").insert([
+                {"organization_id": org_id, "course_code": course_code, "student_id": sid}
+                for sid in ids[i:i + 500]
+            ]).execute()
+        return len(ids)
+
     def create_lecture(self, organization_id: str, created_by: str, title: str,
                       lecture_date: date, subject: str = None, course_code: str = None,
                       start_time: time = None, end_time: time = None, 
@@ -170,7 +346,9 @@ class SupabaseDB:
             "notes": notes
         }
         
-        result = self.client.table("attendance").upsert(data).execute()
+        result = self.client.table("attendance").upsert(
+            data, on_conflict="lecture_id,student_id"
+        ).execute()
         return result.data[0] if result.data else None
     
     def mark_bulk_attendance(self, lecture_id: str, marked_by: str,
@@ -186,7 +364,11 @@ class SupabaseDB:
                 "notes": data.get('notes')
             })
         
-        result = self.client.table("attendance").upsert(records).execute()
+        if not records:
+            return []
+        result = self.client.table("attendance").upsert(
+            records, on_conflict="lecture_id,student_id"
+        ).execute()
         return result.data if result.data else []
     
     def get_lecture_attendance(self, lecture_id: str) -> List[Dict]:
@@ -33,6 +33,9 @@ CREATE TABLE students (
     department TEXT,
     attendance_percentage FLOAT DEFAULT 0,
     face_embedding BYTEA NOT NULL,
+    embedding_model TEXT,
+    staged_embedding BYTEA,
+    staged_embedding_model TEXT,
     photo_url TEXT,
     is_active BOOLEAN DEFAULT true,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
@@ -256,3 +259,135 @@ BEGIN
     RETURN result;
 END;
 $$ LANGUAGE plpgsql;
+
+-- Promote staged re-embeddings (see core/reembed.py) in a single statement,
+-- so recognition never sees a gallery that mixes two models.
+CREATE OR REPLACE FUNCTION swap_staged_embeddings(org_uuid UUID, model_id TEXT)
+RETURNS INTEGER AS $$
+DECLARE
+    swapped INTEGER;
+BEGIN
+    UPDATE students
+    SET face_embedding = staged_embedding,
+        embedding_model = staged_embedding_model,
+        staged_embedding = NULL,
+        staged_embedding_model = NULL
+    WHERE organization_id = org_uuid
+    AND staged_embedding_model = model_id;
+    GET DIAGNOSTICS swapped = ROW_COUNT;
+    -- Templates the centroids were re-derived from move with them.
+    UPDATE student_templates
+    SET embedding = staged_embedding,
+        embedding_model = staged_embedding_model,
+        staged_embedding = NULL,
+        staged_embedding_model = NULL
+    WHERE organization_id = org_uuid
+    AND staged_embedding_model = model_id;
+    RETURN swapped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Photo URLs for a batch of just-enrolled students (see core/bulk_enroll.py)
+CREATE OR REPLACE FUNCTION set_photo_urls(updates JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    updated INTEGER;
+BEGIN
+    UPDATE students s
+    SET photo_url = u.photo_url
+    FROM jsonb_to_recordset(updates) AS u(id UUID, photo_url TEXT)
+    WHERE s.id = u.id;
+    GET DIAGNOSTICS updated = ROW_COUNT;
+    RETURN updated;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Migrations for databases created from an earlier version of this file
+ALTER TABLE students ADD COLUMN IF NOT EXISTS embedding_model TEXT;
+ALTER TABLE students ADD COLUMN IF NOT EXISTS staged_embedding BYTEA;
+ALTER TABLE students ADD COLUMN IF NOT EXISTS staged_embedding_model TEXT;
+
+-- Extra enrollment templates; students.face_embedding holds their centroid
+CREATE TABLE IF NOT EXISTS student_templates (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE,
+    student_id UUID REFERENCES students(id) ON DELETE CASCADE,
+    embedding BYTEA NOT NULL,
+    embedding_model TEXT,
+    quality FLOAT,
+    photo_url TEXT,
+    staged_embedding BYTEA,
+    staged_embedding_model TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_student_templates_org ON student_templates(organization_id);
+ALTER TABLE student_templates ADD COLUMN IF NOT EXISTS staged_embedding BYTEA;
+ALTER TABLE student_templates ADD COLUMN IF NOT EXISTS staged_embedding_model TEXT;
+ALTER TABLE student_templates ENABLE ROW LEVEL SECURITY;
+
+-- Templates follow their students: visible to the org, written by admins and
+-- instructors (enrollment inserts them, core/reembed.py stages new vectors).
+DROP POLICY IF EXISTS "Users can view own org templates" ON student_templates;
+CREATE POLICY "Users can view own org templates"
+    ON student_templates FOR SELECT
+    USING (organization_id IN (SELECT organization_id FROM users WHERE id = auth.uid()));
+
+DROP POLICY IF EXISTS "Admins and instructors can insert templates" ON student_templates;
+CREATE POLICY "Admins and instructors can insert templates"
+    ON student_templates FOR INSERT
+    WITH CHECK (
+        organization_id IN (
+            SELECT organization_id FROM users
+            WHERE id = auth.uid() AND role IN ('admin', 'instructor')
+        )
+    );
+
+DROP POLICY IF EXISTS "Admins and instructors can update templates" ON student_templates;
+CREATE POLICY "Admins and instructors can update templates"
+    ON student_templates FOR UPDATE
+    USING (
+        organization_id IN (
+            SELECT organization_id FROM users
+            WHERE id = auth.uid() AND role IN ('admin', 'instructor')
+        )
+    );
+
+-- Course rosters: which students attend which course (lectures.course_code).
+-- Recognition for a lecture searches its course roster first.
+CREATE TABLE IF NOT EXISTS course_enrollments (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE,
+    course_code TEXT NOT NULL,
+    student_id UUID REFERENCES students(id) ON DELETE CASCADE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE(organization_id, course_code, student_id)
+);
+CREATE INDEX IF NOT EXISTS idx_course_enrollments_course ON course_enrollments(organization_id, course_code);
+ALTER TABLE course_enrollments ENABLE ROW LEVEL SECURITY;
+
+-- Rosters are visible to the org; admins and instructors replace them
+-- (set_course_roster deletes and re-inserts).
+DROP POLICY IF EXISTS "Users can view own org rosters" ON course_enrollments;
+CREATE POLICY "Users can view own org rosters"
+    ON course_enrollments FOR SELECT
+    USING (organization_id IN (SELECT organization_id FROM users WHERE id = auth.uid()));
+
+DROP POLICY IF EXISTS "Admins and instructors can insert rosters" ON course_enrollments;
+CREATE POLICY "Admins and instructors can insert rosters"
+    ON course_enrollments FOR INSERT
+    WITH CHECK (
+        organization_id IN (
+            SELECT organization_id FROM users
+            WHERE id = auth.uid() AND role IN ('admin', 'instructor')
+        )
+    );
+
+DROP POLICY IF EXISTS "Admins and instructors can delete rosters" ON course_enrollments;
+CREATE POLICY "Admins and instructors can delete rosters"
+    ON course_enrollments FOR DELETE
+    USING (
+        organization_id IN (
+            SELECT organization_id FROM users
+            WHERE id = auth.uid() AND role IN ('admin', 'instructor')
+        )
+    );
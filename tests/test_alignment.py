@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from core.alignment import ARCFACE_DST, estimate_norm_batch
+
+
+def _similarity(scale, angle, tx, ty):
+    c, s = scale * np.cos(angle), scale * np.sin(angle)
+    return np.array([[c, -s, tx], [s, c, ty]])
+
+
+def _apply(M, pts):
+    return pts @ M[:, :2].T + M[:, 2]
+
+
+def _estimate_norm_lstsq(landmark, image_size=112):
+    """Per-face reference: least squares over (a, b, tx, ty) of a similarity."""
+    dst = ARCFACE_DST.astype(np.float64) * (image_size / 112.0)
+    x, y = landmark[:, 0], landmark[:, 1]
+    one, zero = np.ones(5), np.zeros(5)
+    A = np.concatenate([np.stack([x, -y, one, zero], 1), np.stack([y, x, zero, one], 1)])
+    a, b, tx, ty = np.linalg.lstsq(A, np.concatenate([dst[:, 0], dst[:, 1]]), rcond=None)[0]
+    return np.array([[a, -b, tx], [b, a, ty]])
+
+
+def _faces(n, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    faces = []
+    for _ in range(n):
+        M = _similarity(rng.uniform(0.5, 3.0), rng.uniform(-0.6, 0.6), *rng.uniform(0, 800, 2))
+        # Inverse of a crop→image similarity puts ARCFACE_DST somewhere in a photo.
+        inv = np.linalg.inv(np.vstack([M, [0, 0, 1]]))[:2]
+        faces.append(_apply(inv, ARCFACE_DST) + rng.normal(scale=noise, size=(5, 2)))
+    return np.array(faces)
+
+
+def test_exact_landmarks_map_onto_template():
+    faces = _faces(8, noise=0.0)
+    for M, face in zip(estimate_norm_batch(faces), faces):
+        np.testing.assert_allclose(_apply(M, face), ARCFACE_DST, atol=1e-4)
+
+
+@pytest.mark.parametrize("image_size", [112, 224])
+def test_batch_matches_per_face_least_squares(image_size):
+    faces = _faces(16, noise=2.0, seed=1)
+    batch = estimate_norm_batch(faces, image_size)
+    assert batch.shape == (16, 2, 3)
+    for M, face in zip(batch, faces):
+        np.testing.assert_allclose(M, _estimate_norm_lstsq(face, image_size), atol=1e-6)
+
+
+def test_batch_matches_insightface_estimate_norm():
+    face_align = pytest.importorskip("insightface.utils.face_align")
+    np.testing.assert_allclose(ARCFACE_DST, face_align.arcface_dst)
+    faces = _faces(8, noise=2.0, seed=2)
+    for M, face in zip(estimate_norm_batch(faces), faces):
+        np.testing.assert_allclose(M, face_align.estimate_norm(face), atol=1e-4)
@@ -0,0 +1,66 @@
+import io
+import zipfile
+
+from core.bulk_enroll import PhotoArchive, read_roster, validate_rows
+
+
+ROSTER = (
+    "\ufeffName, Student ID ,Photo,Enrollment Year,Email\n"
+    "Ada Lovelace,cs001,ada.jpg,2023,ada@example.org\n"
+    "Alan Turing,,,,\n"
+    "Grace Hopper,cs003,missing.png,soon,\n"
+    ",cs004,x.jpg,,\n"
+    "Dup,CS001,ada.jpg,,\n"
+    "Old,cs009,old.jpg,,,extra\n"
+)
+
+
+def _archive(*names):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name in names:
+            zf.writestr(name, b"jpeg")
+    return PhotoArchive(buf.getvalue())
+
+
+def test_read_roster_normalises_headers_and_values():
+    rows = read_roster(ROSTER)
+    assert [r["row"] for r in rows] == [2, 3, 4, 5, 6, 7]
+    ada = rows[0]
+    assert ada["student_id"] == "CS001"
+    assert ada["photo"] == "ada.jpg"
+    assert ada["enrollment_year"] == 2023
+    assert ada["email"] == "ada@example.org"
+    assert ada["phone"] is None
+    # Missing student_id falls back to the name.
+    assert rows[1]["student_id"] == "ALAN_TURING"
+    assert rows[2]["enrollment_year"] is None
+    assert rows[5]["parse_error"] == "1 more field(s) than the header"
+
+
+def test_archive_finds_by_name_or_student_id():
+    archive = _archive("roster/Ada.JPG", "roster/ALAN_TURING.png", "__MACOSX/._x.jpg", "notes.txt")
+    assert archive.find("ada.jpg", "CS001") == "roster/Ada.JPG"
+    assert archive.find("", "ALAN_TURING") == "roster/ALAN_TURING.png"
+    assert archive.find("notes.txt", "X") is None
+    assert archive.find("x.jpg", "X") is None
+    assert archive.read("roster/Ada.JPG") == b"jpeg"
+
+
+def test_validate_rows_flags_every_problem_before_enrolling():
+    rows = read_roster(ROSTER + "Known,cs010,ada.jpg,,\n")
+    archive = _archive("ada.jpg", "ALAN_TURING.jpg", "x.jpg", "old.jpg")
+    rows = validate_rows(rows, archive, existing_ids={"CS010"})
+    errors = {r["student_id"]: r["error"] for r in rows}
+    assert errors == {
+        "CS001": "duplicate student_id in roster",
+        "ALAN_TURING": None,
+        "CS003": "photo not found: missing.png",
+        "CS004": "missing name",
+        "CS009": "1 more field(s) than the header",
+        "CS010": "student_id already enrolled",
+    }
+    # The first CS001 row is valid; only the repeat fails.
+    assert rows[0]["status"] == "pending" and rows[0]["archive_name"] == "ada.jpg"
+    assert rows[4]["status"] == "failed"
+    assert {r["status"] for r in rows if r["error"]} == {"failed"}
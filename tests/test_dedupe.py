@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from core.dedupe import describe, duplicate_pairs
+
+
+def _gallery(seed=0):
+    rng = np.random.default_rng(seed)
+    people = rng.normal(size=(6, 32))
+    owners, embs = [], []
+    for p, base in enumerate(people):
+        for _ in range(3):
+            owners.append(f"u{p}")
+            embs.append(base + rng.normal(scale=0.3, size=32))
+    # u6 is u0 enrolled a second time under another id.
+    for _ in range(2):
+        owners.append("u6")
+        embs.append(people[0] + rng.normal(scale=0.3, size=32))
+    return owners, np.array(embs)
+
+
+def _brute_force(owners, embs, threshold):
+    emb = embs / np.linalg.norm(embs, axis=1, keepdims=True)
+    sims = emb @ emb.T
+    pairs = {}
+    for i in range(len(emb)):
+        for j in range(i + 1, len(emb)):
+            if owners[i] != owners[j] and sims[i, j] >= threshold:
+                key = tuple(sorted((owners[i], owners[j])))
+                entry = pairs.setdefault(key, {"score": -1.0, "hits": 0})
+                entry["score"] = max(entry["score"], float(sims[i, j]))
+                entry["hits"] += 1
+    return pairs
+
+
+@pytest.mark.parametrize("block", [1, 4, 7, 2048])
+def test_blocks_find_the_same_pairs_as_brute_force(block):
+    owners, embs = _gallery()
+    got = duplicate_pairs(owners, embs, threshold=0.6, block=block)
+    expected = _brute_force(owners, embs, 0.6)
+    assert {(p["a"], p["b"]): p["hits"] for p in got} == {k: v["hits"] for k, v in expected.items()}
+    for p in got:
+        assert p["score"] == pytest.approx(expected[(p["a"], p["b"])]["score"], abs=1e-5)
+
+
+def test_finds_re_enrolled_student_and_sorts_by_score():
+    owners, embs = _gallery()
+    pairs = duplicate_pairs(owners, embs, threshold=0.6, block=5)
+    assert (pairs[0]["a"], pairs[0]["b"]) == ("u0", "u6")
+    assert pairs[0]["hits"] == 6
+    assert [p["score"] for p in pairs] == sorted((p["score"] for p in pairs), reverse=True)
+
+
+def test_own_templates_never_pair():
+    emb = np.tile(np.eye(4)[0], (5, 1))
+    assert duplicate_pairs(["a"] * 5, emb, threshold=0.5, block=2) == []
+    assert duplicate_pairs(["a"], emb[:1], threshold=0.5) == []
+
+
+def test_describe_attaches_student_codes():
+    pairs = [{"a": "u0", "b": "u6", "score": 0.912345, "hits": 2}]
+    rows = describe(pairs, {"u0": {"student_id": "CS001", "name": "Ada"}})
+    assert rows == [{
+        "score": 0.9123,
+        "template_pairs": 2,
+        "student_a": "CS001",
+        "name_a": "Ada",
+        "student_b": "u6",
+        "name_b": None,
+        "uuid_a": "u0",
+        "uuid_b": "u6",
+    }]
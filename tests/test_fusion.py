@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from core.fusion import assign_identities, fuse_candidates
+
+THRESHOLD = 0.4
+
+
+def _cand(topk, quality=0.8, face=0):
+    topk = sorted(topk, key=lambda t: -t[1])
+    sid, score = topk[0] if topk else (None, None)
+    return {
+        "student_id": sid,
+        "score": score,
+        "topk": topk,
+        "quality": quality,
+        "sightings": [face],
+    }
+
+
+def _known(cands):
+    return [c["student_id"] for c in cands if c["score"] is not None and c["score"] > THRESHOLD]
+
+
+def test_unique_top1_is_left_alone():
+    cands = [_cand([("a", 0.9), ("b", 0.5)]), _cand([("b", 0.8), ("a", 0.3)])]
+    assert assign_identities(cands, THRESHOLD) is cands
+
+
+def test_shared_student_goes_to_one_face_other_takes_runner_up():
+    cands = [
+        _cand([("a", 0.90), ("b", 0.45)]),
+        _cand([("a", 0.70), ("c", 0.65)]),
+    ]
+    out = assign_identities(cands, THRESHOLD)
+    assert _known(out) == ["a", "c"]
+    assert "demoted_from" not in out[0]
+    assert out[1]["demoted_from"] == "a"
+    assert out[1]["score"] == pytest.approx(0.65)
+
+
+def test_assignment_maximises_total_over_greedy():
+    # Greedy would give "a" to face 0 (0.92) and leave face 1 unknown; the
+    # assignment gives face 0 its runner-up so both faces keep a student.
+    cands = [
+        _cand([("a", 0.92), ("b", 0.88)]),
+        _cand([("a", 0.90), ("z", 0.10)]),
+    ]
+    out = assign_identities(cands, THRESHOLD)
+    assert _known(out) == ["b", "a"]
+
+
+def test_face_without_free_candidate_becomes_unknown():
+    cands = [
+        _cand([("a", 0.90), ("b", 0.30)]),
+        _cand([("a", 0.60), ("c", 0.35)]),
+        _cand([("a", 0.55)]),
+    ]
+    out = assign_identities(cands, THRESHOLD)
+    assert _known(out) == ["a"]
+    assert out[1]["demoted_from"] == "a" and out[1]["score"] <= THRESHOLD
+    assert out[2]["demoted_from"] == "a" and out[2]["student_id"] is None
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_no_student_is_given_to_two_faces(seed):
+    rng = np.random.default_rng(seed)
+    students = [f"s{i}" for i in range(4)]
+    cands = []
+    for face in range(6):
+        scores = rng.uniform(0.0, 1.0, len(students))
+        cands.append(_cand(list(zip(students, scores.tolist())), face=face))
+    out = assign_identities(cands, THRESHOLD)
+    known = _known(out)
+    assert len(known) == len(set(known))
+    # Every face still above the threshold kept a student from its own top-k.
+    for before, after in zip(cands, out):
+        if after["score"] is not None and after["score"] > THRESHOLD:
+            assert (after["student_id"], after["score"]) in before["topk"]
+
+
+def test_unmatched_faces_pass_through():
+    cands = [_cand([("a", 0.2)]), _cand([]), _cand([("a", 0.9)])]
+    out = assign_identities(cands, THRESHOLD)
+    assert out == cands
+
+
+def _photos():
+    return [
+        [_cand([("a", 0.90)], quality=0.2, face=1), _cand([("b", 0.30)], face=2)],
+        [_cand([("a", 0.50)], quality=0.8, face=3)],
+    ]
+
+
+def test_max_fusion_keeps_best_score_and_merges_sightings():
+    fused = fuse_candidates(_photos(), THRESHOLD, mode="max")
+    by_id = {c["student_id"]: c for c in fused}
+    assert by_id["a"]["score"] == pytest.approx(0.90)
+    assert by_id["a"]["support"] == 2
+    assert sorted(by_id["a"]["sightings"]) == [1, 3]
+    assert by_id["a"]["quality"] == pytest.approx(0.8)
+    # Below-threshold faces are kept one per face, not merged.
+    assert by_id["b"]["score"] == pytest.approx(0.30)
+    assert "support" not in by_id["b"]
+
+
+def test_consensus_fusion_weights_scores_by_quality():
+    fused = fuse_candidates(_photos(), THRESHOLD, mode="consensus")
+    a = next(c for c in fused if c["student_id"] == "a")
+    assert a["score"] == pytest.approx((0.90 * 0.2 + 0.50 * 0.8) / 1.0)
+
+
+def test_fusion_applies_assignment_per_photo():
+    photo = [_cand([("a", 0.9)], face=1), _cand([("a", 0.8), ("b", 0.7)], face=2)]
+    fused = fuse_candidates([photo], THRESHOLD)
+    assert sorted(c["student_id"] for c in fused) == ["a", "b"]
+
+
+def test_unknown_fusion_mode_raises():
+    with pytest.raises(ValueError):
+        fuse_candidates([], THRESHOLD, mode="mean")
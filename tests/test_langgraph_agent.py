@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("dotenv")
+
+from core.langgraph_agent import LangGraphAttendanceAgent  # noqa: E402
+
+
+def _rule_path(agent, confidence, margin):
+    """compute_uncertainty followed by rule_decision, as the graph runs them without Groq."""
+    state = {
+        "student_name": "Jane Doe",
+        "confidence_score": confidence,
+        "normalized_history": {"total_classes": 10, "present": 9, "avg_attendance": 0.9},
+        "image_quality": 0.8,
+        "previous_errors": 0,
+        "time_offset_minutes": 2.0,
+        "low_conf_ratio": 0.0,
+        "is_unknown": False,
+        "score_margin": margin,
+        "attendance_records": [],
+    }
+    state.update(agent._node_compute_uncertainty(state))
+    state.update(agent._node_rule_decision(state))
+    return state
+
+
+@pytest.fixture
+def agent():
+    from core.session_store import SessionStore
+
+    return LangGraphAttendanceAgent(api_key="", session_store=SessionStore())
+
+
+def test_uncertainty_weights_sum_to_one(agent):
+    # Every risk at 1.0 except the two that exclude each other.
+    worst = {
+        "confidence_score": 0.0,
+        "normalized_history": {"total_classes": 10, "avg_attendance": 0.0},
+        "image_quality": 0.0,
+        "previous_errors": 5,
+        "time_offset_minutes": agent.LATE_WIN + 30,
+        "low_conf_ratio": 1.0,
+    }
+    known = agent._node_compute_uncertainty(dict(worst, is_unknown=False, score_margin=0.0))
+    unknown = agent._node_compute_uncertainty(dict(worst, is_unknown=True))
+    unknown_weight, ambiguity_weight = 1.0 - known["uncertainty_score"], 1.0 - unknown["uncertainty_score"]
+    assert unknown_weight == pytest.approx(0.09)
+    assert ambiguity_weight == pytest.approx(0.12)
+
+
+@pytest.mark.parametrize("margin", [None, 0.02, 0.10, 0.19, 0.40])
+def test_medium_confidence_rule_path_soft_flags(agent, margin):
+    state = _rule_path(agent, 0.72, margin)
+    assert state["decision"] == "PRESENT"
+    assert state["action"] == "SOFT_FLAG"
+    assert state["requires_review"] is True
+
+
+def test_close_runner_up_keeps_soft_flag_when_uncertain(agent):
+    state = _rule_path(agent, 0.66, 0.06)
+    state["uncertainty_score"] = 0.65
+    state.update(agent._node_rule_decision(state))
+    assert state["action"] == "SOFT_FLAG"
+
+
+def test_high_confidence_clear_margin_marks_present(agent):
+    state = _rule_path(agent, 0.90, 0.40)
+    assert state["action"] == "MARK_PRESENT"
+    assert state["requires_review"] is False
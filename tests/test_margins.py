@@ -0,0 +1,52 @@
+import pytest
+
+from core.margins import (
+    AMBIGUOUS_MARGIN,
+    CLEAR_MARGIN,
+    ambiguity_risk,
+    ambiguous,
+    close_runner_up,
+    score_margin,
+)
+
+
+def test_score_margin_is_lead_over_runner_up():
+    assert score_margin([("a", 0.81), ("b", 0.62), ("c", 0.40)]) == pytest.approx(0.19)
+
+
+@pytest.mark.parametrize("topk", [[], [("a", 0.9)]])
+def test_score_margin_without_runner_up_is_none(topk):
+    assert score_margin(topk) is None
+
+
+def test_thresholds_are_ordered():
+    assert 0.0 < AMBIGUOUS_MARGIN < CLEAR_MARGIN < 1.0
+
+
+@pytest.mark.parametrize(
+    "margin, close, tie",
+    [
+        (None, False, False),
+        (0.0, True, True),
+        (AMBIGUOUS_MARGIN - 0.01, True, True),
+        (AMBIGUOUS_MARGIN, True, False),
+        (CLEAR_MARGIN - 0.01, True, False),
+        (CLEAR_MARGIN, False, False),
+        (0.5, False, False),
+    ],
+)
+def test_close_and_ambiguous_bands(margin, close, tie):
+    assert close_runner_up(margin) is close
+    assert ambiguous(margin) is tie
+
+
+def test_ambiguity_risk_falls_with_margin():
+    risks = [ambiguity_risk(m) for m in (0.0, 0.05, 0.10, 0.19, CLEAR_MARGIN, 0.4)]
+    assert risks[0] == 1.0
+    assert all(a > b for a, b in zip(risks[:4], risks[1:5]))
+    assert risks[4] == risks[5] == 0.0
+
+
+def test_ambiguity_risk_ignores_missing_runner_up_and_unknown_faces():
+    assert ambiguity_risk(None) == 0.0
+    assert ambiguity_risk(0.0, is_unknown=True) == 0.0
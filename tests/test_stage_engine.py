@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+
+import pytest
+
+from core.stage_engine import Stage, StageEngine
+
+
+def _jitter(x):
+    time.sleep(random.uniform(0, 0.003))
+    return x
+
+
+def test_results_come_back_in_input_order():
+    engine = StageEngine([
+        Stage("a", lambda x: _jitter(x) * 2, workers=4),
+        Stage("b", lambda x: _jitter(x) + 1, workers=3),
+    ])
+    assert engine.run(range(50)) == [2 * i + 1 for i in range(50)]
+
+
+def test_ordered_stage_sees_items_in_input_order():
+    seen = []
+    engine = StageEngine([
+        Stage("shuffle", _jitter, workers=4),
+        Stage("track", lambda x: seen.append(x) or x, ordered=True),
+    ])
+    engine.run(range(40))
+    assert seen == list(range(40))
+
+
+def test_failing_item_is_returned_in_place():
+    def fn(x):
+        if x == 3:
+            raise RuntimeError("bad item")
+        return x
+
+    later = []
+    engine = StageEngine([Stage("a", fn, workers=2), Stage("b", lambda x: later.append(x) or x)])
+    results = engine.run(range(6))
+    assert isinstance(results[3], RuntimeError)
+    assert [r for i, r in enumerate(results) if i != 3] == [0, 1, 2, 4, 5]
+    assert 3 not in later
+    assert engine.stats()["a"]["errors"] == 1
+    assert engine.stats()["b"]["items"] == 5
+
+
+def test_on_result_gets_every_result():
+    got = {}
+    engine = StageEngine([Stage("a", _jitter, workers=3)])
+    engine.run(range(10), on_result=got.__setitem__)
+    assert got == {i: i for i in range(10)}
+
+
+def test_check_stops_feeding_and_reraises():
+    fed = []
+
+    def check():
+        if len(fed) >= 3:
+            raise KeyboardInterrupt
+        fed.append(1)
+
+    engine = StageEngine([Stage("a", lambda x: x)], queue_size=1)
+    with pytest.raises(KeyboardInterrupt):
+        engine.run(range(100), check=check)
+    assert len(fed) == 3
+
+
+def test_on_result_error_stops_the_run_and_threads_exit():
+    def on_result(index, value):
+        raise ValueError("stop")
+
+    before = threading.active_count()
+    engine = StageEngine([Stage("a", lambda x: x, workers=2)], queue_size=1)
+    with pytest.raises(ValueError):
+        engine.run(iter(range(1000)), on_result=on_result)
+    assert threading.active_count() == before
+
+
+def test_invalid_configuration_raises():
+    with pytest.raises(ValueError):
+        Stage("track", lambda x: x, workers=2, ordered=True)
+    with pytest.raises(ValueError):
+        StageEngine([])
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from core.tiling import choose_tiling, nms, tile_origins
+
+
+@pytest.mark.parametrize(
+    "length, tile, overlap",
+    [(640, 640, 128), (1000, 640, 128), (6000, 960, 192), (4033, 640, 128)],
+)
+def test_tiles_cover_the_image_with_overlap(length, tile, overlap):
+    origins = tile_origins(length, tile, overlap)
+    assert origins[0] == 0
+    assert origins[-1] + tile == length
+    assert origins == sorted(set(origins))
+    # Neighbours overlap by at least ``overlap`` so no face up to that size is cut in both.
+    assert all(b - a <= tile - overlap for a, b in zip(origins, origins[1:]))
+
+
+def test_image_smaller_than_tile_is_one_tile():
+    assert tile_origins(300, 640, 128) == [0]
+
+
+@pytest.mark.parametrize("h, w", [(3024, 4032), (6000, 8000), (9000, 12000)])
+def test_choose_tiling_keeps_stride_multiples(h, w):
+    tile, overlap = choose_tiling(h, w)
+    assert tile % 32 == 0 and overlap % 32 == 0
+    assert 64 <= overlap < tile
+
+
+def test_nms_keeps_best_of_overlapping_boxes():
+    boxes = np.array([
+        [0, 0, 100, 100],
+        [5, 5, 105, 105],
+        [200, 200, 300, 300],
+    ], dtype=np.float32)
+    scores = np.array([0.8, 0.9, 0.7], dtype=np.float32)
+    assert nms(boxes, scores).tolist() == [1, 2]
+
+
+def test_nms_drops_clipped_face_inside_full_face():
+    # A tile edge cuts the face in half: low IoU, but the half box lies inside the full one.
+    boxes = np.array([[0, 0, 100, 100], [0, 0, 30, 100]], dtype=np.float32)
+    scores = np.array([0.9, 0.95], dtype=np.float32)
+    assert nms(boxes, scores).tolist() == [1]
+    scores = np.array([0.95, 0.9], dtype=np.float32)
+    assert nms(boxes, scores).tolist() == [0]
+
+
+def test_nms_keeps_separate_faces_and_handles_empty():
+    boxes = np.array([[0, 0, 50, 50], [60, 0, 110, 50]], dtype=np.float32)
+    assert sorted(nms(boxes, np.array([0.5, 0.6])).tolist()) == [0, 1]
+    assert nms(np.zeros((0, 4)), np.zeros(0)).size == 0
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from core.unknown_faces import CLUSTER_THRESHOLD, UnknownFaceIndex, cluster_threshold
+
+
+def _unit(rng, dim=16):
+    v = rng.normal(size=dim)
+    return v / np.linalg.norm(v)
+
+
+def _near(rng, base, noise=0.05):
+    v = base + rng.normal(scale=noise, size=base.shape)
+    return v / np.linalg.norm(v)
+
+
+def test_same_stranger_keeps_one_cluster():
+    rng = np.random.default_rng(0)
+    alice, bob = _unit(rng), _unit(rng)
+    index = UnknownFaceIndex(threshold=0.45)
+    a_ids = {index.assign(_near(rng, alice))[0] for _ in range(5)}
+    b_ids = {index.assign(_near(rng, bob))[0] for _ in range(3)}
+    assert len(a_ids) == len(b_ids) == 1
+    assert a_ids != b_ids
+    assert index.clusters() == {a_ids.pop(): 5, b_ids.pop(): 3}
+
+
+def test_assign_returns_running_count():
+    index = UnknownFaceIndex(threshold=0.5)
+    v = np.ones(8)
+    assert index.assign(v) == ("unk-0", 1)
+    assert index.assign(v * 3) == ("unk-0", 2)
+    assert index.count("unk-0") == 2
+    assert index.count("unk-9") == 0
+
+
+def test_full_index_recycles_smallest_cluster_with_fresh_id():
+    index = UnknownFaceIndex(threshold=0.99, max_clusters=2)
+    e = np.eye(4)
+    index.assign(e[0])
+    index.assign(e[0])
+    index.assign(e[1])
+    cid, count = index.assign(e[2])
+    assert (cid, count) == ("unk-2", 1)
+    assert index.clusters() == {"unk-0": 2, "unk-2": 1}
+    assert index.count("unk-1") == 0
+
+
+def test_round_trip_keeps_ids_and_centroids():
+    rng = np.random.default_rng(1)
+    people = [_unit(rng) for _ in range(3)]
+    index = UnknownFaceIndex(threshold=0.45)
+    for p in people:
+        index.assign(_near(rng, p))
+    restored = UnknownFaceIndex.from_dict(index.to_dict())
+    assert restored.clusters() == index.clusters()
+    assert restored.assign(_near(rng, people[1]))[0] == "unk-1"
+    assert restored.assign(_unit(rng))[0] == "unk-3"
+
+
+def test_dimension_mismatch_raises():
+    index = UnknownFaceIndex()
+    index.assign(np.ones(8))
+    with pytest.raises(ValueError):
+        index.assign(np.ones(4))
+
+
+def test_threshold_from_env(monkeypatch):
+    monkeypatch.delenv("UNKNOWN_CLUSTER_THRESHOLD", raising=False)
+    assert cluster_threshold() == CLUSTER_THRESHOLD
+    monkeypatch.setenv("UNKNOWN_CLUSTER_THRESHOLD", "0.3")
+    assert UnknownFaceIndex().threshold == 0.3